@@ -0,0 +1,530 @@
+"""
+Archive - Streaming compressed tar output, split into volumes
+"""
+import io
+import os
+import bz2
+import gzip
+import json
+import lzma
+import tarfile
+from typing import List, Callable, Optional
+from datetime import datetime
+from integrity import check_algorithm, new_hasher, HashingReader
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Supported compressions and the suffix added after ".tar"
+COMPRESSIONS = {"none": "", "gz": ".gz", "bz2": ".bz2", "xz": ".xz", "zst": ".zst"}
+
+# Compression level used when none is given
+DEFAULT_LEVELS = {"gz": 6, "bz2": 9, "xz": 6, "zst": 3}
+
+# Every archive has an index file "<archive name>.json" next to its volumes
+ARCHIVE_INDEX_SUFFIX = ".json"
+
+BUFFER_SIZE = 1024 * 1024
+
+
+class VolumeWriter(io.RawIOBase):
+    def __init__(self, base_path: str, volume_size: Optional[int] = None):
+        """
+        Write a byte stream into one file or into numbered volumes
+
+        Args:
+            base_path: Path of the archive; volumes get suffixes .001, .002, ...
+            volume_size: Maximum size of one volume in bytes (None = single file)
+        """
+        super().__init__()
+        self.base_path = base_path
+        self.volume_size = volume_size
+        self.volumes = []
+        self.bytes_written = 0
+        self.current = None
+        self.current_size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def next_volume(self):
+        """Close current volume and start the next one"""
+        if self.current:
+            self.current.close()
+        if self.volume_size:
+            path = f"{self.base_path}.{len(self.volumes) + 1:03d}"
+        else:
+            path = self.base_path
+        self.current = open(path, "wb")
+        self.volumes.append(path)
+        self.current_size = 0
+
+    def write(self, b) -> int:
+        data = memoryview(b).cast("B")
+        written = 0
+        while written < len(data):
+            if self.current is None or (self.volume_size and self.current_size >= self.volume_size):
+                self.next_volume()
+            n = len(data) - written
+            if self.volume_size:
+                n = min(n, self.volume_size - self.current_size)
+            self.current.write(data[written:written + n])
+            self.current_size += n
+            written += n
+        self.bytes_written += written
+        return written
+
+    def close(self):
+        if self.current:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+class VolumeReader(io.RawIOBase):
+    def __init__(self, volumes: List[str]):
+        """
+        Read numbered volumes as one continuous byte stream
+
+        Args:
+            volumes: Volume paths in order
+        """
+        super().__init__()
+        self.volumes = list(volumes)
+        self.index = 0
+        self.current = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while self.index < len(self.volumes):
+            if self.current is None:
+                self.current = open(self.volumes[self.index], "rb")
+            n = self.current.readinto(b)
+            if n:
+                return n
+            self.current.close()
+            self.current = None
+            self.index += 1
+        return 0
+
+    def close(self):
+        if self.current:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+def check_compression(compression: str):
+    """Raise ValueError if compression is unknown or not available"""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "zst" and zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+
+
+def compress_stream(fileobj, compression: str, level: Optional[int] = None):
+    """Wrap a writable stream with a compressor"""
+    if level is None:
+        level = DEFAULT_LEVELS.get(compression)
+    if compression == "gz":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level)
+    if compression == "bz2":
+        return bz2.BZ2File(fileobj, "wb", compresslevel=level)
+    if compression == "xz":
+        return lzma.LZMAFile(fileobj, "wb", preset=level)
+    if compression == "zst":
+        return zstandard.ZstdCompressor(level=level).stream_writer(fileobj, closefd=False)
+    return fileobj
+
+
+def decompress_stream(fileobj, compression: str):
+    """Wrap a readable stream with a decompressor"""
+    if compression == "gz":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if compression == "bz2":
+        return bz2.BZ2File(fileobj, "rb")
+    if compression == "xz":
+        return lzma.LZMAFile(fileobj, "rb")
+    if compression == "zst":
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+    return fileobj
+
+
+class SizedReader(io.RawIOBase):
+    def __init__(self, fileobj, size: int):
+        """
+        Readable stream returning exactly size bytes of a file
+
+        Data missing because the file got shorter or a read failed is
+        replaced with zeros; missing and error tell what happened.
+
+        Args:
+            fileobj: Underlying file opened for binary reading
+            size: Number of bytes to return
+        """
+        super().__init__()
+        self.fileobj = fileobj
+        self.remaining = size
+        self.missing = 0
+        self.error = None
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = b""
+        # Once data is missing the rest of the entry is zeros
+        while len(data) < size and not self.missing:
+            try:
+                chunk = self.fileobj.read(size - len(data))
+            except OSError as e:
+                self.error = e
+                chunk = b""
+            if not chunk:
+                break
+            data += chunk
+        if len(data) < size:
+            self.missing += size - len(data)
+            data += bytes(size - len(data))
+        self.remaining -= size
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class ArchiveWriter:
+    def __init__(self, destination_dir: str, compression: str = "gz",
+                 level: Optional[int] = None, volume_size: Optional[int] = None,
+                 hash_algorithm: Optional[str] = None):
+        """
+        Start a new archive in destination directory
+
+        Args:
+            destination_dir: Directory where archive volumes are written
+            compression: One of COMPRESSIONS
+            level: Compression level (None = DEFAULT_LEVELS)
+            volume_size: Maximum size of one volume in bytes (None = single file)
+            hash_algorithm: Hash every file while it is archived and store the
+                hashes in the archive index (None = no hashes)
+        """
+        check_compression(compression)
+        if hash_algorithm is not None:
+            check_algorithm(hash_algorithm)
+        self.compression = compression
+        self.hash_algorithm = hash_algorithm
+        self.hashes = {}
+        self.damaged = []
+        self.failed = None
+        self.name = f"backup-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.tar{COMPRESSIONS[compression]}"
+        self.index_path = os.path.join(destination_dir, self.name + ARCHIVE_INDEX_SUFFIX)
+        self.files = 0
+        self.bytes = 0
+
+        self.volume_writer = VolumeWriter(os.path.join(destination_dir, self.name), volume_size)
+        self.buffer = io.BufferedWriter(self.volume_writer, BUFFER_SIZE)
+        self.stream = compress_stream(self.buffer, compression, level)
+        self.tar = tarfile.open(fileobj=self.stream, mode="w|")
+
+    def add(self, file_path: str, arcname: str):
+        """
+        Append a file to the archive
+
+        The file is opened before anything is written, so a file that cannot
+        be read does not leave a partial entry in the stream. The tar header
+        promises the size the file had when it was opened; if the file then
+        shrinks or a read fails, the entry is padded with zeros to that size,
+        so the entries after it stay readable, and it is listed as damaged in
+        the archive index. A failed write leaves the stream unusable and
+        fails every later add() and close().
+
+        Args:
+            file_path: Path to the file
+            arcname: Name of the file inside the archive
+
+        Raises:
+            OSError: If the file cannot be read completely or the archive
+                cannot be written
+        """
+        if self.failed is not None:
+            raise OSError(f"Archive is incomplete after an earlier write error: {self.failed}")
+        with open(file_path, "rb") as f:
+            tarinfo = self.tar.gettarinfo(arcname=arcname.replace(os.sep, "/"), fileobj=f)
+            reader = SizedReader(f, tarinfo.size)
+            hasher = new_hasher(self.hash_algorithm) if self.hash_algorithm is not None else None
+            try:
+                self.tar.addfile(tarinfo, reader if hasher is None else HashingReader(reader, hasher))
+            except OSError as e:
+                self.failed = e
+                raise
+        if reader.missing:
+            self.damaged.append(tarinfo.name)
+            reason = f": {reader.error}" if reader.error is not None else ""
+            raise OSError(f"{reader.missing} of {tarinfo.size} bytes could not be read, "
+                          f"entry is padded with zeros{reason}")
+        if hasher is not None:
+            self.hashes[tarinfo.name] = hasher.hexdigest()
+        self.files += 1
+        self.bytes += tarinfo.size
+
+    def close(self) -> dict:
+        """
+        Finish the archive and write its index
+
+        Returns:
+            Archive index with name, compression and volume list
+
+        Raises:
+            OSError: If an earlier write to the archive failed
+        """
+        if self.failed is not None:
+            raise OSError(f"Archive is incomplete after a write error: {self.failed}")
+        self.tar.close()
+        if self.stream is not self.buffer:
+            self.stream.close()
+        self.buffer.close()
+
+        info = {
+            "name": self.name,
+            "compression": self.compression,
+            "volumes": [os.path.basename(v) for v in self.volume_writer.volumes],
+            "files": self.files,
+            "bytes": self.bytes,
+            "bytes_written": self.volume_writer.bytes_written,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if self.hash_algorithm is not None:
+            info["hash_algorithm"] = self.hash_algorithm
+            info["hashes"] = self.hashes
+        if self.damaged:
+            info["damaged"] = self.damaged
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump(info, f, indent=2)
+        return info
+
+    def abort(self):
+        """Close the archive and delete volumes written so far"""
+        try:
+            self.buffer.close()
+        except Exception:
+            pass
+        for volume in self.volume_writer.volumes:
+            try:
+                os.remove(volume)
+            except OSError:
+                pass
+
+
+def list_archives(directory: str) -> List[str]:
+    """Return names of archives in directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    suffixes = tuple(f".tar{ext}{ARCHIVE_INDEX_SUFFIX}" for ext in COMPRESSIONS.values())
+    return sorted(name[:-len(ARCHIVE_INDEX_SUFFIX)] for name in os.listdir(directory)
+                  if name.startswith("backup-") and name.endswith(suffixes))
+
+
+def read_archive_index(directory: str, name: Optional[str] = None) -> dict:
+    """
+    Load the index of an archive
+
+    Args:
+        directory: Directory holding the archive volumes and index
+        name: Archive name (None = latest)
+
+    Raises:
+        ValueError: If there is no archive or its compression is not available
+    """
+    if name is None:
+        archives = list_archives(directory)
+        if not archives:
+            raise ValueError("No archives found")
+        name = archives[-1]
+    with open(os.path.join(directory, name + ARCHIVE_INDEX_SUFFIX), "r", encoding="utf-8") as f:
+        info = json.load(f)
+    check_compression(info["compression"])
+    info["name"] = name
+    return info
+
+
+def delete_archive(directory: str, name: str) -> int:
+    """
+    Delete the volumes and index of an archive
+
+    Returns:
+        Number of bytes freed
+    """
+    index_path = os.path.join(directory, name + ARCHIVE_INDEX_SUFFIX)
+    with open(index_path, "r", encoding="utf-8") as f:
+        info = json.load(f)
+    freed = 0
+    for volume in info["volumes"]:
+        path = os.path.join(directory, volume)
+        try:
+            freed += os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    os.remove(index_path)
+    return freed
+
+
+def verify_archive(directory: str, name: Optional[str] = None,
+                   progress_callback: Optional[Callable] = None) -> dict:
+    """
+    Re-read an archive and compare every file with the hash in its index
+
+    Args:
+        directory: Directory holding the archive volumes and index
+        name: Archive name (None = latest)
+        progress_callback: Function called with (current, total, filename)
+
+    Returns:
+        Dictionary with verification statistics
+    """
+    try:
+        info = read_archive_index(directory, name)
+    except Exception as e:
+        return {"success": False, "error": f"Cannot read archive index: {e}"}
+    algorithm = info.get("hash_algorithm")
+    if not algorithm:
+        return {"success": False, "error": "Archive was written without hashes"}
+    try:
+        check_algorithm(algorithm)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
+    expected = info.get("hashes", {})
+    seen = set()
+    verified = 0
+    mismatched = []
+    reader = io.BufferedReader(VolumeReader([os.path.join(directory, v) for v in info["volumes"]]), BUFFER_SIZE)
+    stream = decompress_stream(reader, info["compression"])
+    try:
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile() or member.name not in expected:
+                    continue
+                hasher = new_hasher(algorithm)
+                data = tar.extractfile(member)
+                for chunk in iter(lambda: data.read(BUFFER_SIZE), b""):
+                    hasher.update(chunk)
+                seen.add(member.name)
+                if hasher.hexdigest() == expected[member.name]:
+                    verified += 1
+                else:
+                    mismatched.append(member.name)
+                if progress_callback:
+                    progress_callback(len(seen), len(expected), os.path.basename(member.name))
+    except Exception as e:
+        return {"success": False, "error": f"Cannot read archive: {e}",
+                "verified": verified, "mismatched": mismatched}
+    finally:
+        if stream is not reader:
+            stream.close()
+        reader.close()
+
+    return {
+        "success": True,
+        "archive": info["name"],
+        "algorithm": algorithm,
+        "verified": verified,
+        "mismatched": mismatched,
+        "missing": sorted(set(expected) - seen),
+        "total": len(expected)
+    }
+
+
+def restore_archive(directory: str, destination_dir: str, name: Optional[str] = None,
+                    overwrite: bool = True, progress_callback: Optional[Callable] = None,
+                    skip_identical: bool = False, mtime_tolerance: int = 0) -> dict:
+    """
+    Extract an archive by streaming through its volumes
+
+    Args:
+        directory: Directory holding the archive volumes and index
+        destination_dir: Directory to restore into
+        name: Archive name (None = latest)
+        overwrite: Overwrite files that already exist
+        progress_callback: Function called with (current, total, filename)
+        skip_identical: Do not rewrite existing files with the same size and mtime
+        mtime_tolerance: Allowed mtime difference (ns) for skip_identical, for
+            destinations that round timestamps
+
+    Returns:
+        Dictionary with restore statistics
+    """
+    if name is None and not list_archives(directory):
+        return {"success": False, "error": "No archives found"}
+    try:
+        info = read_archive_index(directory, name)
+    except Exception as e:
+        return {"success": False, "error": f"Cannot read archive index: {e}"}
+    name = info["name"]
+
+    total = info.get("files", 0)
+    restored = 0
+    unchanged = 0
+    skipped = 0
+    errors = []
+    damaged = set(info.get("damaged", []))
+    extract_kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+
+    reader = io.BufferedReader(VolumeReader([os.path.join(directory, v) for v in info["volumes"]]), BUFFER_SIZE)
+    stream = decompress_stream(reader, info["compression"])
+    try:
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                if member.name in damaged:
+                    errors.append(f"{member.name}: file changed while it was archived, not restored")
+                    skipped += 1
+                    continue
+                dest_file = os.path.join(destination_dir, member.name)
+                try:
+                    dest_stat = os.stat(dest_file)
+                except OSError:
+                    dest_stat = None
+                if dest_stat is not None and not overwrite:
+                    skipped += 1
+                    continue
+                # Archives are written in PAX format, which keeps sub-second mtimes
+                # as floats; allow their rounding error on top of the tolerance
+                if (dest_stat is not None and skip_identical and dest_stat.st_size == member.size
+                        and abs(dest_stat.st_mtime - member.mtime) <= max(mtime_tolerance / 1e9, 1e-6)):
+                    unchanged += 1
+                    continue
+                try:
+                    tar.extract(member, destination_dir, **extract_kwargs)
+                    restored += 1
+                    if progress_callback:
+                        progress_callback(restored + unchanged + skipped, total, os.path.basename(member.name))
+                except Exception as e:
+                    errors.append(f"{member.name}: {e}")
+                    skipped += 1
+    except Exception as e:
+        return {"success": False, "error": f"Cannot read archive: {e}",
+                "restored": restored, "skipped": skipped}
+    finally:
+        if stream is not reader:
+            stream.close()
+        reader.close()
+
+    return {
+        "success": True,
+        "archive": name,
+        "restored": restored,
+        "unchanged": unchanged,
+        "skipped": skipped,
+        "total": total,
+        "errors": errors
+    }
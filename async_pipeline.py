@@ -0,0 +1,205 @@
+"""
+Async Pipeline - Keeps many file operations in flight for high-latency destinations
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Awaitable, Callable, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+# Stages whose calls touch the destination and get the injected latency
+DESTINATION_STAGES = ("mkdir", "copy", "metadata")
+
+
+class StageLimits(NamedTuple):
+    """Operations of each stage allowed in flight at once"""
+    scan: int = 4        # source directories listed (with stat of their files)
+    mkdir: int = 8       # destination directories created
+    copy: int = 16       # file contents written
+    metadata: int = 32   # stat of destination files, metadata copies and renames
+
+
+def parse_stage_limits(text: Optional[str]) -> StageLimits:
+    """
+    Parse stage limits like "copy=32, metadata=64"
+
+    Stages that are not listed keep their default limit.
+
+    Raises:
+        ValueError: If the text names an unknown stage or a limit below 1
+    """
+    limits = {}
+    for item in (text or "").replace(";", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        stage, _, value = item.partition("=")
+        stage = stage.strip()
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if stage not in StageLimits._fields or limit < 1:
+            raise ValueError(f"Invalid stage limit (expected {'|'.join(StageLimits._fields)}=N): {item}")
+        limits[stage] = limit
+    return StageLimits(**limits)
+
+
+class AsyncPipeline:
+    def __init__(self, limits: StageLimits = StageLimits(), latency: float = 0.0):
+        """
+        Event loop running blocking file operations on a bounded executor
+
+        Every operation belongs to a stage (see StageLimits) and waits for a
+        free slot of its stage, so a slow network share can have dozens of
+        stat, mkdir and copy calls outstanding while each stage stays
+        bounded. The loop runs in its own thread between start() and close();
+        the backup thread hands work to it with walk() and run().
+
+        Args:
+            limits: Concurrency limit of each stage
+            latency: Seconds added to every destination operation, to test
+                against a local directory as if it were a network share
+        """
+        self.limits = limits
+        self.latency = latency
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.writer = None
+        self.semaphores = {}
+        self.directories = {}
+
+    def start(self) -> bool:
+        """
+        Start the event loop thread and the executors
+
+        Returns:
+            True if the pipeline was started, False if it was already running
+        """
+        if self.loop is not None:
+            return False
+        self.executor = ThreadPoolExecutor(max_workers=sum(self.limits), thread_name_prefix="pipeline")
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-writer")
+        self.loop = asyncio.new_event_loop()
+        self.directories = {}
+        self.thread = threading.Thread(target=self.loop.run_forever, name="pipeline-loop", daemon=True)
+        self.thread.start()
+        self.semaphores = self.submit(self.make_semaphores()).result()
+        return True
+
+    async def make_semaphores(self) -> dict:
+        # Semaphores belong to the loop they are created on
+        return {stage: asyncio.Semaphore(limit) for stage, limit in self.limits._asdict().items()}
+
+    def close(self):
+        """Stop the event loop and wait for running operations"""
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.writer = None
+
+    def submit(self, coro: Awaitable):
+        """Schedule a coroutine on the loop from another thread; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def blocking(self, stage: str, func: Callable, args: tuple):
+        if self.latency and stage in DESTINATION_STAGES:
+            time.sleep(self.latency)
+        return func(*args)
+
+    async def call(self, stage: str, func: Callable, *args):
+        """Run func(*args) on the executor once the stage has a free slot"""
+        async with self.semaphores[stage]:
+            return await self.loop.run_in_executor(self.executor, self.blocking, stage, func, args)
+
+    async def write(self, func: Callable, *args):
+        """
+        Run func(*args) on the single writer thread
+
+        For bookkeeping that must stay off the loop thread (index, journal
+        and progress updates); calls run one at a time in the order they are
+        made, outside the stage limits and without injected latency.
+        """
+        return await self.loop.run_in_executor(self.writer, func, *args)
+
+    async def ensure_dir(self, path: str):
+        """
+        Create a destination directory (and its parents) once per run
+
+        Files of the same directory waiting at the same time share one
+        mkdir call; a failure is raised to every one of them.
+        """
+        task = self.directories.get(path)
+        if task is None:
+            task = self.loop.create_task(self.call("mkdir", os.makedirs, path, 0o777, True))
+            self.directories[path] = task
+        await task
+
+    def walk(self, list_directory: Callable[[str], Tuple[object, Iterable[str]]], root: str = "",
+             cancelled: Callable[[], bool] = lambda: False) -> Iterator:
+        """
+        List a tree with up to limits.scan directories in flight
+
+        Args:
+            list_directory: Blocking function returning (result, subdirectories)
+                for a directory; it is called on the executor
+            root: First directory passed to list_directory
+            cancelled: Function telling when to stop listing
+
+        Yields:
+            Results of list_directory, in the order the listings finish
+        """
+        pending = deque([root])
+        in_flight = set()
+        try:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.limits.scan and not cancelled():
+                    in_flight.add(self.submit(self.call("scan", list_directory, pending.popleft())))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result, subdirs = future.result()
+                    pending.extend(subdirs)
+                    yield result
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def run(self, items: Iterable, process: Callable[[object], Awaitable],
+            cancelled: Callable[[], bool] = lambda: False):
+        """
+        Await process(item) for every item on the loop
+
+        Items are taken from the iterable in the calling thread; enough of
+        them are kept in flight to fill every stage, and no more, so a long
+        iterable is consumed as fast as it is processed. Exceptions raised
+        by process are propagated.
+
+        Args:
+            items: Iterable of items to process
+            process: Coroutine function handling one item
+            cancelled: Function telling when to stop taking items
+        """
+        limit = sum(self.limits) * 2
+        in_flight = set()
+        for item in items:
+            if cancelled():
+                break
+            in_flight.add(self.submit(process(item)))
+            if len(in_flight) >= limit:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+        for future in in_flight:
+            future.result()
@@ -0,0 +1,408 @@
+"""
+Backup CLI - Headless entry point for one-off and scheduled backups
+
+Usage:
+    python backup_cli.py backup SOURCE DESTINATION [options]
+    python backup_cli.py restore BACKUP DESTINATION [options]
+    python backup_cli.py verify BACKUP [--snapshot NAME] [--workers N]
+    python backup_cli.py prune BACKUP --keep "daily=7, weekly=4, monthly=12"
+    python backup_cli.py run [--settings podesavanja.json] [--job NAME]
+    python backup_cli.py daemon [--settings podesavanja.json] [--max-jobs N]
+
+Every command accepts --run-log FILE and --metrics-file FILE before its name.
+"""
+import sys
+import signal
+import argparse
+import threading
+from datetime import datetime
+from backup_engine import BackupEngine
+from file_filter import FileFilter
+from scheduler import BackupScheduler
+from throttle import make_throttle
+from async_pipeline import AsyncPipeline, parse_stage_limits
+from integrity import HASH_ALGORITHMS
+from retention import parse_retention
+from telemetry import Telemetry, default_telemetry
+from settings import SETTINGS_FILE, ucitaj_podesavanja, poslovi_iz_podesavanja, PODRAZUMEVANI_POSAO
+
+# Longest single sleep of the daemon; guards against wall clock jumps
+# (suspend, DST, manual changes) while waiting for the next job
+MAX_SLEEP = 300.0
+
+
+def print_backup_result(result: dict):
+    """Print summary of a backup result"""
+    if not result["success"]:
+        print(f"Backup failed: {result.get('error', 'Unknown error')}")
+        return
+    print(f"Backup completed: {result['copied']} copied, {result['unchanged']} unchanged, "
+          f"{result['skipped']} skipped, {result['deleted']} deleted in source")
+    if result.get("resumed"):
+        print(f"  Resumed: {result['resumed']} files finished by the interrupted previous run")
+    print(f"  Written: {result['bytes_written'] / 1048576:.1f} MB "
+          f"of {result['bytes_total'] / 1048576:.1f} MB scanned")
+    if result.get("archive"):
+        print(f"  Archive: {result['archive']} ({len(result['volumes'])} volumes)")
+    if result.get("snapshot"):
+        print(f"  Snapshot: {result['snapshot']}")
+    if result.get("hash_algorithm"):
+        print(f"  Checksums: {result['hash_algorithm']}")
+    print_phases(result)
+    print_errors(result)
+
+
+def print_phases(result: dict):
+    """Print time spent in each phase of an operation"""
+    if result.get("phases"):
+        print("  Phases: " + ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in result["phases"].items()))
+
+
+def print_errors(result: dict):
+    """Print the first errors of an operation and where the rest were written"""
+    for error in result["errors"][:10]:
+        print(f"  Error: {error}")
+    total = result.get("errors_total", len(result["errors"]))
+    if total > 10:
+        print(f"  ... and {total - 10} more errors")
+    if result.get("error_log"):
+        print(f"  All errors: {result['error_log']}")
+
+
+def print_prune_result(result: dict):
+    """Print summary of a prune result"""
+    if not result["success"]:
+        print(f"Prune failed: {result.get('error', 'Unknown error')}")
+        return
+    print(f"Pruned: {len(result['removed'])} removed, {len(result['kept'])} kept, "
+          f"{result['bytes_freed'] / 1048576:.1f} MB freed")
+    for name in result["removed"]:
+        print(f"  Removed: {name}")
+    for error in result["errors"][:10]:
+        print(f"  Error: {error}")
+
+
+def run_job(engine: BackupEngine, job: dict) -> dict:
+    """
+    Run a job described by posao_iz_podesavanja arguments right away,
+    pruning old versions afterwards if the job has a retention policy
+    """
+    policy = parse_retention(job["retention"])
+    result = engine.backup(
+        source_dir=job["source_dir"],
+        destination_dir=job["destination_dir"],
+        file_filter=FileFilter(job["include_extensions"], job["exclude_extensions"],
+                               exclude_dirs=job["exclude_dirs"]),
+        incremental=job["incremental"],
+        workers=job["workers"],
+        storage=job["storage"],
+        compression=job["compression"],
+        volume_size=job["volume_size"],
+        delta_threshold=job["delta_threshold"],
+        throttle=make_throttle(job["max_mb_per_second"], job["max_files_per_second"],
+                               job["throttle_profile"]),
+        hash_algorithm=job["hash_algorithm"],
+        deletions=job["deletions"]
+    )
+    if result["success"] and not policy.empty:
+        result["prune"] = engine.prune(job["destination_dir"], policy)
+    return result
+
+
+def load_jobs(settings_path: str) -> dict:
+    """Load named jobs from settings file; exits if there are none"""
+    jobs = poslovi_iz_podesavanja(ucitaj_podesavanja(settings_path))
+    if not jobs:
+        sys.exit(f"No jobs with source/destination folders in settings file: {settings_path}")
+    return jobs
+
+
+def print_deletion_report(report: dict):
+    """Print summary of removed (or, in a dry run, removable) mirror files"""
+    if not report["success"]:
+        print(f"Removing deleted files failed: {report.get('error', 'Unknown error')}")
+        if "files" not in report:
+            return
+    action = "quarantined" if report["mode"] == "quarantine" else "deleted"
+    if report["dry_run"]:
+        action = f"would be {action}"
+    print(f"Files deleted from source: {report['files']} ({report['bytes'] / 1048576:.1f} MB) {action}")
+    for rel_path in report["paths"][:50]:
+        print(f"  {rel_path}")
+    if report["files"] > 50:
+        print(f"  ... and {report['files'] - 50} more")
+    if report.get("quarantine") and not report["dry_run"] and report["files"]:
+        print(f"  Quarantine: {report['quarantine']}")
+
+
+def format_duration(seconds: float) -> str:
+    """Duration as H:MM:SS"""
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def print_plan(plan: dict):
+    """Print summary of a dry-run plan"""
+    if not plan["success"]:
+        print(f"Planning failed: {plan.get('error', 'Unknown error')}")
+        return
+    print(f"Plan: {plan['copy']} of {plan['total']} files to copy "
+          f"({plan['copy_bytes'] / 1048576:.1f} of {plan['bytes_total'] / 1048576:.1f} MB), "
+          f"{plan['unchanged']} unchanged, {plan['skipped']} skipped by filter, "
+          f"{plan['deleted']} deleted in source")
+    if plan["estimated_seconds"] is None:
+        print("  Estimated duration: unknown (no earlier run measured)")
+    else:
+        basis = "this job" if plan["estimate_basis"] == "job" else "all jobs"
+        print(f"  Estimated duration: {format_duration(plan['estimated_seconds'])} (speed of earlier runs of {basis})")
+    print(f"  Scan took {plan['scan_seconds']:.1f} s")
+    for title, totals in (("By extension", plan["by_extension"]), ("By directory", plan["by_directory"])):
+        print(f"  {title}:")
+        for name, item in list(totals.items())[:15]:
+            print(f"    {name:<30} {item['files']:>8} files {item['bytes'] / 1048576:>10.1f} MB"
+                  f"   copy {item['copy_files']:>8} files {item['copy_bytes'] / 1048576:>10.1f} MB")
+        if len(totals) > 15:
+            print(f"    ... and {len(totals) - 15} more")
+    if plan.get("deletions"):
+        print_deletion_report(plan["deletions"])
+    print_errors(plan)
+
+
+def cmd_backup(engine: BackupEngine, args) -> int:
+    file_filter = FileFilter(args.include, args.exclude, args.include_pattern, args.exclude_pattern,
+                             args.exclude_dir)
+    try:
+        throttle = make_throttle(args.max_mbps, args.max_files_per_second, args.throttle_profile)
+        policy = parse_retention(args.keep)
+        pipeline = AsyncPipeline(parse_stage_limits(args.pipeline)) if args.pipeline is not None else None
+    except ValueError as e:
+        print(e)
+        return 2
+    if args.dry_run:
+        plan = engine.plan(args.source, args.destination, incremental=args.incremental, storage=args.storage,
+                           file_filter=file_filter, throttle=throttle, deletions=args.delete)
+        print_plan(plan)
+        return 0 if plan["success"] else 1
+    result = engine.backup(
+        source_dir=args.source,
+        destination_dir=args.destination,
+        file_filter=file_filter,
+        incremental=args.incremental,
+        compare_hash=args.compare_hash,
+        workers=args.workers,
+        storage=args.storage,
+        compression=args.compression,
+        volume_size=int(args.volume_size * 1048576) if args.volume_size else None,
+        delta_threshold=int(args.delta_threshold * 1048576) if args.delta_threshold else None,
+        throttle=throttle,
+        hash_algorithm=args.checksum,
+        deletions=args.delete,
+        pipeline=pipeline
+    )
+    print_backup_result(result)
+    if result.get("extraneous"):
+        print_deletion_report(result["extraneous"])
+    if not result["success"]:
+        return 1
+    if not policy.empty:
+        pruned = engine.prune(args.destination, policy)
+        print_prune_result(pruned)
+        return 0 if pruned["success"] else 1
+    return 0
+
+
+def cmd_prune(engine: BackupEngine, args) -> int:
+    try:
+        policy = parse_retention(args.keep)
+    except ValueError as e:
+        print(e)
+        return 2
+    result = engine.prune(args.backup, policy)
+    print_prune_result(result)
+    return 0 if result["success"] and not result["errors"] else 1
+
+
+def cmd_restore(engine: BackupEngine, args) -> int:
+    result = engine.restore(
+        args.backup,
+        args.destination,
+        overwrite=not args.no_overwrite,
+        skip_identical=not args.no_skip_identical,
+        compare_hash=args.compare_hash,
+        workers=args.workers,
+        snapshot=args.snapshot
+    )
+    if not result["success"]:
+        print(f"Restore failed: {result.get('error', 'Unknown error')}")
+        return 1
+    print(f"Restore completed: {result['restored']} restored, {result['unchanged']} unchanged, "
+          f"{result['skipped']} skipped")
+    print_phases(result)
+    print_errors(result)
+    return 0 if not result["errors"] else 1
+
+
+def cmd_verify(engine: BackupEngine, args) -> int:
+    result = engine.verify(args.backup, workers=args.workers, snapshot=args.snapshot)
+    if not result["success"]:
+        print(f"Verify failed: {result.get('error', 'Unknown error')}")
+        return 1
+    print(f"Verify {'passed' if result['valid'] else 'FAILED'} ({result['algorithm']}): "
+          f"{result['verified']} of {result['total']} files intact, "
+          f"{len(result['mismatched'])} corrupted, {len(result['missing'])} missing")
+    for rel_path in result["mismatched"][:10]:
+        print(f"  Corrupted: {rel_path}")
+    for rel_path in result["missing"][:10]:
+        print(f"  Missing: {rel_path}")
+    print_phases(result)
+    for error in result["errors"][:10]:
+        print(f"  Error: {error}")
+    return 0 if result["valid"] else 1
+
+
+def cmd_run(engine: BackupEngine, args) -> int:
+    jobs = load_jobs(args.settings)
+    if args.job not in jobs:
+        sys.exit(f"Unknown job '{args.job}', available: {', '.join(jobs)}")
+    try:
+        result = run_job(engine, jobs[args.job])
+    except ValueError as e:
+        print(e)
+        return 2
+    print_backup_result(result)
+    if result.get("extraneous"):
+        print_deletion_report(result["extraneous"])
+    if result.get("prune"):
+        print_prune_result(result["prune"])
+    return 0 if result["success"] else 1
+
+
+def cmd_daemon(scheduler: BackupScheduler, args, stop: threading.Event) -> int:
+    for name, job in load_jobs(args.settings).items():
+        scheduler.schedule_backup(name=name, **job)
+    if scheduler.get_next_run() is None:
+        print("[Daemon] Nothing scheduled, exiting")
+        return 1
+
+    print(f"[Daemon] Started at {datetime.now()}, next backup at {scheduler.get_next_run()}")
+    while not stop.is_set():
+        scheduler.run_pending()
+        delay = scheduler.idle_seconds()
+        if delay is None:
+            break
+        # Wake up at the next job (or on a stop signal) instead of polling
+        stop.wait(min(max(delay, 0.0), MAX_SLEEP))
+    scheduler.shutdown(wait=True)
+    print("[Daemon] Stopped")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Headless backup tool")
+    parser.add_argument("--run-log", default=None, metavar="FILE",
+                        help="JSON-lines log of run events and phase timings (default: run_log.jsonl in ~/.backup_index)")
+    parser.add_argument("--metrics-file", default=None, metavar="FILE",
+                        help="Prometheus text file with metrics of the last runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("backup", help="Run a backup once")
+    p.add_argument("source")
+    p.add_argument("destination")
+    p.add_argument("--include", nargs="*", default=None, metavar="EXT", help="Extensions to include")
+    p.add_argument("--exclude", nargs="*", default=None, metavar="EXT", help="Extensions to exclude")
+    p.add_argument("--include-pattern", nargs="*", default=None, metavar="GLOB")
+    p.add_argument("--exclude-pattern", nargs="*", default=None, metavar="GLOB")
+    p.add_argument("--exclude-dir", nargs="*", default=None, metavar="NAME")
+    p.add_argument("--incremental", action="store_true", help="Copy only changed files")
+    p.add_argument("--compare-hash", action="store_true", help="Compare content hashes of unchanged-looking files")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--storage", choices=("mirror", "snapshot", "dedup", "archive"), default="mirror")
+    p.add_argument("--compression", default="gz")
+    p.add_argument("--volume-size", type=float, default=None, metavar="MB")
+    p.add_argument("--delta-threshold", type=float, default=None, metavar="MB")
+    p.add_argument("--max-mbps", type=float, default=None, metavar="MB", help="Bandwidth limit in MB/s")
+    p.add_argument("--max-files-per-second", type=float, default=None, metavar="N")
+    p.add_argument("--throttle-profile", default=None, metavar="PROFILE",
+                   help='Time-of-day limits, e.g. "08:00-18:00=20;18:00-22:00=50/200"')
+    p.add_argument("--checksum", choices=HASH_ALGORITHMS, default=None,
+                   help="Hash files while copying and write a manifest for 'verify'")
+    p.add_argument("--delete", choices=("delete", "quarantine"), default=None,
+                   help="Mirror storage: remove destination files deleted from the source")
+    p.add_argument("--pipeline", nargs="?", const="", default=None, metavar="LIMITS",
+                   help='Mirror storage: copy through an async pipeline for high-latency (SMB/NFS) '
+                        'destinations, optionally with stage limits, e.g. "copy=32, metadata=64"')
+    p.add_argument("--dry-run", action="store_true",
+                   help="Only report files, bytes and estimated duration (and what --delete would remove)")
+    p.add_argument("--keep", default=None, metavar="POLICY",
+                   help='Prune old versions after the backup, e.g. "daily=7, weekly=4, monthly=12"')
+
+    p = commands.add_parser("restore", help="Restore a backup")
+    p.add_argument("backup")
+    p.add_argument("destination")
+    p.add_argument("--snapshot", default=None, help="Snapshot or archive name (default: latest)")
+    p.add_argument("--no-overwrite", action="store_true", help="Keep files that already exist")
+    p.add_argument("--no-skip-identical", action="store_true", help="Rewrite files that look identical")
+    p.add_argument("--compare-hash", action="store_true")
+    p.add_argument("--workers", type=int, default=1)
+
+    p = commands.add_parser("verify", help="Check a backup against the hashes in its manifest")
+    p.add_argument("backup")
+    p.add_argument("--snapshot", default=None, help="Snapshot or archive name (default: latest)")
+    p.add_argument("--workers", type=int, default=1)
+
+    p = commands.add_parser("prune", help="Delete snapshots or archives not kept by a retention policy")
+    p.add_argument("backup")
+    p.add_argument("--keep", required=True, metavar="POLICY",
+                   help="Versions to keep: last=N, daily=N, weekly=N, monthly=N, yearly=N")
+
+    p = commands.add_parser("run", help="Run a job from the settings file once")
+    p.add_argument("--settings", default=SETTINGS_FILE, help="Settings file written by the GUI")
+    p.add_argument("--job", default=PODRAZUMEVANI_POSAO, help="Job name")
+
+    p = commands.add_parser("daemon", help="Run all jobs from the settings file on their schedules")
+    p.add_argument("--settings", default=SETTINGS_FILE, help="Settings file written by the GUI")
+    p.add_argument("--max-jobs", type=int, default=2, help="Jobs running at once")
+    p.add_argument("--jobs-per-device", type=int, default=1, help="Running jobs per destination device")
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    # One telemetry for all engines, so the metrics file lists the last run of every job
+    if args.run_log:
+        telemetry = Telemetry(args.run_log, args.metrics_file)
+    else:
+        telemetry = default_telemetry(metrics_path=args.metrics_file)
+    engine = BackupEngine(telemetry=telemetry)
+    scheduler = None
+    if args.command == "daemon":
+        scheduler = BackupScheduler(lambda: BackupEngine(telemetry=telemetry), max_workers=args.max_jobs,
+                                    max_jobs_per_device=args.jobs_per_device)
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        print(f"[CLI] Signal {signum} received, stopping")
+        stop.set()
+        engine.cancel()
+        if scheduler is not None:
+            scheduler.cancel_running()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    if args.command == "backup":
+        return cmd_backup(engine, args)
+    if args.command == "restore":
+        return cmd_restore(engine, args)
+    if args.command == "verify":
+        return cmd_verify(engine, args)
+    if args.command == "prune":
+        return cmd_prune(engine, args)
+    if args.command == "run":
+        return cmd_run(engine, args)
+    return cmd_daemon(scheduler, args, stop)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,31 +2,262 @@
 Backup Engine - Core backup functionality with filtering
 """
 import os
-import shutil
-from pathlib import Path
-from typing import List, Callable, Optional
+import time
+import queue
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from typing import Iterable, Iterator, List, Callable, Optional, Tuple, NamedTuple
 from datetime import datetime
+from dedup_store import DedupStore
+from file_index import FileIndex, DEFAULT_INDEX_DIR
+from archive import ArchiveWriter, list_archives, restore_archive, verify_archive, delete_archive
+from file_filter import FileFilter, file_suffix
+from progress import ProgressReporter
+from fast_copy import (copy_file, copy_small_file, delta_copy, link_file, write_temp, finish_temp,
+                       timestamp_tolerance, DirectoryCache, DELTA_BLOCK_SIZE, SMALL_FILE_SIZE, TEMP_SUFFIX)
+from journal import BackupJournal
+from integrity import (check_algorithm, new_hasher, hash_file, load_manifest, write_manifest,
+                       MANIFEST_NAME)
+from throttle import Throttle
+from retention import RetentionPolicy, parse_timestamp, select_to_keep
+from mirror_sync import find_extraneous, QUARANTINE_DIR
+from run_history import RunHistory
+from telemetry import Telemetry, RunMetrics, ErrorList, default_telemetry
+from async_pipeline import AsyncPipeline
+import snapshots
+
+# What a mirror does with destination files deleted from the source
+DELETION_MODES = ("delete", "quarantine")
+
+# Paths listed in a deletion report; the counts cover all of them
+DELETION_REPORT_LIMIT = 1000
+
+# Directories listed separately by plan(); the rest are summed up as "(other)"
+PLAN_DIRECTORY_LIMIT = 50
+
+# Files scanned ahead of the copy stage (see ScanStream)
+SCAN_READ_AHEAD = 50000
+
+# Small files handed to a worker together: at most this many files and bytes
+SMALL_FILE_BATCH = 64
+SMALL_FILE_BATCH_BYTES = 1024 * 1024
+
+
+def file_hash(file_path: str, algorithm: str = "sha256", chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute content hash of a file
+
+    Args:
+        file_path: Path to the file
+        algorithm: One of integrity.HASH_ALGORITHMS
+        chunk_size: Number of bytes read at once
+
+    Returns:
+        Hex digest of the file content
+    """
+    h = new_hasher(algorithm)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def accepts_bytes(callback: Callable) -> bool:
+    """Check if a progress callback takes (current, total, filename, bytes_done, bytes_total)"""
+    try:
+        inspect.signature(callback).bind(0, 0, "", 0, 0)
+    except TypeError:
+        return False
+    except ValueError:
+        # No signature available (some builtins); keep the original three arguments
+        return False
+    return True
+
+
+def small_file_batches(items: Iterable, entry_of: Callable = lambda item: item) -> Iterator[list]:
+    """
+    Group consecutive small files into batches handled by one worker task
+
+    Thread pool, lock and bookkeeping overhead is then paid once per batch
+    instead of once per file, which dominates for files of a few KB. Files
+    larger than SMALL_FILE_SIZE form a batch of their own.
+
+    Args:
+        items: Files to process, in scan order
+        entry_of: Function returning the ScanEntry of an item
+
+    Yields:
+        Lists of items
+    """
+    batch = []
+    batch_bytes = 0
+    for item in items:
+        size = entry_of(item).size
+        if size > SMALL_FILE_SIZE:
+            yield [item]
+            continue
+        batch.append(item)
+        batch_bytes += size
+        if len(batch) >= SMALL_FILE_BATCH or batch_bytes >= SMALL_FILE_BATCH_BYTES:
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
+
+
+class ScanEntry:
+    """
+    File found by the scan stage, with the stat data needed by later stages
+
+    Compact: the directory paths are one string object shared by all files
+    of a directory, and the full paths are built only when asked for.
+    """
+    __slots__ = ("dir_path", "rel_dir", "name", "size", "mtime_ns", "ino")
+
+    def __init__(self, dir_path: str, rel_dir: str, name: str, size: int, mtime_ns: int, ino: int):
+        self.dir_path = dir_path    # directory holding the file
+        self.rel_dir = rel_dir      # the same directory relative to the scanned root ("" = root)
+        self.name = name
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.ino = ino
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.dir_path, self.name)
+
+    @property
+    def rel_path(self) -> str:
+        return self.rel_dir + os.sep + self.name if self.rel_dir else self.name
+
+
+class ScanStream:
+    def __init__(self, entries: Iterator[ScanEntry], read_ahead: int = SCAN_READ_AHEAD):
+        """
+        Scanned files handed out once, with running totals
+
+        Up to read_ahead files are scanned before the first one is handed
+        out, so for trees of that size the totals are final before copying
+        starts (exact progress and ETA). Larger trees are scanned while they
+        are copied and their totals grow until the scan ends; memory stays
+        bounded by read_ahead either way.
+
+        Args:
+            entries: Generator of scanned files (see BackupEngine.iter_scan)
+            read_ahead: Files scanned ahead of the consumer
+        """
+        self.entries = entries
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0          # time spent scanning, including filter rules
+        self.complete = False
+        self.buffer = deque()
+        while len(self.buffer) < read_ahead:
+            entry = self.next_entry()
+            if entry is None:
+                break
+            self.buffer.append(entry)
+
+    def next_entry(self) -> Optional[ScanEntry]:
+        start = time.perf_counter()
+        entry = next(self.entries, None)
+        self.seconds += time.perf_counter() - start
+        if entry is None:
+            self.complete = True
+        else:
+            self.files += 1
+            self.bytes += entry.size
+        return entry
+
+    def __iter__(self) -> Iterator[ScanEntry]:
+        while self.buffer:
+            yield self.buffer.popleft()
+        while not self.complete:
+            entry = self.next_entry()
+            if entry is not None:
+                yield entry
+
+    def close(self):
+        """Stop the scan (its generator finishes its bookkeeping)"""
+        self.buffer.clear()
+        self.entries.close()
+
+
+class FileResult(NamedTuple):
+    """Outcome of backing up a single file"""
+    outcome: str                    # "copied", "unchanged", "resumed" or "error"
+    state: Optional[dict] = None    # new index/snapshot entry of the file
+    error: Optional[str] = None
+    method: Optional[str] = None    # copy primitive used (see fast_copy.COPY_METHODS)
+    bytes_written: int = 0          # bytes actually written to the destination
 
 
 class BackupEngine:
-    def __init__(self, progress_callback: Optional[Callable] = None):
+    def __init__(self, progress_callback: Optional[Callable] = None, index_dir: Optional[str] = None,
+                 progress_queue: Optional[queue.Queue] = None, progress_interval: float = 0.25,
+                 telemetry: Optional[Telemetry] = None):
         """
         Initialize backup engine
 
         Args:
-            progress_callback: Function to call with progress updates (current, total, filename)
+            progress_callback: Optional function called after every single file with
+                (current, total, filename), or with (current, total, filename,
+                bytes_done, bytes_total) if it accepts five arguments; runs on
+                the copy thread, so keep it cheap
+            index_dir: Directory for incremental file-state indexes (None = default)
+            progress_queue: Queue receiving rate-limited ProgressSnapshot objects
+                (files, bytes, throughput, ETA); safe to poll from a GUI thread
+            progress_interval: Minimum seconds between two snapshots on progress_queue
+            telemetry: Destination of run events and metrics; may be shared by
+                several engines (None = run log in the index directory)
         """
         self.progress_callback = progress_callback
+        self.progress_bytes = progress_callback is not None and accepts_bytes(progress_callback)
+        self.index_dir = index_dir
+        self.progress_queue = progress_queue
+        self.progress_interval = progress_interval
+        self.reporter = ProgressReporter()
+        self.history = RunHistory(index_dir)
+        self.telemetry = telemetry if telemetry is not None else default_telemetry(index_dir)
+        self.metrics = RunMetrics("idle")
+        self.job = None  # name of the scheduled job, labels telemetry of its runs
+        self.throttle = None
+        self.directories = DirectoryCache()  # destination directories created by the current run
+        # Allowed mtime difference (ns) when comparing with destination files;
+        # measured per run, since FAT/exFAT store timestamps with 2 s granularity
+        self.mtime_tolerance = 0
+        self.tolerances = {}  # destination real path -> tolerance measured by the last run there
         self.cancelled = False
 
     def cancel(self):
         """Cancel the ongoing backup operation"""
         self.cancelled = True
+        # Wake up workers waiting for the rate limit
+        if self.throttle is not None:
+            self.throttle.cancel()
 
     def reset_cancel(self):
         """Reset cancel flag for new operation"""
         self.cancelled = False
 
+    def measure_tolerance(self, directory: str) -> int:
+        """Probe the timestamp tolerance of a destination and remember it for plan()"""
+        tolerance = timestamp_tolerance(directory)
+        self.tolerances[os.path.realpath(directory)] = tolerance
+        return tolerance
+
+    def run_labels(self) -> dict:
+        """Labels of the telemetry runs of this engine"""
+        return {"job": self.job} if self.job else {}
+
+    def error_list(self) -> ErrorList:
+        """Error list of the current run, spilling to errors/<run id>.log in the index directory"""
+        return ErrorList(os.path.join(self.index_dir or DEFAULT_INDEX_DIR, "errors", f"{self.metrics.run_id}.log"),
+                         self.metrics)
+
     def should_include_file(self, file_path: str, include_extensions: List[str],
                            exclude_extensions: List[str]) -> bool:
         """
@@ -40,18 +271,152 @@ class BackupEngine:
         Returns:
             True if file should be included, False otherwise
         """
-        file_ext = Path(file_path).suffix.lower()
+        file_filter = FileFilter(include_extensions, exclude_extensions)
+        return file_filter.include_file(os.path.basename(file_path))
 
-        # If exclude list has this extension, skip it
-        if exclude_extensions and file_ext in [ext.lower() for ext in exclude_extensions]:
-            return False
+    def iter_scan(self, source_dir: str, file_filter: FileFilter, errors: List[str], counts: dict,
+                  metrics: Optional[RunMetrics] = None,
+                  pipeline: Optional[AsyncPipeline] = None) -> Iterator[ScanEntry]:
+        """
+        Scan source directory, yielding matching files as they are found
 
-        # If include list is empty, include all (except excluded)
-        if not include_extensions:
-            return True
+        Uses os.scandir so file type and (on Windows) stat data come from the
+        directory listing itself, without an extra syscall per entry.
+        Directories excluded by the filter are not descended into. Files of
+        one directory are yielded one after another; only the directories
+        still to visit are kept in memory.
 
-        # If include list exists, only include matching extensions
-        return file_ext in [ext.lower() for ext in include_extensions]
+        Args:
+            source_dir: Source directory path
+            file_filter: Compiled filter rules
+            errors: List receiving scan errors
+            counts: Dictionary whose "skipped" counts files skipped by filter
+            metrics: Run receiving the time spent in filter rules as the
+                "filter" phase and the sizes of matching files (None = not measured)
+            pipeline: List up to its scan limit of directories at once, each
+                one read whole before its files are yielded (None = one
+                directory at a time)
+
+        Yields:
+            ScanEntry of every matching file
+        """
+        counts.setdefault("skipped", 0)
+        counts.setdefault("filter_seconds", 0.0)
+        found = 0
+        try:
+            if pipeline is None:
+                pending = [""]
+                while pending:
+                    if self.cancelled:
+                        break
+                    rel_dir = pending.pop()
+                    if self.reporter.phase == "scan":
+                        self.reporter.update(found, 0, 0, 0, rel_dir)
+                    for entry in self.scan_directory(source_dir, rel_dir, file_filter, errors, counts, pending):
+                        if metrics is not None:
+                            metrics.file_sizes.observe(entry.size)
+                        found += 1
+                        yield entry
+                return
+
+            def list_directory(rel_dir: str) -> Tuple[tuple, List[str]]:
+                # Runs on the pipeline executor, so it fills counters of its own
+                dir_errors = []
+                dir_counts = {"skipped": 0, "filter_seconds": 0.0}
+                subdirs = []
+                files = list(self.scan_directory(source_dir, rel_dir, file_filter, dir_errors, dir_counts,
+                                                 subdirs))
+                return (rel_dir, files, dir_errors, dir_counts), subdirs
+
+            for rel_dir, files, dir_errors, dir_counts in pipeline.walk(list_directory,
+                                                                         cancelled=lambda: self.cancelled):
+                errors.extend(dir_errors)
+                counts["skipped"] += dir_counts["skipped"]
+                counts["filter_seconds"] += dir_counts["filter_seconds"]
+                if self.reporter.phase == "scan":
+                    self.reporter.update(found, 0, 0, 0, rel_dir)
+                for entry in files:
+                    if metrics is not None:
+                        metrics.file_sizes.observe(entry.size)
+                    found += 1
+                    yield entry
+        finally:
+            if metrics is not None:
+                metrics.add_phase("filter", counts["filter_seconds"], skipped=counts["skipped"])
+
+    def scan_directory(self, source_dir: str, rel_dir: str, file_filter: FileFilter, errors: List[str],
+                       counts: dict, subdirs: List[str]) -> Iterator[ScanEntry]:
+        """
+        Yield matching files of one directory of a scan (see iter_scan)
+
+        Args:
+            source_dir: Root of the scan
+            rel_dir: Directory to list, relative to source_dir ("" = root)
+            file_filter: Compiled filter rules
+            errors: List receiving scan errors
+            counts: Dictionary whose "skipped" and "filter_seconds" are
+                increased by the files skipped and the time spent in filter rules
+            subdirs: List receiving included subdirectories (relative paths)
+        """
+        dir_path = os.path.join(source_dir, rel_dir) if rel_dir else source_dir
+        prefix = rel_dir + os.sep if rel_dir else ""
+        filter_seconds = 0.0
+        clock = time.perf_counter
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    rel_path = prefix + entry.name
+                    try:
+                        # Like os.walk, symlinked directories are not descended into
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                start = clock()
+                                included = file_filter.include_dir(entry.name)
+                                filter_seconds += clock() - start
+                                if included:
+                                    subdirs.append(rel_path)
+                            continue
+                        start = clock()
+                        included = file_filter.include_file(entry.name, rel_path)
+                        filter_seconds += clock() - start
+                        if not included:
+                            counts["skipped"] += 1
+                            continue
+                        st = entry.stat()
+                        start = clock()
+                        included = file_filter.include_stat(st.st_size, st.st_mtime_ns)
+                        filter_seconds += clock() - start
+                        if not included:
+                            counts["skipped"] += 1
+                            continue
+                    except OSError as e:
+                        errors.append(f"Failed to scan {entry.path}: {e}")
+                        continue
+                    yield ScanEntry(dir_path, rel_dir, entry.name, st.st_size, st.st_mtime_ns, st.st_ino)
+        except OSError as e:
+            errors.append(f"Failed to scan {dir_path}: {e}")
+        finally:
+            counts["filter_seconds"] += filter_seconds
+
+    def scan(self, source_dir: str, file_filter: FileFilter,
+             metrics: Optional[RunMetrics] = None) -> Tuple[List[ScanEntry], int, List[str]]:
+        """
+        Scan source directory once and build the list of files to back up
+
+        Holds every file in memory; the backup itself streams with iter_scan().
+
+        Args:
+            source_dir: Source directory path
+            file_filter: Compiled filter rules
+            metrics: Run receiving filter time and file sizes (None = not measured)
+
+        Returns:
+            Tuple (matching files, number of files skipped by filter, errors)
+        """
+        errors = []
+        counts = {"skipped": 0}
+        entries = list(self.iter_scan(source_dir, file_filter, errors, counts, metrics))
+        return entries, counts["skipped"], errors
 
     def count_files(self, source_dir: str, include_extensions: List[str],
                    exclude_extensions: List[str]) -> int:
@@ -66,20 +431,331 @@ class BackupEngine:
         Returns:
             Total number of files to backup
         """
-        total = 0
+        entries, _, _ = self.scan(source_dir, FileFilter(include_extensions, exclude_extensions))
+        return len(entries)
+
+    def run_parallel(self, entries, process: Callable, workers: int):
+        """
+        Call process(entry) for every entry, on a thread pool if workers > 1
+
+        Stops submitting new entries once cancel() is called. Exceptions
+        raised by process are propagated.
+
+        Args:
+            entries: Iterable of entries to process
+            process: Function handling one entry (must be thread-safe if workers > 1)
+            workers: Number of worker threads
+        """
+        if workers <= 1:
+            for entry in entries:
+                if self.cancelled:
+                    break
+                process(entry)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Keep a bounded number of entries in flight so cancel() takes effect quickly
+            in_flight = set()
+            for entry in entries:
+                if self.cancelled:
+                    break
+                in_flight.add(pool.submit(process, entry))
+                if len(in_flight) >= workers * 4:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+            for future in in_flight:
+                future.result()
+
+    def report_progress(self, current: int, total: int, entry: ScanEntry,
+                        bytes_done: int, bytes_total: int):
+        """Pass progress of the copy stage to the progress reporter and callback"""
+        self.reporter.update(current, total, bytes_done, bytes_total, entry.rel_path)
+        self.notify_progress(current, total, os.path.basename(entry.rel_path), bytes_done, bytes_total)
+
+    def notify_progress(self, current: int, total: int, filename: str, bytes_done: int = 0, bytes_total: int = 0):
+        """Call the progress callback with the arguments it accepts"""
+        if self.progress_callback is None:
+            return
+        if self.progress_bytes:
+            self.progress_callback(current, total, filename, bytes_done, bytes_total)
+        else:
+            self.progress_callback(current, total, filename)
+
+    def is_unchanged(self, entry: ScanEntry, dest_file: str,
+                     previous: Optional[dict], compare_hash: bool) -> Tuple[bool, Optional[str]]:
+        """
+        Check if file is already backed up and unchanged since the last run
+
+        The source is compared with its index entry when one exists, and the
+        destination copy only has to exist with the same size, so a copy
+        deleted or truncated outside of backups is copied again; otherwise
+        the source is compared with the file present in the destination.
+
+        Args:
+            entry: Scanned source file
+            dest_file: Path to the file in the destination
+            previous: Index entry from the previous run (None if missing)
+            compare_hash: Also compare content hash when size and mtime match
+
+        Returns:
+            Tuple (unchanged, source hash or None if it was not computed)
+        """
+        if previous is not None:
+            if previous.get("size") != entry.size or previous.get("mtime_ns") != entry.mtime_ns:
+                return False, None
+            # A file replaced by another one with the same size and mtime
+            if previous.get("ino") and entry.ino and previous["ino"] != entry.ino:
+                return False, None
+            try:
+                if os.stat(dest_file).st_size != entry.size:
+                    return False, None
+            except OSError:
+                return False, None
+            if not compare_hash:
+                return True, previous.get("hash")
+            source_hash = file_hash(entry.path)
+            previous_hash = previous.get("hash") or file_hash(dest_file)
+            return source_hash == previous_hash, source_hash
+
         try:
-            for root, dirs, files in os.walk(source_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if self.should_include_file(file_path, include_extensions, exclude_extensions):
-                        total += 1
+            dest_stat = os.stat(dest_file)
+        except OSError:
+            return False, None
+        if (dest_stat.st_size != entry.size or
+                abs(dest_stat.st_mtime_ns - entry.mtime_ns) > self.mtime_tolerance):
+            return False, None
+        if not compare_hash:
+            return True, None
+        source_hash = file_hash(entry.path)
+        return source_hash == file_hash(dest_file), source_hash
+
+    def is_resumed(self, entry: ScanEntry, state: dict, dest_file: Optional[str] = None) -> bool:
+        """
+        Check if an interrupted run already finished this file
+
+        Args:
+            entry: Scanned source file
+            state: Journal entry of the file
+            dest_file: Copy in the destination that must still exist (None = no copy to check)
+        """
+        if state.get("size") != entry.size or state.get("mtime_ns") != entry.mtime_ns:
+            return False
+        if state.get("ino") and entry.ino and state["ino"] != entry.ino:
+            return False
+        if dest_file is not None:
+            try:
+                return os.stat(dest_file).st_size == entry.size
+            except OSError:
+                return False
+        return True
+
+    def backup_file(self, entry: ScanEntry, destination_dir: str, incremental: bool,
+                    compare_hash: bool, previous: Optional[dict],
+                    delta_threshold: Optional[int] = None,
+                    throttle: Optional[Throttle] = None,
+                    hash_algorithm: Optional[str] = None,
+                    link_dir: Optional[str] = None) -> FileResult:
+        """
+        Back up a single scanned file
+
+        Safe to call from several worker threads at once.
+
+        Args:
+            entry: Scanned source file
+            destination_dir: Destination directory for backup
+            incremental: Skip the file if it did not change since the last run
+            compare_hash: In incremental mode also compare content hashes
+            previous: Index entry from the previous run (None if missing)
+            delta_threshold: Update existing copies of files at least this large
+                in place, writing only changed blocks (None = always copy whole file)
+            throttle: Optional rate limit for copied bytes
+            hash_algorithm: Hash the data while copying it and put the digest
+                into the state as "checksum" (None = no hashing)
+            link_dir: Previous snapshot; an unchanged file is hard-linked from
+                there instead of being copied (None = compare with destination_dir)
+
+        Returns:
+            FileResult with the outcome and new index entry
+        """
+        dest_file = os.path.join(destination_dir, entry.rel_path)
+        state = {"size": entry.size, "mtime_ns": entry.mtime_ns, "ino": entry.ino, "hash": None}
+        previous_file = os.path.join(link_dir, entry.rel_path) if link_dir else dest_file
+
+        # Skip files that did not change since the last run
+        if incremental:
+            try:
+                unchanged, source_hash = self.is_unchanged(entry, previous_file, previous, compare_hash)
+            except Exception as e:
+                return FileResult("error", error=f"Failed to check {entry.path}: {e}")
+
+            state["hash"] = source_hash
+            if unchanged and link_dir is None:
+                return FileResult("unchanged", state)
+            if unchanged:
+                try:
+                    self.directories.ensure(os.path.dirname(dest_file))
+                    link_file(previous_file, dest_file)
+                    return FileResult("unchanged", state, method="hardlink")
+                except OSError:
+                    # Filesystem without hard links or link count limit: copy instead
+                    pass
+
+        hasher = new_hasher(hash_algorithm) if hash_algorithm else None
+
+        # Large file with an older copy in the destination: transfer only changed blocks
+        if delta_threshold is not None and entry.size >= delta_threshold and os.path.isfile(dest_file):
+            try:
+                written = delta_copy(entry.path, dest_file, throttle=throttle, hasher=hasher)
+            except Exception as e:
+                return FileResult("error", error=f"Failed to update {entry.path}: {e}")
+            if hasher is not None:
+                state["checksum"] = hasher.hexdigest()
+            return FileResult("copied", state, method="delta", bytes_written=written)
+
+        # Copy file with the fastest primitive the filesystems support
+        try:
+            self.directories.ensure(os.path.dirname(dest_file))
+            if entry.size <= SMALL_FILE_SIZE:
+                method = copy_small_file(entry.path, dest_file, throttle, hasher)
+            else:
+                method = copy_file(entry.path, dest_file, throttle, hasher)
+        except Exception as e:
+            return FileResult("error", error=f"Failed to copy {entry.path}: {e}")
+
+        if hasher is not None:
+            state["checksum"] = hasher.hexdigest()
+        return FileResult("copied", state, method=method, bytes_written=entry.size)
+
+    async def backup_file_async(self, pipeline: AsyncPipeline, entry: ScanEntry, destination_dir: str,
+                                incremental: bool, compare_hash: bool, previous: Optional[dict],
+                                delta_threshold: Optional[int] = None,
+                                throttle: Optional[Throttle] = None,
+                                hash_algorithm: Optional[str] = None) -> FileResult:
+        """
+        backup_file() split into pipeline stages
+
+        The check against the destination and the metadata copy run in the
+        "metadata" stage, directory creation in "mkdir" and the content in
+        "copy", so each file waits only for a free slot of the stage it is in.
+
+        Args:
+            pipeline: Started pipeline running the blocking calls
+            entry, destination_dir, incremental, compare_hash, previous,
+            delta_threshold, throttle, hash_algorithm: As in backup_file()
+
+        Returns:
+            FileResult with the outcome and new index entry
+        """
+        dest_file = os.path.join(destination_dir, entry.rel_path)
+        state = {"size": entry.size, "mtime_ns": entry.mtime_ns, "ino": entry.ino, "hash": None}
+
+        if incremental:
+            try:
+                unchanged, source_hash = await pipeline.call("metadata", self.is_unchanged, entry, dest_file,
+                                                             previous, compare_hash)
+            except Exception as e:
+                return FileResult("error", error=f"Failed to check {entry.path}: {e}")
+            state["hash"] = source_hash
+            if unchanged:
+                return FileResult("unchanged", state)
+
+        hasher = new_hasher(hash_algorithm) if hash_algorithm else None
+
+        if (delta_threshold is not None and entry.size >= delta_threshold
+                and await pipeline.call("metadata", os.path.isfile, dest_file)):
+            try:
+                written = await pipeline.call("copy", delta_copy, entry.path, dest_file, DELTA_BLOCK_SIZE,
+                                              throttle, hasher)
+            except Exception as e:
+                return FileResult("error", error=f"Failed to update {entry.path}: {e}")
+            if hasher is not None:
+                state["checksum"] = hasher.hexdigest()
+            return FileResult("copied", state, method="delta", bytes_written=written)
+
+        try:
+            await pipeline.ensure_dir(os.path.dirname(dest_file))
+            method = await pipeline.call("copy", write_temp, entry.path, dest_file, throttle, hasher)
+            await pipeline.call("metadata", finish_temp, entry.path, dest_file)
         except Exception as e:
-            print(f"Error counting files: {e}")
-        return total
+            return FileResult("error", error=f"Failed to copy {entry.path}: {e}")
+
+        if hasher is not None:
+            state["checksum"] = hasher.hexdigest()
+        return FileResult("copied", state, method=method, bytes_written=entry.size)
+
+    def store_file(self, entry: ScanEntry, store: DedupStore, incremental: bool,
+                   previous: Optional[dict], throttle: Optional[Throttle] = None,
+                   hash_algorithm: Optional[str] = None) -> FileResult:
+        """
+        Back up a single scanned file into a dedup store
+
+        Args:
+            entry: Scanned source file
+            store: Dedup store to write chunks into
+            incremental: Reuse chunk list from the previous snapshot if file did not change
+            previous: Entry of the file in the previous snapshot (None if missing)
+            throttle: Optional rate limit; the whole file is paid for up front
+            hash_algorithm: Hash the file while chunking it (None = no hashing)
+
+        Returns:
+            FileResult with the outcome and snapshot entry
+        """
+        if (incremental and previous is not None and previous.get("size") == entry.size
+                and previous.get("mtime_ns") == entry.mtime_ns):
+            return FileResult("unchanged", previous)
+
+        if throttle is not None:
+            throttle.consume_bytes(entry.size)
+
+        hasher = new_hasher(hash_algorithm) if hash_algorithm else None
+        try:
+            chunks, stored_bytes = store.add_file(entry.path, hasher)
+        except Exception as e:
+            return FileResult("error", error=f"Failed to store {entry.path}: {e}")
+
+        state = {"size": entry.size, "mtime_ns": entry.mtime_ns, "chunks": chunks}
+        if hasher is not None:
+            state["hash"] = hasher.hexdigest()
+        return FileResult("copied", state, method="dedup", bytes_written=stored_bytes)
+
+    def archive_file(self, entry: ScanEntry, archive: ArchiveWriter,
+                     throttle: Optional[Throttle] = None) -> FileResult:
+        """
+        Append a single scanned file to an archive (not thread-safe)
+
+        Args:
+            entry: Scanned source file
+            archive: Archive being written
+            throttle: Optional rate limit; the whole file is paid for up front
+
+        Returns:
+            FileResult with the outcome
+        """
+        if throttle is not None:
+            throttle.consume_bytes(entry.size)
+        try:
+            archive.add(entry.path, entry.rel_path)
+        except OSError as e:
+            return FileResult("error", error=f"Failed to archive {entry.path}: {e}")
+        return FileResult("copied", method="archive", bytes_written=entry.size)
 
     def backup(self, source_dir: str, destination_dir: str,
               include_extensions: List[str] = None,
-              exclude_extensions: List[str] = None) -> dict:
+              exclude_extensions: List[str] = None,
+              incremental: bool = False,
+              compare_hash: bool = False,
+              workers: int = 1,
+              storage: str = "mirror",
+              compression: str = "gz",
+              compression_level: Optional[int] = None,
+              volume_size: Optional[int] = None,
+              file_filter: Optional[FileFilter] = None,
+              delta_threshold: Optional[int] = None,
+              throttle: Optional[Throttle] = None,
+              hash_algorithm: Optional[str] = None,
+              deletions: Optional[str] = None,
+              pipeline: Optional[AsyncPipeline] = None) -> dict:
         """
         Perform backup operation with filtering
 
@@ -88,90 +764,1209 @@ class BackupEngine:
             destination_dir: Destination directory for backup
             include_extensions: List of file extensions to include (None = all)
             exclude_extensions: List of file extensions to exclude
+            incremental: Copy only new or modified files (compared by size/mtime)
+            compare_hash: In incremental mode also compare content hashes
+            workers: Number of files copied concurrently
+            storage: "mirror" to copy the tree as is, "snapshot" to write a new
+                timestamped tree per run that hard-links unchanged files to the
+                previous one, "dedup" to store chunks and a snapshot manifest in
+                a content-addressed store, "archive" to stream all files into
+                one compressed tar
+            compression: Archive compression ('none', 'gz', 'bz2', 'xz', 'zst')
+            compression_level: Archive compression level (None = default for compression)
+            volume_size: Split archive into volumes of at most this many bytes
+            file_filter: Compiled filter with patterns, directory excludes and
+                size/age limits (overrides include/exclude_extensions)
+            delta_threshold: In mirror storage, update changed files of at least
+                this many bytes in place by writing only the blocks that differ
+                (None = disabled)
+            throttle: Bandwidth and files-per-second limits shared by all
+                workers, optionally with a time-of-day profile (None = full speed)
+            hash_algorithm: Hash every file while it is copied and record the
+                hashes in a manifest (mirror: MANIFEST_NAME in the destination,
+                dedup: the snapshot, archive: the archive index) for verify().
+                Mirror copies then go through user space instead of reflink
+                or copy_file_range (None = no hashes)
+            deletions: In mirror storage, "delete" or "quarantine" destination
+                files that no longer exist in the source once the copy
+                succeeded (None = keep them; see propagate_deletions)
+            pipeline: In mirror storage, scan and copy through this asyncio
+                pipeline, keeping many operations in flight per stage, for
+                destinations with high latency per operation such as SMB/NFS
+                shares; it replaces workers. A pipeline that is not running
+                is started and closed by the run; one the caller started
+                stays running (None = thread pool of workers)
 
         Returns:
-            Dictionary with backup statistics
+            Dictionary with backup statistics; bytes_copied is the logical size
+            of copied files, bytes_written what was actually written, "phases"
+            the seconds spent in scan, filter, copy, verify (manifest) and
+            finalize. Events and metrics of the run go to self.telemetry
         """
+        self.reporter = ProgressReporter(self.progress_queue, self.progress_interval)
+        self.metrics = self.telemetry.start(
+            "backup", self.run_labels(), source=source_dir, destination=destination_dir, storage=storage,
+            incremental=incremental, workers=workers, hash_algorithm=hash_algorithm, deletions=deletions,
+            pipeline=pipeline.limits._asdict() if pipeline is not None else None)
+        self.throttle = throttle
+        if throttle is not None:
+            throttle.reset()
+        result = {"success": False, "error": "Backup failed unexpectedly"}
+        started = False
+        try:
+            if pipeline is not None:
+                started = pipeline.start()
+            result = self.run_backup(
+                source_dir=source_dir,
+                destination_dir=destination_dir,
+                include_extensions=include_extensions,
+                exclude_extensions=exclude_extensions,
+                incremental=incremental,
+                compare_hash=compare_hash,
+                workers=workers,
+                storage=storage,
+                compression=compression,
+                compression_level=compression_level,
+                volume_size=volume_size,
+                file_filter=file_filter,
+                delta_threshold=delta_threshold,
+                throttle=throttle,
+                hash_algorithm=hash_algorithm,
+                deletions=deletions,
+                pipeline=pipeline
+            )
+        finally:
+            if started:
+                pipeline.close()
+            self.reporter.finish()
+            result["phases"] = self.metrics.finish(result)
+        return result
+
+    def run_backup(self, source_dir: str, destination_dir: str,
+              include_extensions: List[str] = None,
+              exclude_extensions: List[str] = None,
+              incremental: bool = False,
+              compare_hash: bool = False,
+              workers: int = 1,
+              storage: str = "mirror",
+              compression: str = "gz",
+              compression_level: Optional[int] = None,
+              volume_size: Optional[int] = None,
+              file_filter: Optional[FileFilter] = None,
+              delta_threshold: Optional[int] = None,
+              throttle: Optional[Throttle] = None,
+              hash_algorithm: Optional[str] = None,
+              deletions: Optional[str] = None,
+              pipeline: Optional[AsyncPipeline] = None) -> dict:
+        """Body of backup(); see backup() for arguments and result"""
         self.reset_cancel()
+        self.directories = DirectoryCache()
 
-        include_extensions = include_extensions or []
-        exclude_extensions = exclude_extensions or []
+        if file_filter is None:
+            file_filter = FileFilter(include_extensions, exclude_extensions)
 
         # Validate directories
         if not os.path.exists(source_dir):
             return {"success": False, "error": "Source directory does not exist"}
 
+        if storage not in ("mirror", "snapshot", "dedup", "archive"):
+            return {"success": False, "error": f"Unknown storage type: {storage}"}
+
+        if hash_algorithm is not None:
+            try:
+                check_algorithm(hash_algorithm)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+
+        if deletions is not None and deletions not in DELETION_MODES:
+            return {"success": False, "error": f"Unknown deletion mode: {deletions}"}
+        if deletions is not None and storage != "mirror":
+            return {"success": False, "error": "Deletions are propagated only in mirror storage"}
+        if pipeline is not None and storage != "mirror":
+            return {"success": False, "error": "The async pipeline is available only in mirror storage"}
+
         # Create destination if it doesn't exist
         try:
             os.makedirs(destination_dir, exist_ok=True)
         except Exception as e:
             return {"success": False, "error": f"Cannot create destination directory: {e}"}
+        self.mtime_tolerance = self.measure_tolerance(destination_dir)
+
+        # Scan source tree once, streaming it into the copy stage
+        metrics = self.metrics
+        errors = self.error_list()
+        counts = {"skipped": 0}
+        self.reporter.start_phase("scan")
+        stream = ScanStream(self.iter_scan(source_dir, file_filter, errors, counts, metrics, pipeline))
 
-        # Count total files first
-        total_files = self.count_files(source_dir, include_extensions, exclude_extensions)
+        if self.cancelled:
+            return {
+                "success": False,
+                "error": "Backup cancelled by user",
+                "copied": 0,
+                "unchanged": 0,
+                "skipped": counts["skipped"]
+            }
 
-        if total_files == 0:
+        if stream.files == 0:
             return {"success": False, "error": "No files match the filter criteria"}
 
-        # Perform backup
-        copied_files = 0
-        skipped_files = 0
-        errors = []
+        # State of files from the previous run and of this run
+        store = None
+        index = None
+        archive = None
+        snapshot_dir = None
+        link_dir = None
+        previous_files = {}
+        if storage == "archive":
+            try:
+                archive = ArchiveWriter(destination_dir, compression, compression_level, volume_size,
+                                        hash_algorithm)
+            except Exception as e:
+                return {"success": False, "error": f"Cannot create archive: {e}"}
+            # Archive is a single sequential stream
+            workers = 1
+        elif storage == "dedup":
+            store = DedupStore(destination_dir)
+            try:
+                store.init()
+                previous_snapshot = store.load_snapshot()
+            except Exception as e:
+                return {"success": False, "error": f"Cannot open dedup store: {e}"}
+            previous_files = previous_snapshot.get("files", {})
+            # Hashes made with another algorithm cannot be carried over
+            if previous_snapshot.get("hash_algorithm") != hash_algorithm:
+                previous_files = {rel_path: {k: v for k, v in state.items() if k != "hash"}
+                                  for rel_path, state in previous_files.items()}
+        elif storage == "snapshot":
+            # Every snapshot is compared with the previous one directly, so no index is needed
+            try:
+                snapshots.init_snapshot_set(destination_dir)
+                link_dir = snapshots.snapshot_path(destination_dir)
+                snapshot_dir = snapshots.begin_snapshot(destination_dir)
+            except Exception as e:
+                return {"success": False, "error": f"Cannot create snapshot: {e}"}
+        elif incremental:
+            # Looked up file by file, the index is never loaded into memory
+            index = FileIndex(source_dir, destination_dir, self.index_dir)
+            try:
+                index.open()
+            except Exception as e:
+                errors.append(f"Failed to read file index: {e}")
+                index.close()
+                index = None
 
-        try:
-            for root, dirs, files in os.walk(source_dir):
-                if self.cancelled:
-                    return {
-                        "success": False,
-                        "error": "Backup cancelled by user",
-                        "copied": copied_files,
-                        "skipped": skipped_files
-                    }
-
-                for file in files:
-                    source_file = os.path.join(root, file)
-
-                    # Check if file matches filter
-                    if not self.should_include_file(source_file, include_extensions, exclude_extensions):
-                        skipped_files += 1
-                        continue
+        # Whole-run state is kept in memory only where the result format needs
+        # it: dedup snapshots and manifests list every file
+        current_files = {} if store is not None or hash_algorithm is not None else None
 
-                    # Calculate relative path and destination
-                    rel_path = os.path.relpath(source_file, source_dir)
-                    dest_file = os.path.join(destination_dir, rel_path)
+        # Files finished by an interrupted run are not copied again; every file
+        # finished by this run is journaled until the run completes
+        journal = None
+        resumed_files = {}
+        if archive is None:
+            journal = BackupJournal(source_dir, destination_dir, self.index_dir)
+            try:
+                resumed_files = journal.load()
+                journal.open()
+            except Exception as e:
+                errors.append(f"Failed to open backup journal: {e}")
+                journal = None
 
-                    # Create destination subdirectories
-                    os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+        # Counters are updated by worker threads under the lock
+        stats = {"copied": 0, "unchanged": 0, "resumed": 0, "failed": 0,
+                 "bytes_done": 0, "bytes_copied": 0, "bytes_written": 0}
+        copy_methods = {}
+        lock = threading.Lock()
 
-                    # Copy file
-                    try:
-                        shutil.copy2(source_file, dest_file)
-                        copied_files += 1
+        def process_file(entry: ScanEntry, previous: Optional[dict]) -> FileResult:
+            resumed = resumed_files.get(entry.rel_path)
+            if resumed is not None and self.is_resumed(
+                    entry, resumed, os.path.join(snapshot_dir or destination_dir, entry.rel_path)
+                    if store is None else None):
+                return FileResult("resumed", resumed)
+            if archive is not None:
+                return self.archive_file(entry, archive, throttle)
+            if store is not None:
+                return self.store_file(entry, store, incremental, previous, throttle, hash_algorithm)
+            if snapshot_dir is not None:
+                # Files in older snapshots share inodes with this one, so
+                # they are never updated in place by delta copies
+                return self.backup_file(entry, snapshot_dir, True, compare_hash, None, None, throttle,
+                                        hash_algorithm, link_dir)
+            return self.backup_file(entry, destination_dir, incremental, compare_hash,
+                                    previous, delta_threshold, throttle, hash_algorithm)
+
+        def record(done: List[Tuple[ScanEntry, FileResult, float]]):
+            for entry, result, _ in done:
+                if result.outcome != "error" and result.state is not None and index is not None:
+                    index.add(entry.rel_path, result.state)
+            # Counters of the whole batch are updated under one lock acquisition
+            with lock:
+                for entry, result, seconds in done:
+                    if result.outcome == "error":
+                        errors.append(result.error)
+                        stats["failed"] += 1
+                        continue
+                    if result.state is not None and current_files is not None:
+                        current_files[entry.rel_path] = result.state
+                    stats[result.outcome] += 1
+                    stats["bytes_done"] += entry.size
+                    if result.outcome == "copied":
+                        metrics.copy_seconds.observe(seconds)
+                        stats["bytes_copied"] += entry.size
+                        stats["bytes_written"] += result.bytes_written
+                    if result.method is not None:
+                        copy_methods[result.method] = copy_methods.get(result.method, 0) + 1
+                    self.report_progress(stats["copied"] + stats["unchanged"] + stats["resumed"], stream.files,
+                                         entry, stats["bytes_done"], stream.bytes)
+            if journal is not None:
+                for entry, result, _ in done:
+                    if result.outcome == "copied":
+                        journal.record(entry.rel_path, result.state)
 
-                        # Report progress
-                        if self.progress_callback:
-                            self.progress_callback(copied_files, total_files, file)
+        def process(batch: List[Tuple[ScanEntry, Optional[dict]]]):
+            done = []
+            for entry, previous in batch:
+                if throttle is not None:
+                    throttle.consume_file()
+                if self.cancelled:
+                    break
+                start = time.perf_counter()
+                result = process_file(entry, previous)
+                done.append((entry, result, time.perf_counter() - start))
+            record(done)
+
+        async def process_async(item: Tuple[ScanEntry, Optional[dict]]):
+            entry, previous = item
+            if throttle is not None:
+                await pipeline.call("copy", throttle.consume_file)
+            if self.cancelled:
+                return
+            start = time.perf_counter()
+            resumed = resumed_files.get(entry.rel_path)
+            if resumed is not None and await pipeline.call(
+                    "metadata", self.is_resumed, entry, resumed, os.path.join(destination_dir, entry.rel_path)):
+                result = FileResult("resumed", resumed)
+            else:
+                result = await self.backup_file_async(pipeline, entry, destination_dir, incremental, compare_hash,
+                                                      previous, delta_threshold, throttle, hash_algorithm)
+            await pipeline.write(record, [(entry, result, time.perf_counter() - start)])
 
-                    except Exception as e:
-                        errors.append(f"Failed to copy {source_file}: {e}")
-                        skipped_files += 1
+        if index is not None:
+            items = ((entry, index.get(entry.rel_path)) for entry in stream)
+        else:
+            items = ((entry, previous_files.get(entry.rel_path)) for entry in stream)
 
+        # Perform backup
+        self.reporter.start_phase("copy")
+        self.reporter.update(0, stream.files, 0, stream.bytes, force=True)
+        read_ahead_seconds = stream.seconds
+        copy_start = time.monotonic()
+        try:
+            if pipeline is not None:
+                pipeline.run(items, process_async, lambda: self.cancelled)
+            else:
+                self.run_parallel(small_file_batches(items, lambda item: item[0]), process, workers)
         except Exception as e:
+            if archive is not None:
+                archive.abort()
+            if journal is not None:
+                journal.close()
+            if index is not None:
+                index.close()
             return {
                 "success": False,
                 "error": f"Backup failed: {e}",
-                "copied": copied_files,
-                "skipped": skipped_files
+                "copied": stats["copied"],
+                "unchanged": stats["unchanged"],
+                "skipped": counts["skipped"] + stats["failed"]
             }
+        finally:
+            stream.close()
+            # Scanning interleaved with copying is counted as scan time only
+            copy_seconds = time.monotonic() - copy_start - (stream.seconds - read_ahead_seconds)
+            metrics.add_phase("scan", stream.seconds - metrics.phases.get("filter", 0.0), files=stream.files)
+            metrics.add_phase("copy", copy_seconds, files=stream.files, bytes=stream.bytes)
+        skipped_files = counts["skipped"] + stats["failed"]
+
+        if self.cancelled:
+            if archive is not None:
+                archive.abort()
+            if journal is not None:
+                journal.close()
+            # Remember files finished so far, so the next run does not copy them again
+            if index is not None:
+                try:
+                    index.commit(complete=False)
+                except Exception as e:
+                    errors.append(f"Failed to update file index: {e}")
+            result = {
+                "success": False,
+                "error": "Backup cancelled by user",
+                "copied": stats["copied"],
+                "unchanged": stats["unchanged"],
+                "skipped": skipped_files,
+                "errors": errors
+            }
+            errors.report(result)
+            return result
+
+        # Files from the previous run that no longer exist in the source
+        finalize_start = time.monotonic()
+        if index is not None:
+            deleted_files = sum(1 for rel_path in index.missing()
+                                if not os.path.exists(os.path.join(source_dir, rel_path)))
+        else:
+            deleted_files = sum(1 for rel_path in previous_files if rel_path not in current_files
+                                and not os.path.exists(os.path.join(source_dir, rel_path)))
+
+        snapshot_id = None
+        archive_info = None
+        if archive is not None:
+            try:
+                archive_info = archive.close()
+            except Exception as e:
+                archive.abort()
+                return {"success": False, "error": f"Failed to finish archive: {e}",
+                        "copied": stats["copied"], "unchanged": stats["unchanged"],
+                        "skipped": skipped_files}
+        elif snapshot_dir is not None:
+            if hash_algorithm is not None:
+                try:
+                    with metrics.phase("verify"):
+                        self.update_manifest(snapshot_dir, hash_algorithm, current_files, link_dir)
+                except Exception as e:
+                    errors.append(f"Failed to write manifest: {e}")
+            try:
+                snapshot_id = snapshots.commit_snapshot(snapshot_dir)
+            except Exception as e:
+                if journal is not None:
+                    journal.close()
+                return {"success": False, "error": f"Failed to finish snapshot: {e}",
+                        "copied": stats["copied"], "unchanged": stats["unchanged"],
+                        "skipped": skipped_files}
+        elif store is not None:
+            try:
+                snapshot_id = store.write_snapshot(source_dir, current_files, hash_algorithm)
+            except Exception as e:
+                if journal is not None:
+                    journal.close()
+                return {"success": False, "error": f"Failed to write snapshot: {e}",
+                        "copied": stats["copied"], "unchanged": stats["unchanged"],
+                        "skipped": skipped_files}
+        else:
+            if index is not None:
+                try:
+                    index.commit()
+                except Exception as e:
+                    errors.append(f"Failed to update file index: {e}")
+            if hash_algorithm is not None:
+                try:
+                    with metrics.phase("verify"):
+                        self.update_manifest(destination_dir, hash_algorithm, current_files)
+                except Exception as e:
+                    errors.append(f"Failed to write manifest: {e}")
+
+        # Only a run that copied everything may remove files from the mirror
+        extraneous = None
+        if deletions is not None:
+            if errors or stats["failed"]:
+                errors.append("Deleted source files were not removed from the destination "
+                              "because the backup had errors")
+            else:
+                extraneous = self.propagate_deletions(source_dir, destination_dir, file_filter, deletions)
+                if not extraneous["success"]:
+                    errors.append(extraneous["error"])
+                errors.extend(extraneous["errors"])
+                metrics.event("deletions", mode=deletions, files=extraneous.get("files", 0),
+                              bytes=extraneous.get("bytes", 0))
+
+        # Measured speed is the basis of plan() estimates
+        try:
+            self.history.record(source_dir, destination_dir, storage,
+                                stats["copied"] + stats["unchanged"] + stats["resumed"],
+                                stats["bytes_copied"], copy_seconds)
+        except OSError:
+            pass
+
+        # Run is complete; its journal is no longer needed
+        if journal is not None:
+            try:
+                journal.remove()
+            except OSError as e:
+                errors.append(f"Failed to remove backup journal: {e}")
+        metrics.add_phase("finalize", time.monotonic() - finalize_start - metrics.phases.get("verify", 0.0))
 
         # Generate report
         result = {
             "success": True,
-            "copied": copied_files,
+            "copied": stats["copied"],
+            "unchanged": stats["unchanged"],
+            "resumed": stats["resumed"],
+            "deleted": deleted_files,
             "skipped": skipped_files,
+            "total": stream.files,
+            "bytes_copied": stats["bytes_copied"],
+            "bytes_written": stats["bytes_written"],
+            "bytes_total": stream.bytes,
+            "copy_methods": copy_methods,
+            "errors": errors,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        errors.report(result)
+        if hash_algorithm is not None:
+            result["hash_algorithm"] = hash_algorithm
+        if extraneous is not None:
+            result["extraneous"] = extraneous
+        if snapshot_dir is not None:
+            result["snapshot"] = snapshot_id
+            result["linked"] = copy_methods.pop("hardlink", 0)
+            result["bytes_stored"] = stats["bytes_written"]
+        if store is not None:
+            result["snapshot"] = snapshot_id
+            result["bytes_stored"] = stats["bytes_written"]
+        if archive_info is not None:
+            result["archive"] = archive_info["name"]
+            result["volumes"] = archive_info["volumes"]
+            result["bytes_stored"] = archive_info["bytes_written"]
+
+        return result
+
+    def plan(self, source_dir: str, destination_dir: str,
+             include_extensions: List[str] = None,
+             exclude_extensions: List[str] = None,
+             incremental: bool = False,
+             storage: str = "mirror",
+             file_filter: Optional[FileFilter] = None,
+             throttle: Optional[Throttle] = None,
+             deletions: Optional[str] = None) -> dict:
+        """
+        Dry run: report what backup() would do, without writing anything
+
+        Only the scan and filter stages run; files are compared with the
+        previous run by size and mtime (content hashes are not computed).
+        The duration is estimated from copy speeds measured by earlier runs.
+
+        Args:
+            source_dir: Source directory to backup
+            destination_dir: Destination directory for backup
+            include_extensions: List of file extensions to include (None = all)
+            exclude_extensions: List of file extensions to exclude
+            incremental: Count unchanged files as skipped, like backup() would
+            storage: Storage type of the backup (see backup())
+            file_filter: Compiled filter rules (overrides include/exclude_extensions)
+            throttle: Rate limits the backup would run with (None = full speed)
+            deletions: Deletion mode of a mirror backup (None = keep deleted files)
+
+        Returns:
+            Dictionary with file counts and bytes to copy, totals per extension
+            and per top-level directory and the estimated duration in seconds
+            (None if no earlier run was measured)
+        """
+        self.reporter = ProgressReporter(self.progress_queue, self.progress_interval)
+        try:
+            return self.run_plan(source_dir, destination_dir, include_extensions, exclude_extensions,
+                                 incremental, storage, file_filter, throttle, deletions)
+        finally:
+            self.reporter.finish()
+
+    def run_plan(self, source_dir: str, destination_dir: str,
+                 include_extensions: List[str] = None,
+                 exclude_extensions: List[str] = None,
+                 incremental: bool = False,
+                 storage: str = "mirror",
+                 file_filter: Optional[FileFilter] = None,
+                 throttle: Optional[Throttle] = None,
+                 deletions: Optional[str] = None) -> dict:
+        """Body of plan(); see plan() for arguments and result"""
+        self.reset_cancel()
+
+        if file_filter is None:
+            file_filter = FileFilter(include_extensions, exclude_extensions)
+
+        if not os.path.exists(source_dir):
+            return {"success": False, "error": "Source directory does not exist"}
+        if storage not in ("mirror", "snapshot", "dedup", "archive"):
+            return {"success": False, "error": f"Unknown storage type: {storage}"}
+
+        self.reporter.start_phase("scan")
+        scan_start = time.monotonic()
+        errors = ErrorList()
+        counts = {"skipped": 0}
+        # A dry run writes nothing, not even a timestamp probe
+        self.mtime_tolerance = self.tolerances.get(os.path.realpath(destination_dir), 0)
+
+        # What the previous run left to compare with
+        previous_files = {}
+        index = None
+        compare_dir = None
+        if storage == "snapshot":
+            compare_dir = snapshots.snapshot_path(destination_dir) if snapshots.is_snapshot_set(destination_dir) else None
+        elif storage == "dedup" and incremental and DedupStore.is_store(destination_dir):
+            try:
+                previous_files = DedupStore(destination_dir).load_snapshot().get("files", {})
+            except Exception as e:
+                errors.append(f"Failed to read snapshot: {e}")
+        elif storage == "mirror" and incremental:
+            compare_dir = destination_dir
+            index = FileIndex(source_dir, destination_dir, self.index_dir)
+            try:
+                # A dry run does not create the index of a first backup
+                if os.path.exists(index.path):
+                    index.open()
+                else:
+                    index = None
+            except Exception as e:
+                errors.append(f"Failed to read file index: {e}")
+                index.close()
+                index = None
+
+        total_files = 0
+        total_bytes = 0
+        copy_files = 0
+        copy_bytes = 0
+        unchanged = 0
+        by_extension = {}
+        by_directory = {}
+        for entry in self.iter_scan(source_dir, file_filter, errors, counts):
+            if self.cancelled:
+                break
+            total_files += 1
+            total_bytes += entry.size
+            rel_path = entry.rel_path
+            previous = index.get(rel_path) if index is not None else previous_files.get(rel_path)
+            if storage == "dedup":
+                changed = not (previous is not None and previous.get("size") == entry.size
+                               and previous.get("mtime_ns") == entry.mtime_ns)
+            elif compare_dir is not None:
+                try:
+                    changed = not self.is_unchanged(entry, os.path.join(compare_dir, rel_path),
+                                                    previous, False)[0]
+                except OSError:
+                    changed = True
+            else:
+                changed = True
+            if changed:
+                copy_files += 1
+                copy_bytes += entry.size
+            else:
+                unchanged += 1
+
+            for totals, key in ((by_extension, file_suffix(entry.name) or "(none)"),
+                                (by_directory, entry.rel_dir.split(os.sep, 1)[0] if entry.rel_dir else ".")):
+                item = totals.setdefault(key, {"files": 0, "bytes": 0, "copy_files": 0, "copy_bytes": 0})
+                item["files"] += 1
+                item["bytes"] += entry.size
+                if changed:
+                    item["copy_files"] += 1
+                    item["copy_bytes"] += entry.size
+
+        # Largest directories first; a share with thousands of them stays readable
+        directories = sorted(by_directory.items(), key=lambda item: item[1]["bytes"], reverse=True)
+        if len(directories) > PLAN_DIRECTORY_LIMIT:
+            other = {"files": 0, "bytes": 0, "copy_files": 0, "copy_bytes": 0}
+            for _, item in directories[PLAN_DIRECTORY_LIMIT:]:
+                for key in other:
+                    other[key] += item[key]
+            directories = directories[:PLAN_DIRECTORY_LIMIT] + [("(other)", other)]
+
+        if self.cancelled:
+            if index is not None:
+                index.close()
+            return {"success": False, "error": "Planning cancelled by user"}
+
+        # Every scanned file exists, so a file of the previous run that does not was deleted
+        if index is not None:
+            deleted = sum(1 for rel_path in index.paths() if not os.path.exists(os.path.join(source_dir, rel_path)))
+            index.close()
+        else:
+            deleted = sum(1 for rel_path in previous_files if not os.path.exists(os.path.join(source_dir, rel_path)))
+        deletion_report = None
+        if deletions is not None and storage == "mirror" and os.path.isdir(destination_dir):
+            deletion_report = self.propagate_deletions(source_dir, destination_dir, file_filter,
+                                                       deletions, dry_run=True)
+            errors.extend(deletion_report["errors"])
+        scan_seconds = time.monotonic() - scan_start
+
+        # Estimate: measured cost per byte and per file, but never faster than the throttle allows
+        rates, basis = self.history.rates(source_dir, destination_dir, storage)
+        estimated_seconds = None
+        if rates is not None:
+            per_byte, per_file = rates
+            byte_seconds = copy_bytes * per_byte
+            file_seconds = total_files * per_file
+            if throttle is not None:
+                mb_per_second, files_per_second = throttle.current_limits()
+                if mb_per_second:
+                    byte_seconds = max(byte_seconds, copy_bytes / (mb_per_second * 1048576))
+                if files_per_second:
+                    file_seconds = max(file_seconds, total_files / files_per_second)
+            estimated_seconds = scan_seconds + byte_seconds + file_seconds
+
+        result = {
+            "success": True,
             "total": total_files,
+            "bytes_total": total_bytes,
+            "copy": copy_files,
+            "copy_bytes": copy_bytes,
+            "unchanged": unchanged,
+            "skipped": counts["skipped"],
+            "deleted": deleted,
+            "by_extension": dict(sorted(by_extension.items(), key=lambda item: item[1]["bytes"], reverse=True)),
+            "by_directory": dict(directories),
+            "scan_seconds": scan_seconds,
+            "estimated_seconds": estimated_seconds,
+            "estimate_basis": basis,
+            "errors": errors,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        errors.report(result)
+        if deletion_report is not None:
+            result["deletions"] = deletion_report
+        return result
+
+    def propagate_deletions(self, source_dir: str, destination_dir: str,
+                            file_filter: Optional[FileFilter] = None, mode: str = "delete",
+                            dry_run: bool = False) -> dict:
+        """
+        Remove mirror files whose source was deleted
+
+        Source and destination are walked as two sorted streams and merged,
+        so memory stays bounded for any tree size. Files excluded by the
+        filter are left alone. Quarantined files are moved to
+        QUARANTINE_DIR/<time stamp>/ in the destination instead of being
+        deleted; directories left empty are removed.
+
+        Args:
+            source_dir: Source directory of the mirror
+            destination_dir: Mirror destination
+            file_filter: Filter rules of the backup (None = all files)
+            mode: "delete" or "quarantine"
+            dry_run: Only report what would be removed
+
+        Returns:
+            Dictionary with the number and size of extraneous files and the
+            first DELETION_REPORT_LIMIT of their paths
+        """
+        if mode not in DELETION_MODES:
+            return {"success": False, "error": f"Unknown deletion mode: {mode}"}
+        if not os.path.isdir(source_dir) or not os.path.isdir(destination_dir):
+            return {"success": False, "error": "Source or destination directory does not exist"}
+
+        quarantine_dir = None
+        if mode == "quarantine":
+            quarantine_dir = os.path.join(destination_dir, QUARANTINE_DIR,
+                                          datetime.now().strftime("%Y%m%d-%H%M%S-%f"))
+        report = {
+            "success": True,
+            "mode": mode,
+            "dry_run": dry_run,
+            "files": 0,
+            "bytes": 0,
+            "paths": [],
+            "errors": []
+        }
+        if quarantine_dir is not None:
+            report["quarantine"] = quarantine_dir
+        touched_dirs = set()
+        try:
+            for rel_path, size in find_extraneous(
+                    source_dir, destination_dir, file_filter, report["errors"],
+                    skip_names=frozenset((QUARANTINE_DIR, MANIFEST_NAME, f"{MANIFEST_NAME}.tmp")),
+                    skip_suffixes=(TEMP_SUFFIX,)):
+                if self.cancelled:
+                    report.update(success=False, error="Cancelled by user")
+                    break
+                # Case-insensitive filesystems list the same file under another name
+                if os.path.isfile(os.path.join(source_dir, rel_path)):
+                    continue
+                if not dry_run:
+                    dest_file = os.path.join(destination_dir, rel_path)
+                    try:
+                        if quarantine_dir is not None:
+                            target = os.path.join(quarantine_dir, rel_path)
+                            os.makedirs(os.path.dirname(target), exist_ok=True)
+                            os.replace(dest_file, target)
+                        else:
+                            os.remove(dest_file)
+                    except OSError as e:
+                        report["errors"].append(f"Failed to remove {dest_file}: {e}")
+                        continue
+                    touched_dirs.add(os.path.dirname(rel_path))
+                report["files"] += 1
+                report["bytes"] += size
+                if len(report["paths"]) < DELETION_REPORT_LIMIT:
+                    report["paths"].append(rel_path)
+        except OSError as e:
+            report.update(success=False, error=f"Stopped removing deleted files: {e}")
+
+        # Remove directories emptied above, deepest first
+        for rel_dir in sorted(touched_dirs, key=lambda d: d.count(os.sep), reverse=True):
+            while rel_dir:
+                try:
+                    os.rmdir(os.path.join(destination_dir, rel_dir))
+                except OSError:
+                    break
+                rel_dir = os.path.dirname(rel_dir)
+        return report
+
+    def update_manifest(self, destination_dir: str, hash_algorithm: str, current_files: dict,
+                        previous_dir: Optional[str] = None):
+        """
+        Write the manifest of a mirror backup
+
+        Files copied by this run bring their own checksum; files left
+        unchanged keep the hash from the previous manifest if it was made
+        with the same algorithm and the size still matches.
+
+        Args:
+            destination_dir: Destination root of the backup
+            hash_algorithm: Algorithm of the checksums
+            current_files: State of every file backed up by this run
+            previous_dir: Directory holding the previous manifest (None = destination_dir)
+        """
+        old = {}
+        try:
+            manifest = load_manifest(previous_dir or destination_dir)
+            if manifest.get("algorithm") == hash_algorithm:
+                old = manifest.get("files", {})
+        except (OSError, ValueError):
+            pass
+
+        files = {}
+        for rel_path, state in current_files.items():
+            checksum = state.get("checksum")
+            if checksum is None:
+                previous = old.get(rel_path)
+                if previous is None or previous.get("size") != state["size"]:
+                    continue
+                checksum = previous["hash"]
+            files[rel_path] = {"size": state["size"], "hash": checksum}
+        write_manifest(destination_dir, hash_algorithm, files)
+
+    def restore(self, backup_dir: str, restore_dir: str,
+                overwrite: bool = True,
+                skip_identical: bool = True,
+                compare_hash: bool = False,
+                workers: int = 1,
+                snapshot: Optional[str] = None) -> dict:
+        """
+        Restore a backup into a directory
+
+        Works with all storage types: a mirrored tree or snapshot is copied
+        back, a dedup store snapshot is rebuilt from its chunks and an archive
+        is extracted by streaming through its volumes.
+
+        Args:
+            backup_dir: Backup directory (mirror, snapshot set, dedup store or folder with archives)
+            restore_dir: Directory to restore into
+            overwrite: Overwrite files that already exist in restore_dir
+            skip_identical: Do not rewrite existing files with the same size and mtime
+            compare_hash: Also compare content hashes of existing files (mirror only)
+            workers: Number of files restored concurrently (archives are always sequential)
+            snapshot: Snapshot id or archive name to restore (None = latest)
+
+        Returns:
+            Dictionary with restore statistics and the seconds spent in each
+            phase ("phases")
+        """
+        self.reporter = ProgressReporter(self.progress_queue, self.progress_interval)
+        self.metrics = self.telemetry.start("restore", self.run_labels(), backup=backup_dir,
+                                            destination=restore_dir, snapshot=snapshot, workers=workers)
+        result = {"success": False, "error": "Restore failed unexpectedly"}
+        try:
+            result = self.run_restore(
+                backup_dir=backup_dir,
+                restore_dir=restore_dir,
+                overwrite=overwrite,
+                skip_identical=skip_identical,
+                compare_hash=compare_hash,
+                workers=workers,
+                snapshot=snapshot
+            )
+        finally:
+            self.reporter.finish()
+            result["phases"] = self.metrics.finish(result)
+        return result
+
+    def run_restore(self, backup_dir: str, restore_dir: str,
+                    overwrite: bool = True,
+                    skip_identical: bool = True,
+                    compare_hash: bool = False,
+                    workers: int = 1,
+                    snapshot: Optional[str] = None) -> dict:
+        """Body of restore(); see restore() for arguments and result"""
+        self.reset_cancel()
+        self.directories = DirectoryCache()
+
+        if not os.path.exists(backup_dir):
+            return {"success": False, "error": "Backup directory does not exist"}
+
+        snapshot_id = None
+        if snapshots.is_snapshot_set(backup_dir):
+            backup_dir = snapshots.snapshot_path(backup_dir, snapshot)
+            if backup_dir is None:
+                return {"success": False, "error": f"Snapshot not found: {snapshot}" if snapshot
+                        else "Snapshot set has no complete snapshots"}
+            snapshot_id = os.path.basename(backup_dir)
+
+        try:
+            os.makedirs(restore_dir, exist_ok=True)
+        except Exception as e:
+            return {"success": False, "error": f"Cannot create restore directory: {e}"}
+        self.mtime_tolerance = self.measure_tolerance(restore_dir)
+
+        # Archives are a single compressed stream, extracted sequentially
+        if not DedupStore.is_store(backup_dir) and list_archives(backup_dir):
+            def archive_progress(current: int, total: int, filename: str):
+                self.reporter.update(current, total, 0, 0, filename)
+                self.notify_progress(current, total, filename)
+
+            self.reporter.start_phase("copy")
+            with self.metrics.phase("copy"):
+                return restore_archive(backup_dir, restore_dir, name=snapshot, overwrite=overwrite,
+                                       progress_callback=archive_progress, skip_identical=skip_identical,
+                                       mtime_tolerance=self.mtime_tolerance)
+
+        # Files to restore are streamed from the scan (or snapshot) into the copy stage
+        metrics = self.metrics
+        errors = self.error_list()
+        self.reporter.start_phase("scan")
+        store = None
+        snapshot_files = {}
+        if DedupStore.is_store(backup_dir):
+            store = DedupStore(backup_dir)
+            try:
+                snapshot_data = store.load_snapshot(snapshot)
+            except Exception as e:
+                return {"success": False, "error": f"Cannot read snapshot: {e}"}
+            if not snapshot_data:
+                return {"success": False, "error": "Store has no snapshots"}
+            snapshot_files = snapshot_data["files"]
+
+            def snapshot_entries() -> Iterator[ScanEntry]:
+                for rel_path, state in snapshot_files.items():
+                    metrics.file_sizes.observe(state["size"])
+                    rel_dir, name = os.path.split(rel_path)
+                    yield ScanEntry("", rel_dir, name, state["size"], state["mtime_ns"], 0)
+
+            stream = ScanStream(snapshot_entries())
+        else:
+            # Temporary files of interrupted copies are incomplete
+            stream = ScanStream(self.iter_scan(backup_dir, FileFilter(
+                exclude_patterns=[f"*{TEMP_SUFFIX}", MANIFEST_NAME, f"{MANIFEST_NAME}.tmp"],
+                exclude_dirs=[QUARANTINE_DIR]), errors, {}, metrics))
+
+        if self.cancelled:
+            return {"success": False, "error": "Restore cancelled by user"}
+        if stream.files == 0:
+            return {"success": False, "error": "No files in backup"}
+
+        stats = {"restored": 0, "unchanged": 0, "skipped": 0, "bytes_done": 0}
+        lock = threading.Lock()
+
+        def process_file(entry: ScanEntry) -> Tuple[str, Optional[str]]:
+            dest_dir = os.path.join(restore_dir, entry.rel_dir) if entry.rel_dir else restore_dir
+            dest_file = os.path.join(dest_dir, entry.name)
+            try:
+                self.directories.ensure(dest_dir)
+                try:
+                    dest_stat = os.stat(dest_file)
+                except FileNotFoundError:
+                    dest_stat = None
+
+                if dest_stat is not None and not overwrite:
+                    return "skipped", None
+                if (dest_stat is not None and skip_identical and dest_stat.st_size == entry.size
+                        and abs(dest_stat.st_mtime_ns - entry.mtime_ns) <= self.mtime_tolerance
+                        and (not compare_hash or store is not None
+                             or file_hash(entry.path) == file_hash(dest_file))):
+                    return "unchanged", None
+                if store is not None:
+                    store.restore_file(snapshot_files[entry.rel_path], dest_file)
+                elif entry.size <= SMALL_FILE_SIZE:
+                    copy_small_file(entry.path, dest_file)
+                else:
+                    copy_file(entry.path, dest_file)
+            except Exception as e:
+                return "skipped", f"{entry.rel_path}: {e}"
+            return "restored", None
+
+        def process(batch: List[ScanEntry]):
+            done = []
+            for entry in batch:
+                if self.cancelled:
+                    break
+                start = time.perf_counter()
+                outcome, error = process_file(entry)
+                done.append((entry, outcome, error, time.perf_counter() - start))
+            with lock:
+                for entry, outcome, error, seconds in done:
+                    if outcome == "restored":
+                        metrics.copy_seconds.observe(seconds)
+                    stats[outcome] += 1
+                    stats["bytes_done"] += entry.size
+                    if error:
+                        errors.append(error)
+                    self.report_progress(stats["restored"] + stats["unchanged"] + stats["skipped"],
+                                         stream.files, entry, stats["bytes_done"], stream.bytes)
+
+        self.reporter.start_phase("copy")
+        self.reporter.update(0, stream.files, 0, stream.bytes, force=True)
+        read_ahead_seconds = stream.seconds
+        copy_start = time.monotonic()
+        try:
+            self.run_parallel(small_file_batches(stream), process, workers)
+        except Exception as e:
+            return {"success": False, "error": f"Restore failed: {e}",
+                    "restored": stats["restored"], "unchanged": stats["unchanged"],
+                    "skipped": stats["skipped"]}
+        finally:
+            stream.close()
+            metrics.add_phase("scan", stream.seconds - metrics.phases.get("filter", 0.0), files=stream.files)
+            metrics.add_phase("copy", time.monotonic() - copy_start - (stream.seconds - read_ahead_seconds),
+                              files=stream.files, bytes=stream.bytes)
+
+        if self.cancelled:
+            return {"success": False, "error": "Restore cancelled by user",
+                    "restored": stats["restored"], "unchanged": stats["unchanged"],
+                    "skipped": stats["skipped"]}
+
+        result = {
+            "success": True,
+            "restored": stats["restored"],
+            "unchanged": stats["unchanged"],
+            "skipped": stats["skipped"],
+            "total": stream.files,
             "errors": errors,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
+        if store is not None:
+            result["snapshot"] = snapshot_data["id"]
+        elif snapshot_id is not None:
+            result["snapshot"] = snapshot_id
+        errors.report(result)
+        return result
+
+    def verify(self, backup_dir: str, workers: int = 1, snapshot: Optional[str] = None) -> dict:
+        """
+        Re-check a backup against the hashes recorded when it was made
+
+        A mirror is checked against its manifest, a dedup snapshot chunk by
+        chunk (and against whole-file hashes when the snapshot has them) and
+        an archive by streaming through it.
+
+        Args:
+            backup_dir: Backup directory (mirror, snapshot set, dedup store or folder with archives)
+            workers: Number of files hashed concurrently (archives are always sequential)
+            snapshot: Snapshot id or archive name to verify (None = latest)
 
+        Returns:
+            Dictionary with verification statistics; "valid" is True only if
+            every file was found and matched its hash
+        """
+        self.reporter = ProgressReporter(self.progress_queue, self.progress_interval)
+        self.metrics = self.telemetry.start("verify", self.run_labels(), backup=backup_dir,
+                                            snapshot=snapshot, workers=workers)
+        result = {"success": False, "error": "Verification failed unexpectedly"}
+        try:
+            result = self.run_verify(backup_dir, workers, snapshot)
+        finally:
+            self.reporter.finish()
+            result["phases"] = self.metrics.finish(result)
+        if result["success"]:
+            result.setdefault("errors", [])
+            result["valid"] = not (result["mismatched"] or result["missing"] or result["errors"])
+            result["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return result
+
+    def run_verify(self, backup_dir: str, workers: int = 1, snapshot: Optional[str] = None) -> dict:
+        """Body of verify(); see verify() for arguments and result"""
+        self.reset_cancel()
+
+        if not os.path.isdir(backup_dir):
+            return {"success": False, "error": "Backup directory does not exist"}
+
+        self.reporter.start_phase("verify")
+        result = {}
+        if snapshots.is_snapshot_set(backup_dir):
+            backup_dir = snapshots.snapshot_path(backup_dir, snapshot)
+            if backup_dir is None:
+                return {"success": False, "error": f"Snapshot not found: {snapshot}" if snapshot
+                        else "Snapshot set has no complete snapshots"}
+            result["snapshot"] = os.path.basename(backup_dir)
+
+        if DedupStore.is_store(backup_dir):
+            store = DedupStore(backup_dir)
+            try:
+                snapshot_data = store.load_snapshot(snapshot)
+            except Exception as e:
+                return {"success": False, "error": f"Cannot read snapshot: {e}"}
+            if not snapshot_data:
+                return {"success": False, "error": "Store has no snapshots"}
+            algorithm = snapshot_data.get("hash_algorithm")
+            if algorithm:
+                try:
+                    check_algorithm(algorithm)
+                except ValueError as e:
+                    return {"success": False, "error": str(e)}
+            files = snapshot_data["files"]
+            result["snapshot"] = snapshot_data.get("id")
+
+            def check(rel_path: str, state: dict) -> Optional[str]:
+                return store.verify_file(state, algorithm)
+
+        elif os.path.exists(os.path.join(backup_dir, MANIFEST_NAME)):
+            try:
+                manifest = load_manifest(backup_dir)
+                algorithm = manifest["algorithm"]
+                check_algorithm(algorithm)
+            except Exception as e:
+                return {"success": False, "error": f"Cannot read manifest: {e}"}
+            files = manifest.get("files", {})
+
+            def check(rel_path: str, state: dict) -> Optional[str]:
+                try:
+                    digest = hash_file(os.path.join(backup_dir, rel_path), algorithm)
+                except FileNotFoundError:
+                    return "missing"
+                return None if digest == state["hash"] else "hash mismatch"
+
+        elif list_archives(backup_dir):
+            def archive_progress(current: int, total: int, filename: str):
+                self.reporter.update(current, total, 0, 0, filename)
+                self.notify_progress(current, total, filename)
+
+            with self.metrics.phase("verify"):
+                return verify_archive(backup_dir, snapshot, progress_callback=archive_progress)
+
+        else:
+            return {"success": False, "error": "No manifest found (backup was made without hashes)"}
+
+        total_files = len(files)
+        total_bytes = sum(state.get("size", 0) for state in files.values())
+        stats = {"verified": 0, "bytes_done": 0}
+        mismatched = []
+        missing = []
+        errors = []
+        lock = threading.Lock()
+
+        def process(item: Tuple[str, dict]):
+            rel_path, state = item
+            start = time.perf_counter()
+            try:
+                problem = check(rel_path, state)
+            except Exception as e:
+                problem = f"error: {e}"
+            seconds = time.perf_counter() - start
+            if problem is not None:
+                self.metrics.error(f"{rel_path}: {problem}")
+            with lock:
+                self.metrics.file_sizes.observe(state.get("size", 0))
+                self.metrics.copy_seconds.observe(seconds)
+                if problem is None:
+                    stats["verified"] += 1
+                elif problem == "missing":
+                    missing.append(rel_path)
+                elif problem.startswith("error: "):
+                    errors.append(f"{rel_path}: {problem[7:]}")
+                else:
+                    mismatched.append(rel_path)
+                    errors.append(f"{rel_path}: {problem}")
+                stats["bytes_done"] += state.get("size", 0)
+                done = stats["verified"] + len(mismatched) + len(missing)
+                self.reporter.update(done, total_files, stats["bytes_done"], total_bytes, rel_path)
+                self.notify_progress(done, total_files, os.path.basename(rel_path),
+                                     stats["bytes_done"], total_bytes)
+
+        try:
+            with self.metrics.phase("verify", files=total_files, bytes=total_bytes):
+                self.run_parallel(list(files.items()), process, workers)
+        except Exception as e:
+            return {"success": False, "error": f"Verification failed: {e}"}
+
+        if self.cancelled:
+            return {"success": False, "error": "Verification cancelled by user"}
+
+        result.update({
+            "success": True,
+            "algorithm": algorithm,
+            "verified": stats["verified"],
+            "mismatched": sorted(mismatched),
+            "missing": sorted(missing),
+            "errors": errors,
+            "total": total_files
+        })
+        return result
+
+    def prune(self, backup_dir: str, retention: RetentionPolicy) -> dict:
+        """
+        Delete backup versions not kept by a retention policy
+
+        Works on snapshot sets, dedup stores (chunks no longer referenced by
+        any snapshot are deleted as well) and folders with archives. Must not
+        run while a backup is writing to the same backup_dir.
+
+        Args:
+            backup_dir: Backup directory holding several versions
+            retention: Which versions to keep
+
+        Returns:
+            Dictionary with kept and removed version names and bytes freed
+        """
+        if retention.empty:
+            return {"success": False, "error": "Retention policy keeps everything"}
+
+        store = None
+        if snapshots.is_snapshot_set(backup_dir):
+            versions = snapshots.list_snapshots(backup_dir)
+        elif DedupStore.is_store(backup_dir):
+            store = DedupStore(backup_dir)
+            versions = store.list_snapshots()
+        elif list_archives(backup_dir):
+            versions = list_archives(backup_dir)
+        else:
+            return {"success": False, "error": "Backup has no versions to prune (mirror storage keeps one copy)"}
+
+        # Versions without a recognizable time stamp are never deleted
+        times = {}
+        for name in versions:
+            created = parse_timestamp(name)
+            if created is not None:
+                times[name] = created
+        keep = select_to_keep(times, retention) | (set(versions) - set(times))
+
+        removed = []
+        errors = []
+        bytes_freed = 0
+        for name in versions:
+            if name in keep:
+                continue
+            try:
+                if store is not None:
+                    # Space is freed by the garbage collection below
+                    store.delete_snapshot(name)
+                elif snapshots.is_snapshot_set(backup_dir):
+                    bytes_freed += snapshots.delete_snapshot(backup_dir, name)
+                else:
+                    bytes_freed += delete_archive(backup_dir, name)
+                removed.append(name)
+            except Exception as e:
+                errors.append(f"Failed to delete {name}: {e}")
+
+        result = {
+            "success": True,
+            "kept": [name for name in versions if name in keep],
+            "removed": removed,
+            "bytes_freed": bytes_freed,
+            "errors": errors,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if store is not None and removed:
+            try:
+                result["chunks_removed"], freed = store.collect_garbage()
+                result["bytes_freed"] += freed
+            except Exception as e:
+                errors.append(f"Failed to delete unreferenced chunks: {e}")
         return result
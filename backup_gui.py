@@ -4,32 +4,23 @@ Backup GUI - Modern CustomTkinter interface (Srpski jezik)
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import threading
-import json
+import queue
 import os
 from backup_engine import BackupEngine
+from file_filter import FileFilter
+from dedup_store import DedupStore
+from archive import list_archives, COMPRESSIONS
 from scheduler import BackupScheduler
+from throttle import make_throttle
+from integrity import HASH_ALGORITHMS
+from retention import parse_retention
+import snapshots
+from settings import (ucitaj_podesavanja, sacuvaj_podesavanja, parsiraj_ekstenzije, parsiraj_foldere,
+                      parsiraj_broj_niti, parsiraj_velicinu_volumena, parsiraj_minute,
+                      parsiraj_ogranicenje, parsiraj_kontrolnu_sumu, TIPOVI_RASPOREDA, NACINI_BRISANJA)
 
-SETTINGS_FILE = "podesavanja.json"
-
-
-def ucitaj_podesavanja():
-    """Ucitaj poslednja podesavanja iz fajla"""
-    if os.path.exists(SETTINGS_FILE):
-        try:
-            with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {}
-
-
-def sacuvaj_podesavanja(data: dict):
-    """Sacuvaj podesavanja u fajl"""
-    try:
-        with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Greska pri cuvanju podesavanja: {e}")
+NAJNOVIJI_SNAPSHOT = "(najnoviji)"
+BEZ_KONTROLNE_SUME = "bez"
 
 
 class BackupGUI:
@@ -41,8 +32,15 @@ class BackupGUI:
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
 
-        self.backup_engine = BackupEngine(progress_callback=self.azuriraj_progres)
-        self.scheduler = BackupScheduler(self.backup_engine)
+        # Engine salje snimke napretka kroz red; GUI ih preuzima iz glavne niti
+        self.red_progresa = queue.Queue()
+        self.backup_engine = BackupEngine(progress_queue=self.red_progresa)
+        self.red_progresa_restore = queue.Queue()
+        # Radne niti ne diraju prozor; dnevnik, dijalozi i zavrsetak procene
+        # idu kroz ovaj red i izvrsavaju se u glavnoj niti
+        self.red_poziva = queue.Queue()
+        self.restore_engine = BackupEngine(progress_queue=self.red_progresa_restore)
+        self.scheduler = BackupScheduler()
         self.backup_thread = None
 
         # Varijable
@@ -50,15 +48,29 @@ class BackupGUI:
         self.odredisni_folder = ctk.StringVar()
         self.ukljuci_ext = ctk.StringVar()
         self.iskljuci_ext = ctk.StringVar()
+        self.iskljuci_foldere = ctk.StringVar()
+        self.inkrementalni = ctk.BooleanVar(value=False)
+        self.broj_niti = ctk.StringVar(value="4")
+        self.nacin_cuvanja = ctk.StringVar(value="mirror")
+        self.kompresija = ctk.StringVar(value="gz")
+        self.velicina_volumena = ctk.StringVar(value="")
+        self.ogranicenje_mb_s = ctk.StringVar(value="")
+        self.profil_ogranicenja = ctk.StringVar(value="")
+        self.kontrolna_suma = ctk.StringVar(value=BEZ_KONTROLNE_SUME)
+        self.zadrzavanje = ctk.StringVar(value="")
+        self.brisanje_viska = ctk.StringVar(value="zadrzi")
         self.raspored_ukljucen = ctk.BooleanVar(value=False)
         self.tip_rasporeda = ctk.StringVar(value="dnevno")
         self.vreme_rasporeda = ctk.StringVar(value="12:00")
+        self.cron_izraz = ctk.StringVar(value="")
+        self.rasipanje_minuta = ctk.StringVar(value="0")
 
         # Ucitaj poslednja podesavanja
         self.ucitaj_prethodna_podesavanja()
 
         self.kreiraj_widgete()
         self.provjeri_raspored()
+        self.obradi_progres()
 
     def ucitaj_prethodna_podesavanja(self):
         """Ucitaj podesavanja i popuni varijable"""
@@ -71,10 +83,36 @@ class BackupGUI:
             self.ukljuci_ext.set(p["ukljuci_ext"])
         if p.get("iskljuci_ext"):
             self.iskljuci_ext.set(p["iskljuci_ext"])
+        if p.get("iskljuci_foldere"):
+            self.iskljuci_foldere.set(p["iskljuci_foldere"])
+        if p.get("inkrementalni") is not None:
+            self.inkrementalni.set(p["inkrementalni"])
+        if p.get("broj_niti"):
+            self.broj_niti.set(p["broj_niti"])
+        if p.get("nacin_cuvanja"):
+            self.nacin_cuvanja.set(p["nacin_cuvanja"])
+        if p.get("kompresija"):
+            self.kompresija.set(p["kompresija"])
+        if p.get("velicina_volumena"):
+            self.velicina_volumena.set(p["velicina_volumena"])
+        if p.get("ogranicenje_mb_s"):
+            self.ogranicenje_mb_s.set(p["ogranicenje_mb_s"])
+        if p.get("profil_ogranicenja"):
+            self.profil_ogranicenja.set(p["profil_ogranicenja"])
+        if p.get("kontrolna_suma"):
+            self.kontrolna_suma.set(p["kontrolna_suma"])
+        if p.get("zadrzavanje"):
+            self.zadrzavanje.set(p["zadrzavanje"])
+        if p.get("brisanje_viska") in NACINI_BRISANJA:
+            self.brisanje_viska.set(p["brisanje_viska"])
         if p.get("tip_rasporeda"):
             self.tip_rasporeda.set(p["tip_rasporeda"])
         if p.get("vreme_rasporeda"):
             self.vreme_rasporeda.set(p["vreme_rasporeda"])
+        if p.get("cron_izraz"):
+            self.cron_izraz.set(p["cron_izraz"])
+        if p.get("rasipanje_minuta"):
+            self.rasipanje_minuta.set(p["rasipanje_minuta"])
         if p.get("raspored_ukljucen") is not None:
             self.raspored_ukljucen.set(p["raspored_ukljucen"])
 
@@ -85,8 +123,21 @@ class BackupGUI:
             "odredisni_folder": self.odredisni_folder.get(),
             "ukljuci_ext": self.ukljuci_ext.get(),
             "iskljuci_ext": self.iskljuci_ext.get(),
+            "iskljuci_foldere": self.iskljuci_foldere.get(),
+            "inkrementalni": self.inkrementalni.get(),
+            "broj_niti": self.broj_niti.get(),
+            "nacin_cuvanja": self.nacin_cuvanja.get(),
+            "kompresija": self.kompresija.get(),
+            "velicina_volumena": self.velicina_volumena.get(),
+            "ogranicenje_mb_s": self.ogranicenje_mb_s.get(),
+            "profil_ogranicenja": self.profil_ogranicenja.get(),
+            "kontrolna_suma": self.kontrolna_suma.get(),
+            "zadrzavanje": self.zadrzavanje.get(),
+            "brisanje_viska": self.brisanje_viska.get(),
             "tip_rasporeda": self.tip_rasporeda.get(),
             "vreme_rasporeda": self.vreme_rasporeda.get(),
+            "cron_izraz": self.cron_izraz.get(),
+            "rasipanje_minuta": self.rasipanje_minuta.get(),
             "raspored_ukljucen": self.raspored_ukljucen.get(),
         })
 
@@ -146,6 +197,63 @@ class BackupGUI:
         ctk.CTkLabel(red_iskljuci, text="Isključi ekstenzije:", width=160).pack(side="left")
         ctk.CTkEntry(red_iskljuci, textvariable=self.iskljuci_ext, placeholder_text=".tmp, .log").pack(side="left", fill="x", expand=True)
 
+        red_foldere = ctk.CTkFrame(okvir_filteri)
+        red_foldere.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(red_foldere, text="Isključi foldere:", width=160).pack(side="left")
+        ctk.CTkEntry(red_foldere, textvariable=self.iskljuci_foldere, placeholder_text="node_modules, .git, *.cache").pack(side="left", fill="x", expand=True)
+
+        ctk.CTkCheckBox(
+            okvir_filteri,
+            text="Inkrementalni backup (kopiraj samo nove i izmenjene fajlove)",
+            variable=self.inkrementalni
+        ).pack(anchor="w", padx=10, pady=(0, 4))
+
+        red_niti = ctk.CTkFrame(okvir_filteri)
+        red_niti.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(red_niti, text="Paralelno kopiranje (niti):", width=160).pack(side="left")
+        ctk.CTkEntry(red_niti, textvariable=self.broj_niti, width=60).pack(side="left")
+
+        red_cuvanje = ctk.CTkFrame(okvir_filteri)
+        red_cuvanje.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(red_cuvanje, text="Način čuvanja:", width=160).pack(side="left")
+        ctk.CTkRadioButton(red_cuvanje, text="Kopija foldera", variable=self.nacin_cuvanja, value="mirror").pack(side="left", padx=5)
+        ctk.CTkRadioButton(red_cuvanje, text="Snapshot-ovi", variable=self.nacin_cuvanja, value="snapshot").pack(side="left", padx=5)
+        ctk.CTkRadioButton(red_cuvanje, text="Deduplikovano skladište", variable=self.nacin_cuvanja, value="dedup").pack(side="left", padx=5)
+        ctk.CTkRadioButton(red_cuvanje, text="Arhiva (tar)", variable=self.nacin_cuvanja, value="archive").pack(side="left", padx=5)
+
+        red_brisanje = ctk.CTkFrame(okvir_filteri)
+        red_brisanje.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(red_brisanje, text="Obrisano u izvoru:", width=160).pack(side="left")
+        ctk.CTkRadioButton(red_brisanje, text="Zadrži", variable=self.brisanje_viska, value="zadrzi").pack(side="left", padx=5)
+        ctk.CTkRadioButton(red_brisanje, text="Obriši", variable=self.brisanje_viska, value="obrisi").pack(side="left", padx=5)
+        ctk.CTkRadioButton(red_brisanje, text="Premesti u karantin", variable=self.brisanje_viska, value="karantin").pack(side="left", padx=5)
+        ctk.CTkButton(red_brisanje, text="Pregled brisanja", width=130,
+                      command=self.pokreni_pregled_brisanja).pack(side="left", padx=(16, 0))
+
+        red_arhiva = ctk.CTkFrame(okvir_filteri)
+        red_arhiva.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(red_arhiva, text="Kompresija arhive:", width=160).pack(side="left")
+        ctk.CTkOptionMenu(red_arhiva, variable=self.kompresija, values=list(COMPRESSIONS), width=90).pack(side="left")
+        ctk.CTkLabel(red_arhiva, text="Volumen (MB):", width=100).pack(side="left", padx=(16, 4))
+        ctk.CTkEntry(red_arhiva, textvariable=self.velicina_volumena, width=80, placeholder_text="bez deljenja").pack(side="left")
+
+        red_ogranicenje = ctk.CTkFrame(okvir_filteri)
+        red_ogranicenje.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(red_ogranicenje, text="Ograničenje (MB/s):", width=160).pack(side="left")
+        ctk.CTkEntry(red_ogranicenje, textvariable=self.ogranicenje_mb_s, width=80, placeholder_text="bez").pack(side="left")
+        ctk.CTkLabel(red_ogranicenje, text="Po dobu dana:", width=100).pack(side="left", padx=(16, 4))
+        ctk.CTkEntry(red_ogranicenje, textvariable=self.profil_ogranicenja,
+                     placeholder_text="08:00-18:00=20; 18:00-22:00=50").pack(side="left", fill="x", expand=True)
+
+        red_kontrola = ctk.CTkFrame(okvir_filteri)
+        red_kontrola.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(red_kontrola, text="Kontrolna suma:", width=160).pack(side="left")
+        ctk.CTkOptionMenu(red_kontrola, variable=self.kontrolna_suma,
+                          values=[BEZ_KONTROLNE_SUME] + list(HASH_ALGORITHMS), width=110).pack(side="left")
+        ctk.CTkLabel(red_kontrola, text="Zadržavanje:", width=100).pack(side="left", padx=(16, 4))
+        ctk.CTkEntry(red_kontrola, textvariable=self.zadrzavanje,
+                     placeholder_text="daily=7, weekly=4, monthly=12").pack(side="left", fill="x", expand=True)
+
         # Raspored
         okvir_raspored = ctk.CTkFrame(tab)
         okvir_raspored.pack(fill="x", pady=4)
@@ -168,9 +276,19 @@ class BackupGUI:
         ctk.CTkLabel(self.okvir_raspored_config, text="Vreme:", width=55).pack(side="left", padx=(16, 4))
         ctk.CTkEntry(self.okvir_raspored_config, textvariable=self.vreme_rasporeda, width=80, placeholder_text="SS:MM").pack(side="left")
 
+        self.okvir_raspored_cron = ctk.CTkFrame(okvir_raspored)
+        self.okvir_raspored_cron.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(self.okvir_raspored_cron, text="Cron:", width=90).pack(side="left", padx=(0, 4))
+        ctk.CTkEntry(self.okvir_raspored_cron, textvariable=self.cron_izraz, width=200,
+                     placeholder_text="npr. 30 2 * * mon-fri").pack(side="left")
+        ctk.CTkLabel(self.okvir_raspored_cron, text="(zamenjuje učestalost i vreme)").pack(side="left", padx=6)
+        ctk.CTkLabel(self.okvir_raspored_cron, text="Rasipanje (min):").pack(side="left", padx=(16, 4))
+        ctk.CTkEntry(self.okvir_raspored_cron, textvariable=self.rasipanje_minuta, width=60).pack(side="left")
+
         # Sakrij config ako nije ukljucen
         if not self.raspored_ukljucen.get():
             self.okvir_raspored_config.pack_forget()
+            self.okvir_raspored_cron.pack_forget()
 
         # Progres
         okvir_progres = ctk.CTkFrame(tab)
@@ -201,6 +319,13 @@ class BackupGUI:
             state="disabled"
         )
         self.dugme_otkazivanje.pack(side="left", padx=5)
+        self.dugme_procena = ctk.CTkButton(
+            okvir_dugmici, text="📊  Procena",
+            command=self.pokreni_procenu,
+            width=150, height=40,
+            font=ctk.CTkFont(size=14, weight="bold")
+        )
+        self.dugme_procena.pack(side="left", padx=5)
 
         # Log
         okvir_log = ctk.CTkFrame(tab)
@@ -229,6 +354,15 @@ class BackupGUI:
         ctk.CTkEntry(red, textvariable=self.restore_izvor).pack(side="left", fill="x", expand=True, padx=(0, 6))
         ctk.CTkButton(red, text="Pregledaj", command=self.odaberi_restore_izvor, width=100).pack(side="left")
 
+        # Izbor snapshot-a kada je folder deduplikovano skladiste
+        red_snapshot = ctk.CTkFrame(okvir_backup_folder)
+        red_snapshot.pack(fill="x", padx=10, pady=(0, 8))
+        ctk.CTkLabel(red_snapshot, text="Snapshot:", width=90).pack(side="left")
+        self.restore_snapshot = ctk.StringVar(value=NAJNOVIJI_SNAPSHOT)
+        self.meni_snapshot = ctk.CTkOptionMenu(red_snapshot, variable=self.restore_snapshot, values=[NAJNOVIJI_SNAPSHOT])
+        self.meni_snapshot.pack(side="left")
+        self.restore_izvor.trace_add("write", lambda *_: self.osvezi_snapshote())
+
         # Folder za obnavljanje (odrediste)
         okvir_restore_odrediste = ctk.CTkFrame(tab)
         okvir_restore_odrediste.pack(fill="x", pady=4)
@@ -248,6 +382,12 @@ class BackupGUI:
             okvir_opcije,
             text="Prepiši postojeće fajlove",
             variable=self.prepisati_postojece
+        ).pack(anchor="w", padx=10, pady=(0, 4))
+        self.preskoci_identicne = ctk.BooleanVar(value=True)
+        ctk.CTkCheckBox(
+            okvir_opcije,
+            text="Preskoči identične fajlove (ista veličina i vreme izmene)",
+            variable=self.preskoci_identicne
         ).pack(anchor="w", padx=10, pady=(0, 8))
 
         # Progres restore
@@ -271,6 +411,13 @@ class BackupGUI:
             fg_color="#1a7a4a", hover_color="#145c38"
         )
         self.dugme_restore.pack(side="left", padx=10)
+        self.dugme_provera = ctk.CTkButton(
+            okvir_dugme_r, text="🔍  Proveri backup",
+            command=self.pokreni_proveru,
+            width=180, height=40,
+            font=ctk.CTkFont(size=14, weight="bold")
+        )
+        self.dugme_provera.pack(side="left", padx=10)
 
         # Log restore
         okvir_log_r = ctk.CTkFrame(tab)
@@ -285,8 +432,10 @@ class BackupGUI:
     def toggle_raspored(self):
         if self.raspored_ukljucen.get():
             self.okvir_raspored_config.pack(fill="x", padx=10, pady=(0, 8))
+            self.okvir_raspored_cron.pack(fill="x", padx=10, pady=(0, 8))
         else:
             self.okvir_raspored_config.pack_forget()
+            self.okvir_raspored_cron.pack_forget()
 
     def odaberi_izvor(self):
         folder = filedialog.askdirectory(title="Izaberite izvorni folder")
@@ -299,20 +448,105 @@ class BackupGUI:
             self.odredisni_folder.set(folder)
 
     def parsiraj_ekstenzije(self, tekst: str):
-        if not tekst.strip():
-            return []
-        ext = [e.strip() for e in tekst.split(",") if e.strip()]
-        return [e if e.startswith('.') else f'.{e}' for e in ext]
+        return parsiraj_ekstenzije(tekst)
+
+    def parsiraj_foldere(self, tekst: str):
+        return parsiraj_foldere(tekst)
+
+    def parsiraj_broj_niti(self) -> int:
+        return parsiraj_broj_niti(self.broj_niti.get())
+
+    def parsiraj_velicinu_volumena(self):
+        return parsiraj_velicinu_volumena(self.velicina_volumena.get())
+
+    def napravi_ogranicenje(self):
+        """Ogranicenje brzine iz polja forme (None = puna brzina)"""
+        return make_throttle(parsiraj_ogranicenje(self.ogranicenje_mb_s.get()), None,
+                             self.profil_ogranicenja.get().strip() or None)
+
+    def u_glavnoj_niti(self, funkcija, *argumenti):
+        """Zakazi poziv koji dira prozor; izvrsava ga obradi_progres u glavnoj niti"""
+        self.red_poziva.put((funkcija, argumenti))
+
+    def izvrsi_pozive(self):
+        """Izvrsi pozive iz red_poziva redom kojim su zakazani"""
+        try:
+            while True:
+                funkcija, argumenti = self.red_poziva.get_nowait()
+                funkcija(*argumenti)
+        except queue.Empty:
+            pass
+
+    def upisi_u_dnevnik(self, tekst_log, poruka: str):
+        tekst_log.insert("end", f"{poruka}\n")
+        tekst_log.see("end")
 
     def log(self, poruka: str):
-        self.tekst_log.insert("end", f"{poruka}\n")
-        self.tekst_log.see("end")
+        self.u_glavnoj_niti(self.upisi_u_dnevnik, self.tekst_log, poruka)
+
+    def azuriraj_progres(self, snimak):
+        if snimak.phase == "scan":
+            self.traka_napretka.set(0)
+            self.labela_napretka.configure(text=f"Skeniranje: pronađeno {snimak.files_done} fajlova")
+            return
+        if snimak.phase == "done":
+            self.traka_napretka.set(1 if snimak.files_total else 0)
+            self.labela_napretka.configure(
+                text=f"Završeno: {snimak.files_done}/{snimak.files_total} fajlova, "
+                     f"{snimak.bytes_done / 1048576:.1f} MB"
+            )
+            return
 
-    def azuriraj_progres(self, trenutno: int, ukupno: int, ime_fajla: str):
-        progres = trenutno / ukupno if ukupno > 0 else 0
+        if snimak.bytes_total > 0:
+            progres = snimak.bytes_done / snimak.bytes_total
+        else:
+            progres = snimak.files_done / snimak.files_total if snimak.files_total > 0 else 0
         self.traka_napretka.set(progres)
-        self.labela_napretka.configure(text=f"Kopiranje: {ime_fajla} ({trenutno}/{ukupno})")
-        self.root.update_idletasks()
+
+        tekst = (f"Kopiranje: {snimak.files_done}/{snimak.files_total} fajlova, "
+                 f"{snimak.bytes_done / 1048576:.1f}/{snimak.bytes_total / 1048576:.1f} MB "
+                 f"({snimak.throughput / 1048576:.1f} MB/s")
+        if snimak.eta is not None:
+            tekst += f", još {int(snimak.eta) // 60}:{int(snimak.eta) % 60:02d}"
+        self.labela_napretka.configure(text=tekst + ")")
+
+    def preuzmi_snimke(self, red: queue.Queue):
+        """Isprazni red napretka; vraca (poslednji snimak, da li je operacija zavrsena)"""
+        poslednji = None
+        zavrseno = False
+        try:
+            while True:
+                snimak = red.get_nowait()
+                if snimak is None:
+                    zavrseno = True
+                else:
+                    poslednji = snimak
+        except queue.Empty:
+            pass
+        return poslednji, zavrseno
+
+    def obradi_progres(self):
+        """Preuzmi snimke napretka iz redova (poziva se iz glavne niti preko root.after)"""
+        self.izvrsi_pozive()
+        poslednji, zavrseno = self.preuzmi_snimke(self.red_progresa)
+        if zavrseno:
+            self.traka_napretka.set(0)
+            self.labela_napretka.configure(text="Spreman za backup")
+            self.dugme_backup.configure(state="normal")
+            self.dugme_otkazivanje.configure(state="disabled")
+        elif poslednji is not None:
+            self.azuriraj_progres(poslednji)
+
+        poslednji, zavrseno = self.preuzmi_snimke(self.red_progresa_restore)
+        if zavrseno:
+            self.traka_restore.set(0)
+            self.labela_restore.configure(text="Spreman za obnavljanje")
+            self.dugme_restore.configure(state="normal")
+            self.dugme_provera.configure(state="normal")
+        elif poslednji is not None:
+            self.azuriraj_progres_restore(poslednji)
+
+        self.root.after(100, self.obradi_progres)
 
     def izvrsi_backup(self):
         try:
@@ -320,6 +554,7 @@ class BackupGUI:
             odrediste = self.odredisni_folder.get()
             ukljuci = self.parsiraj_ekstenzije(self.ukljuci_ext.get())
             iskljuci = self.parsiraj_ekstenzije(self.iskljuci_ext.get())
+            iskljuci_foldere = self.parsiraj_foldere(self.iskljuci_foldere.get())
 
             if not izvor or not odrediste:
                 self.log("❌ Greška: Molimo izaberite izvorni i odredišni folder!")
@@ -332,32 +567,193 @@ class BackupGUI:
                 self.log(f"   Uključuje: {', '.join(ukljuci)}")
             if iskljuci:
                 self.log(f"   Isključuje: {', '.join(iskljuci)}")
+            if iskljuci_foldere:
+                self.log(f"   Isključuje foldere: {', '.join(iskljuci_foldere)}")
+
+            try:
+                ogranicenje = self.napravi_ogranicenje()
+                zadrzavanje = parse_retention(self.zadrzavanje.get())
+            except ValueError as e:
+                self.log(f"❌ Greška: {e}")
+                return
 
             rezultat = self.backup_engine.backup(
                 source_dir=izvor,
                 destination_dir=odrediste,
-                include_extensions=ukljuci,
-                exclude_extensions=iskljuci
+                file_filter=FileFilter(ukljuci, iskljuci, exclude_dirs=iskljuci_foldere),
+                incremental=self.inkrementalni.get(),
+                workers=self.parsiraj_broj_niti(),
+                storage=self.nacin_cuvanja.get(),
+                compression=self.kompresija.get(),
+                volume_size=self.parsiraj_velicinu_volumena(),
+                throttle=ogranicenje,
+                hash_algorithm=parsiraj_kontrolnu_sumu(self.kontrolna_suma.get()),
+                deletions=self.nacin_brisanja()
             )
 
             if rezultat["success"]:
                 self.log(f"✅ Backup završen uspješno!")
                 self.log(f"   Kopirano fajlova: {rezultat['copied']}")
+                self.log(f"   Nepromenjeno fajlova: {rezultat['unchanged']}")
+                if rezultat.get("resumed"):
+                    self.log(f"   Nastavljeno (kopirano u prekinutom backup-u): {rezultat['resumed']}")
+                self.log(f"   Obrisano u izvoru: {rezultat['deleted']}")
                 self.log(f"   Preskočeno fajlova: {rezultat['skipped']}")
+                if "bytes_written" in rezultat:
+                    self.log(f"   Upisano: {rezultat['bytes_written'] / 1048576:.1f} MB "
+                             f"(od {rezultat['bytes_copied'] / 1048576:.1f} MB izmenjenih fajlova)")
+                if rezultat.get("copy_methods"):
+                    self.log("   Način kopiranja: " + ", ".join(
+                        f"{metod}: {broj}" for metod, broj in rezultat["copy_methods"].items()))
+                if rezultat.get("archive"):
+                    self.log(f"   Arhiva: {rezultat['archive']} ({len(rezultat['volumes'])} volumena, "
+                             f"{rezultat['bytes_stored'] / 1048576:.1f} MB)")
+                if rezultat.get("snapshot"):
+                    self.log(f"   Snapshot: {rezultat['snapshot']} "
+                             f"(novih podataka: {rezultat['bytes_stored'] / 1048576:.1f} MB)")
+                if rezultat.get("linked"):
+                    self.log(f"   Povezano sa prethodnim snapshot-om (hard link): {rezultat['linked']}")
+                if rezultat.get("hash_algorithm"):
+                    self.log(f"   Kontrolne sume: {rezultat['hash_algorithm']}")
+                if rezultat.get("phases"):
+                    self.log("   Trajanje faza: " + ", ".join(
+                        f"{faza} {sekunde:.1f} s" for faza, sekunde in rezultat["phases"].items()))
+                if rezultat.get("extraneous"):
+                    self.log_brisanje(rezultat["extraneous"])
+                if not zadrzavanje.empty:
+                    self.ocisti_stare_verzije(odrediste, zadrzavanje)
                 self.log(f"   Vreme: {rezultat['timestamp']}")
-                messagebox.showinfo("Uspjeh", f"Backup završen!\n\nKopirano: {rezultat['copied']} fajlova\nPreskočeno: {rezultat['skipped']} fajlova")
+                self.u_glavnoj_niti(messagebox.showinfo, "Uspjeh", f"Backup završen!\n\nKopirano: {rezultat['copied']} fajlova\nPreskočeno: {rezultat['skipped']} fajlova")
             else:
                 self.log(f"❌ Backup nije uspeo: {rezultat['error']}")
-                messagebox.showerror("Greška", f"Backup nije uspeo:\n{rezultat['error']}")
+                self.u_glavnoj_niti(messagebox.showerror, "Greška", f"Backup nije uspeo:\n{rezultat['error']}")
 
         except Exception as e:
             self.log(f"❌ Izuzetak: {e}")
-            messagebox.showerror("Greška", str(e))
+            self.u_glavnoj_niti(messagebox.showerror, "Greška", str(e))
         finally:
-            self.traka_napretka.set(0)
-            self.labela_napretka.configure(text="Spreman za backup")
-            self.dugme_backup.configure(state="normal")
-            self.dugme_otkazivanje.configure(state="disabled")
+            # Oznaka kraja; GUI resetuje progres kada obradi sve prethodne snimke
+            self.red_progresa.put(None)
+
+    def nacin_brisanja(self):
+        """Nacin brisanja viska za BackupEngine; samo kopija foldera brise visak"""
+        if self.nacin_cuvanja.get() != "mirror":
+            return None
+        return NACINI_BRISANJA.get(self.brisanje_viska.get())
+
+    def log_brisanje(self, izvestaj: dict):
+        """Upisi u dnevnik fajlove obrisane u izvoru koji su uklonjeni (ili bi bili) iz kopije"""
+        if not izvestaj["success"]:
+            self.log(f"⚠️ Uklanjanje obrisanih fajlova prekinuto: {izvestaj['error']}")
+        if izvestaj["dry_run"]:
+            radnja = "Bilo bi premešteno u karantin" if izvestaj["mode"] == "quarantine" else "Bilo bi obrisano"
+        else:
+            radnja = "Premešteno u karantin" if izvestaj["mode"] == "quarantine" else "Obrisano iz kopije"
+        self.log(f"   {radnja}: {izvestaj['files']} fajlova ({izvestaj['bytes'] / 1048576:.1f} MB)")
+        for putanja in izvestaj["paths"][:20]:
+            self.log(f"     • {putanja}")
+        if izvestaj["files"] > 20:
+            self.log(f"     ... i još {izvestaj['files'] - 20}")
+
+    def izvrsi_pregled_brisanja(self):
+        try:
+            izvor = self.izvorni_folder.get()
+            odrediste = self.odredisni_folder.get()
+            if not izvor or not odrediste:
+                self.log("❌ Greška: Molimo izaberite izvorni i odredišni folder!")
+                return
+            self.log(f"🔎 Pregled fajlova obrisanih u izvoru: {odrediste}")
+            filter_fajlova = FileFilter(self.parsiraj_ekstenzije(self.ukljuci_ext.get()),
+                                        self.parsiraj_ekstenzije(self.iskljuci_ext.get()),
+                                        exclude_dirs=self.parsiraj_foldere(self.iskljuci_foldere.get()))
+            izvestaj = self.backup_engine.propagate_deletions(
+                izvor, odrediste, filter_fajlova,
+                NACINI_BRISANJA.get(self.brisanje_viska.get()) or "delete", dry_run=True)
+            if not izvestaj["success"] and "files" not in izvestaj:
+                self.log(f"❌ {izvestaj['error']}")
+                return
+            self.log_brisanje(izvestaj)
+        except Exception as e:
+            self.log(f"❌ Izuzetak: {e}")
+
+    def pokreni_pregled_brisanja(self):
+        threading.Thread(target=self.izvrsi_pregled_brisanja, daemon=True).start()
+
+    def ocisti_stare_verzije(self, odrediste: str, zadrzavanje):
+        """Obrisi snapshot-e i arhive koje pravilo zadrzavanja ne cuva"""
+        rezultat = self.backup_engine.prune(odrediste, zadrzavanje)
+        if not rezultat["success"]:
+            self.log(f"⚠️ Čišćenje starih verzija nije uspelo: {rezultat['error']}")
+            return
+        self.log(f"🧹 Obrisano starih verzija: {len(rezultat['removed'])}, zadržano: {len(rezultat['kept'])} "
+                 f"(oslobođeno {rezultat['bytes_freed'] / 1048576:.1f} MB)")
+        for g in rezultat["errors"][:5]:
+            self.log(f"     • {g}")
+
+    def izvrsi_procenu(self):
+        tekst = "Spreman za backup"
+        try:
+            izvor = self.izvorni_folder.get()
+            odrediste = self.odredisni_folder.get()
+            if not izvor or not odrediste:
+                self.log("❌ Greška: Molimo izaberite izvorni i odredišni folder!")
+                return
+            try:
+                ogranicenje = self.napravi_ogranicenje()
+            except ValueError as e:
+                self.log(f"❌ Greška: {e}")
+                return
+
+            self.log(f"📊 Procena backup-a: {izvor} → {odrediste}")
+            plan = self.backup_engine.plan(
+                izvor, odrediste,
+                incremental=self.inkrementalni.get(),
+                storage=self.nacin_cuvanja.get(),
+                file_filter=FileFilter(self.parsiraj_ekstenzije(self.ukljuci_ext.get()),
+                                       self.parsiraj_ekstenzije(self.iskljuci_ext.get()),
+                                       exclude_dirs=self.parsiraj_foldere(self.iskljuci_foldere.get())),
+                throttle=ogranicenje,
+                deletions=self.nacin_brisanja()
+            )
+            if not plan["success"]:
+                self.log(f"❌ Procena nije uspela: {plan['error']}")
+                return
+
+            if plan["estimated_seconds"] is None:
+                trajanje = "nepoznato (nema prethodnih merenja)"
+            else:
+                sekunde = int(round(plan["estimated_seconds"]))
+                trajanje = f"~{sekunde // 3600}:{sekunde // 60 % 60:02d}:{sekunde % 60:02d}"
+            self.log(f"   Za kopiranje: {plan['copy']} od {plan['total']} fajlova "
+                     f"({plan['copy_bytes'] / 1048576:.1f} od {plan['bytes_total'] / 1048576:.1f} MB)")
+            self.log(f"   Nepromenjeno: {plan['unchanged']}, preskočeno filterom: {plan['skipped']}, "
+                     f"obrisano u izvoru: {plan['deleted']}")
+            self.log(f"   Procenjeno trajanje: {trajanje}")
+            for naslov, grupe in (("Po ekstenziji", plan["by_extension"]), ("Po folderu", plan["by_directory"])):
+                self.log(f"   {naslov}:")
+                for naziv, stavka in list(grupe.items())[:8]:
+                    self.log(f"     • {naziv}: {stavka['copy_files']}/{stavka['files']} fajlova, "
+                             f"{stavka['copy_bytes'] / 1048576:.1f}/{stavka['bytes'] / 1048576:.1f} MB")
+            if plan.get("deletions"):
+                self.log_brisanje(plan["deletions"])
+            tekst = (f"Procena: {plan['copy']} fajlova, {plan['copy_bytes'] / 1048576:.1f} MB, "
+                     f"trajanje {trajanje}")
+        except Exception as e:
+            self.log(f"❌ Izuzetak: {e}")
+        finally:
+            self.u_glavnoj_niti(self.zavrsi_procenu, tekst)
+
+    def zavrsi_procenu(self, tekst: str):
+        # Snimci napretka skeniranja bi prepisali procenu
+        self.preuzmi_snimke(self.red_progresa)
+        self.labela_napretka.configure(text=tekst)
+        self.dugme_backup.configure(state="normal")
+        self.dugme_procena.configure(state="normal")
+
+    def pokreni_procenu(self):
+        self.dugme_backup.configure(state="disabled")
+        self.dugme_procena.configure(state="disabled")
+        threading.Thread(target=self.izvrsi_procenu, daemon=True).start()
 
     def pokreni_backup(self):
         self.dugme_backup.configure(state="disabled")
@@ -373,15 +769,31 @@ class BackupGUI:
         self.dugme_otkazivanje.configure(state="disabled")
 
     def postavi_raspored(self):
-        self.scheduler.schedule_backup(
-            schedule_type=self.tip_rasporeda.get(),
+        zakazan = self.scheduler.schedule_backup(
+            schedule_type=TIPOVI_RASPOREDA.get(self.tip_rasporeda.get(), self.tip_rasporeda.get()),
             time_str=self.vreme_rasporeda.get(),
             source_dir=self.izvorni_folder.get(),
             destination_dir=self.odredisni_folder.get(),
             include_extensions=self.parsiraj_ekstenzije(self.ukljuci_ext.get()),
-            exclude_extensions=self.parsiraj_ekstenzije(self.iskljuci_ext.get())
+            exclude_extensions=self.parsiraj_ekstenzije(self.iskljuci_ext.get()),
+            exclude_dirs=self.parsiraj_foldere(self.iskljuci_foldere.get()),
+            incremental=self.inkrementalni.get(),
+            workers=self.parsiraj_broj_niti(),
+            storage=self.nacin_cuvanja.get(),
+            compression=self.kompresija.get(),
+            volume_size=self.parsiraj_velicinu_volumena(),
+            cron=self.cron_izraz.get().strip() or None,
+            jitter=parsiraj_minute(self.rasipanje_minuta.get()) * 60,
+            max_mb_per_second=parsiraj_ogranicenje(self.ogranicenje_mb_s.get()),
+            throttle_profile=self.profil_ogranicenja.get().strip() or None,
+            hash_algorithm=parsiraj_kontrolnu_sumu(self.kontrolna_suma.get()),
+            retention=self.zadrzavanje.get().strip() or None,
+            deletions=self.nacin_brisanja()
         )
-        self.log(f"⏰ Zakazan {self.tip_rasporeda.get()} backup u {self.vreme_rasporeda.get()}")
+        if zakazan:
+            self.log(f"⏰ Zakazan backup, sledeće pokretanje: {self.scheduler.get_next_run():%Y-%m-%d %H:%M}")
+        else:
+            self.log("❌ Neispravan raspored (proverite vreme SS:MM, cron izraz, profil ograničenja i zadržavanje)")
 
     def provjeri_raspored(self):
         self.scheduler.run_pending()
@@ -400,82 +812,82 @@ class BackupGUI:
         if folder:
             self.restore_odrediste.set(folder)
 
+    def osvezi_snapshote(self):
+        """Popuni listu snapshot-a ako folder sadrzi snapshot-e, deduplikovano skladiste ili arhive"""
+        izvor = self.restore_izvor.get()
+        vrednosti = [NAJNOVIJI_SNAPSHOT]
+        if izvor and snapshots.is_snapshot_set(izvor):
+            vrednosti += list(reversed(snapshots.list_snapshots(izvor)))
+        elif izvor and DedupStore.is_store(izvor):
+            vrednosti += list(reversed(DedupStore(izvor).list_snapshots()))
+        elif izvor:
+            vrednosti += list(reversed(list_archives(izvor)))
+        self.meni_snapshot.configure(values=vrednosti)
+        self.restore_snapshot.set(NAJNOVIJI_SNAPSHOT)
+
     def log_restore(self, poruka: str):
-        self.tekst_log_restore.insert("end", f"{poruka}\n")
-        self.tekst_log_restore.see("end")
+        self.u_glavnoj_niti(self.upisi_u_dnevnik, self.tekst_log_restore, poruka)
 
-    def azuriraj_progres_restore(self, trenutno: int, ukupno: int, ime_fajla: str):
-        progres = trenutno / ukupno if ukupno > 0 else 0
+    def azuriraj_progres_restore(self, snimak):
+        if snimak.phase == "scan":
+            self.traka_restore.set(0)
+            self.labela_restore.configure(text="Priprema liste fajlova...")
+            return
+        progres = snimak.files_done / snimak.files_total if snimak.files_total > 0 else 0
         self.traka_restore.set(progres)
-        self.labela_restore.configure(text=f"Obnavljanje: {ime_fajla} ({trenutno}/{ukupno})")
-        self.root.update_idletasks()
+        radnja = "Provera" if snimak.phase == "verify" else "Obnavljanje"
+        self.labela_restore.configure(
+            text=f"{radnja}: {snimak.files_done}/{snimak.files_total} fajlova "
+                 f"({snimak.throughput / 1048576:.1f} MB/s)"
+        )
 
     def izvrsi_restore(self):
-        import shutil
-        izvor = self.restore_izvor.get()
-        odrediste = self.restore_odrediste.get()
-        prepisati = self.prepisati_postojece.get()
-
-        if not izvor or not odrediste:
-            self.log_restore("❌ Greška: Molimo izaberite oba foldera!")
-            return
-        if not os.path.exists(izvor):
-            self.log_restore("❌ Greška: Folder sa backup-om ne postoji!")
-            return
-
         try:
-            os.makedirs(odrediste, exist_ok=True)
-        except Exception as e:
-            self.log_restore(f"❌ Greška pri kreiranju odredišnog foldera: {e}")
-            return
-
-        # Prebroj fajlove
-        ukupno = sum(len(fajlovi) for _, _, fajlovi in os.walk(izvor))
-        if ukupno == 0:
-            self.log_restore("❌ Nema fajlova u backup folderu!")
-            self.dugme_restore.configure(state="normal")
-            return
+            izvor = self.restore_izvor.get()
+            odrediste = self.restore_odrediste.get()
 
-        kopirano = 0
-        preskoceno = 0
-        greske = []
-
-        self.log_restore(f"🔄 Pokretanje restore-a: {izvor} → {odrediste}")
-        self.log_restore(f"   Ukupno fajlova: {ukupno}")
-
-        for root_dir, dirs, fajlovi in os.walk(izvor):
-            for fajl in fajlovi:
-                src_fajl = os.path.join(root_dir, fajl)
-                rel_putanja = os.path.relpath(src_fajl, izvor)
-                dest_fajl = os.path.join(odrediste, rel_putanja)
+            if not izvor or not odrediste:
+                self.log_restore("❌ Greška: Molimo izaberite oba foldera!")
+                return
 
-                os.makedirs(os.path.dirname(dest_fajl), exist_ok=True)
+            snapshot = self.restore_snapshot.get()
+            snapshot = None if snapshot == NAJNOVIJI_SNAPSHOT else snapshot
+            self.log_restore(f"🔄 Pokretanje restore-a: {izvor} → {odrediste}")
+            if snapshot:
+                self.log_restore(f"   Snapshot: {snapshot}")
+
+            rezultat = self.restore_engine.restore(
+                izvor,
+                odrediste,
+                overwrite=self.prepisati_postojece.get(),
+                skip_identical=self.preskoci_identicne.get(),
+                workers=self.parsiraj_broj_niti(),
+                snapshot=snapshot
+            )
 
-                if not prepisati and os.path.exists(dest_fajl):
-                    preskoceno += 1
-                    continue
+            if not rezultat["success"]:
+                self.log_restore(f"❌ Restore nije uspeo: {rezultat['error']}")
+                self.u_glavnoj_niti(messagebox.showerror, "Greška", f"Restore nije uspeo:\n{rezultat['error']}")
+                return
 
-                try:
-                    shutil.copy2(src_fajl, dest_fajl)
-                    kopirano += 1
-                    self.azuriraj_progres_restore(kopirano + preskoceno, ukupno, fajl)
-                except Exception as e:
-                    greske.append(f"{fajl}: {e}")
-                    preskoceno += 1
+            self.log_restore("✅ Restore završen!")
+            self.log_restore(f"   Obnovljeno fajlova: {rezultat['restored']}")
+            self.log_restore(f"   Identičnih (preskočeno): {rezultat['unchanged']}")
+            self.log_restore(f"   Preskočeno: {rezultat['skipped']}")
+            if rezultat["errors"]:
+                self.log_restore(f"   Greške ({rezultat.get('errors_total', len(rezultat['errors']))}):")
+                for g in rezultat["errors"][:5]:
+                    self.log_restore(f"     • {g}")
+                if rezultat.get("error_log"):
+                    self.log_restore(f"   Sve greške: {rezultat['error_log']}")
 
-        self.traka_restore.set(0)
-        self.labela_restore.configure(text="Spreman za obnavljanje")
-        self.dugme_restore.configure(state="normal")
-
-        self.log_restore(f"✅ Restore završen!")
-        self.log_restore(f"   Obnovljeno fajlova: {kopirano}")
-        self.log_restore(f"   Preskočeno: {preskoceno}")
-        if greske:
-            self.log_restore(f"   Greške ({len(greske)}):")
-            for g in greske[:5]:
-                self.log_restore(f"     • {g}")
+            self.u_glavnoj_niti(messagebox.showinfo, "Restore završen", f"Obnavljanje završeno!\n\nObnovljeno: {rezultat['restored']} fajlova\nPreskočeno: {rezultat['skipped'] + rezultat['unchanged']} fajlova")
 
-        messagebox.showinfo("Restore završen", f"Obnavljanje završeno!\n\nObnovljeno: {kopirano} fajlova\nPreskočeno: {preskoceno} fajlova")
+        except Exception as e:
+            self.log_restore(f"❌ Izuzetak: {e}")
+            self.u_glavnoj_niti(messagebox.showerror, "Greška", str(e))
+        finally:
+            self.red_progresa_restore.put(None)
 
     def pokreni_restore(self):
         odrediste = self.restore_odrediste.get()
@@ -488,8 +900,55 @@ class BackupGUI:
                 return
 
         self.dugme_restore.configure(state="disabled")
+        self.dugme_provera.configure(state="disabled")
         threading.Thread(target=self.izvrsi_restore, daemon=True).start()
 
+    def izvrsi_proveru(self):
+        try:
+            izvor = self.restore_izvor.get()
+            if not izvor:
+                self.log_restore("❌ Greška: Molimo izaberite folder sa backup-om!")
+                return
+
+            snapshot = self.restore_snapshot.get()
+            snapshot = None if snapshot == NAJNOVIJI_SNAPSHOT else snapshot
+            self.log_restore(f"🔍 Provera backup-a: {izvor}")
+
+            rezultat = self.restore_engine.verify(izvor, workers=self.parsiraj_broj_niti(), snapshot=snapshot)
+
+            if not rezultat["success"]:
+                self.log_restore(f"❌ Provera nije uspela: {rezultat['error']}")
+                self.u_glavnoj_niti(messagebox.showerror, "Greška", f"Provera nije uspela:\n{rezultat['error']}")
+                return
+
+            self.log_restore("✅ Backup je ispravan!" if rezultat["valid"] else "⚠️ Backup je oštećen!")
+            self.log_restore(f"   Algoritam: {rezultat['algorithm']}")
+            self.log_restore(f"   Ispravnih fajlova: {rezultat['verified']} od {rezultat['total']}")
+            self.log_restore(f"   Oštećenih: {len(rezultat['mismatched'])}")
+            self.log_restore(f"   Nedostaje: {len(rezultat['missing'])}")
+            for putanja in (rezultat["mismatched"] + rezultat["missing"])[:5]:
+                self.log_restore(f"     • {putanja}")
+            for g in rezultat["errors"][:5]:
+                self.log_restore(f"     • {g}")
+
+            if rezultat["valid"]:
+                self.u_glavnoj_niti(messagebox.showinfo, "Provera završena", f"Svih {rezultat['verified']} fajlova je ispravno.")
+            else:
+                self.u_glavnoj_niti(messagebox.showwarning, "Provera završena",
+                                    f"Oštećenih: {len(rezultat['mismatched'])}\n"
+                                    f"Nedostaje: {len(rezultat['missing'])}")
+
+        except Exception as e:
+            self.log_restore(f"❌ Izuzetak: {e}")
+            self.u_glavnoj_niti(messagebox.showerror, "Greška", str(e))
+        finally:
+            self.red_progresa_restore.put(None)
+
+    def pokreni_proveru(self):
+        self.dugme_restore.configure(state="disabled")
+        self.dugme_provera.configure(state="disabled")
+        threading.Thread(target=self.izvrsi_proveru, daemon=True).start()
+
     def pokreni(self):
         self.root.mainloop()
 
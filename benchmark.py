@@ -0,0 +1,363 @@
+"""
+Benchmark - Reproducible timings of the backup, incremental and restore hot paths
+
+Usage:
+    python benchmark.py [--profiles tiny huge deep mixed] [--scale 1.0] [--workers 4]
+                        [--storage mirror] [--repeat 3] [--output results.json]
+                        [--compare baseline.json] [--pipeline [LIMITS]] [--latency MS]
+
+Every measured operation runs in its own Python process, so peak RSS and
+syscall counts belong to that operation alone. Trees are generated from a
+fixed seed, so two versions of the code are measured on identical data.
+Page cache is not dropped (that needs root); numbers are warm-cache numbers.
+With --pipeline the backup runs through the async pipeline; --latency adds
+a delay to each destination operation, so the pipeline can be measured
+against a local directory as if it were a network share (compare with
+--pipeline "scan=1, mkdir=1, copy=1, metadata=1" for one-at-a-time calls).
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from statistics import median
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Synthetic trees at scale 1.0: (number of files, size range in bytes, nesting, extensions)
+PROFILES = {
+    # Many tiny files: per-file overhead (scan, open, metadata) dominates
+    "tiny": {"files": 20000, "min_size": 0, "max_size": 4096, "depth": 2, "fanout": 20,
+             "extensions": [".txt"]},
+    # Few huge files: raw copy bandwidth dominates
+    "huge": {"files": 4, "min_size": 64 * 1048576, "max_size": 64 * 1048576, "depth": 0, "fanout": 1,
+             "extensions": [".bin"]},
+    # Deep nesting: directory handling and path building dominate
+    "deep": {"files": 3000, "min_size": 0, "max_size": 16384, "depth": 24, "fanout": 2,
+             "extensions": [".dat"]},
+    # Realistic mix of sizes and extensions
+    "mixed": {"files": 5000, "min_size": 0, "max_size": 8 * 1048576, "depth": 4, "fanout": 6,
+              "extensions": [".txt", ".jpg", ".pdf", ".docx", ".mp4", ".log", ".py", ""]},
+}
+
+# Operations measured per profile, in the order they depend on each other
+SCENARIOS = ("scan", "backup", "incremental", "restore")
+
+SEED = 20240601
+
+
+def generate_tree(root: str, profile: dict, scale: float, seed: int = SEED) -> dict:
+    """
+    Write a synthetic tree
+
+    Sizes of the mixed profile are log-uniform, so most files are small and
+    a few are large, like real user data.
+
+    Returns:
+        Dictionary with the number of files and bytes written
+    """
+    rng = random.Random(seed)
+    count = max(1, int(profile["files"] * scale))
+    # Directory chains of the requested depth, fanout chains side by side
+    directories = [""]
+    for branch in range(profile["fanout"]):
+        path = ""
+        for level in range(profile["depth"]):
+            path = os.path.join(path, f"d{branch}_{level}")
+            directories.append(path)
+    for rel_dir in directories:
+        os.makedirs(os.path.join(root, rel_dir), exist_ok=True)
+
+    total_bytes = 0
+    chunk = rng.randbytes(1048576)
+    for i in range(count):
+        low, high = profile["min_size"], profile["max_size"]
+        if low == high:
+            size = low
+        elif len(profile["extensions"]) > 1:
+            size = int(2 ** rng.uniform(0, (high + 1).bit_length())) - 1
+            size = max(low, min(high, size))
+        else:
+            size = rng.randint(low, high)
+        name = f"f{i:06d}{rng.choice(profile['extensions'])}"
+        path = os.path.join(root, rng.choice(directories), name)
+        with open(path, "wb") as f:
+            # Unique head so files are not identical, shared body to keep generation fast
+            head = rng.randbytes(min(size, 64))
+            f.write(head)
+            remaining = size - len(head)
+            while remaining > 0:
+                f.write(chunk[:remaining])
+                remaining -= len(chunk)
+        total_bytes += size
+    return {"files": count, "bytes": total_bytes}
+
+
+def read_proc_io() -> Dict[str, int]:
+    """Read/write syscall counters of this process (Linux only, empty elsewhere)"""
+    counters = {}
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                counters[key.strip()] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def usage() -> dict:
+    """CPU time, context switches and peak RSS of this process so far"""
+    if resource is None:
+        return {}
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = ru.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {"user": ru.ru_utime, "system": ru.ru_stime, "voluntary_switches": ru.ru_nvcsw,
+            "involuntary_switches": ru.ru_nivcsw, "peak_rss": peak}
+
+
+def run_scenario(spec: dict) -> dict:
+    """
+    Run one measured operation (called in a child process)
+
+    Args:
+        spec: Scenario name, directories, workers and storage type
+
+    Returns:
+        Measurements of the operation
+    """
+    from backup_engine import BackupEngine
+    from async_pipeline import AsyncPipeline, parse_stage_limits
+
+    engine = BackupEngine(index_dir=spec["index_dir"])
+    pipeline = None
+    if spec.get("pipeline") is not None:
+        pipeline = AsyncPipeline(parse_stage_limits(spec["pipeline"]), spec.get("latency", 0.0))
+    scenario = spec["scenario"]
+    io_before = read_proc_io()
+    usage_before = usage()
+    start = time.perf_counter()
+    if scenario == "scan":
+        files = engine.count_files(spec["source"], None, None)
+        result = {"success": True}
+    elif scenario in ("backup", "incremental"):
+        result = engine.backup(spec["source"], spec["destination"], incremental=True,
+                               workers=spec["workers"], storage=spec["storage"], pipeline=pipeline)
+        files = result.get("copied", 0) + result.get("unchanged", 0)
+    else:
+        result = engine.restore(spec["backup"], spec["restore"], workers=spec["workers"])
+        files = result.get("restored", 0) + result.get("unchanged", 0)
+    seconds = time.perf_counter() - start
+    usage_after = usage()
+    io_after = read_proc_io()
+
+    measurement = {
+        "success": result["success"],
+        "error": result.get("error"),
+        "seconds": seconds,
+        "files": files,
+        "copied": result.get("copied", result.get("restored")),
+    }
+    if usage_after:
+        measurement.update({
+            "cpu_user": usage_after["user"] - usage_before["user"],
+            "cpu_system": usage_after["system"] - usage_before["system"],
+            "context_switches": (usage_after["voluntary_switches"] - usage_before["voluntary_switches"]
+                                 + usage_after["involuntary_switches"] - usage_before["involuntary_switches"]),
+            "peak_rss_mb": usage_after["peak_rss"] / 1048576,
+        })
+    if io_after:
+        measurement.update({
+            "read_syscalls": io_after["syscr"] - io_before["syscr"],
+            "write_syscalls": io_after["syscw"] - io_before["syscw"],
+            "bytes_read": io_after["rchar"] - io_before["rchar"],
+            "bytes_written": io_after["wchar"] - io_before["wchar"],
+        })
+    return measurement
+
+
+def measure(spec: dict) -> dict:
+    """Run a scenario in a fresh interpreter and return its measurements"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-scenario", json.dumps(spec)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if output.returncode != 0:
+        return {"success": False, "error": output.stderr.strip().splitlines()[-1] if output.stderr else "crashed"}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: List[dict], tree: dict) -> dict:
+    """Combine repeated measurements: median time and rates, worst peak RSS"""
+    ok = [r for r in runs if r.get("success")]
+    if not ok:
+        return {"success": False, "error": runs[-1].get("error") if runs else "not run"}
+    seconds = median(r["seconds"] for r in ok)
+    summary = {
+        "success": True,
+        "runs": len(ok),
+        "seconds": seconds,
+        "seconds_min": min(r["seconds"] for r in ok),
+        "files": ok[0]["files"],
+        "copied": ok[0]["copied"],
+        "files_per_second": tree["files"] / seconds if seconds > 0 else None,
+        "mb_per_second": tree["bytes"] / 1048576 / seconds if seconds > 0 else None,
+    }
+    for key in ("cpu_user", "cpu_system", "context_switches", "read_syscalls", "write_syscalls",
+                "bytes_read", "bytes_written"):
+        if key in ok[0]:
+            summary[key] = median(r[key] for r in ok)
+    if "peak_rss_mb" in ok[0]:
+        summary["peak_rss_mb"] = max(r["peak_rss_mb"] for r in ok)
+    return summary
+
+
+def git_revision() -> Optional[str]:
+    """Commit of the measured code, if it is a git checkout"""
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return output.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(args) -> dict:
+    """Generate trees and measure every scenario of every profile"""
+    results = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"scale": args.scale, "workers": args.workers, "storage": args.storage,
+                     "repeat": args.repeat, "seed": SEED, "pipeline": args.pipeline,
+                     "latency_ms": args.latency},
+        "profiles": {},
+    }
+    base = tempfile.mkdtemp(prefix="backup-bench-", dir=args.tmpdir)
+    try:
+        for name in args.profiles:
+            source = os.path.join(base, name, "source")
+            print(f"[{name}] Generating tree...", flush=True)
+            tree = generate_tree(source, PROFILES[name], args.scale)
+            print(f"[{name}] {tree['files']} files, {tree['bytes'] / 1048576:.1f} MB", flush=True)
+
+            runs = {scenario: [] for scenario in SCENARIOS}
+            for repeat in range(args.repeat):
+                work = os.path.join(base, name, f"run{repeat}")
+                spec = {
+                    "source": source,
+                    "destination": os.path.join(work, "backup"),
+                    "backup": os.path.join(work, "backup"),
+                    "restore": os.path.join(work, "restore"),
+                    "index_dir": os.path.join(work, "index"),
+                    "workers": args.workers,
+                    "storage": args.storage,
+                    "pipeline": args.pipeline,
+                    "latency": args.latency / 1000.0,
+                }
+                for scenario in SCENARIOS:
+                    measurement = measure(dict(spec, scenario=scenario))
+                    runs[scenario].append(measurement)
+                    status = f"{measurement['seconds']:.2f} s" if measurement.get("success") \
+                        else f"failed: {measurement.get('error')}"
+                    print(f"[{name}] {scenario:<12} run {repeat + 1}/{args.repeat}: {status}", flush=True)
+                shutil.rmtree(work, ignore_errors=True)
+
+            results["profiles"][name] = {
+                "tree": tree,
+                "scenarios": {scenario: summarize(runs[scenario], tree) for scenario in SCENARIOS},
+            }
+    finally:
+        if args.keep:
+            print(f"Trees kept in {base}")
+        else:
+            shutil.rmtree(base, ignore_errors=True)
+    return results
+
+
+def print_results(results: dict, baseline: Optional[dict] = None):
+    """Print a table of results, with the change against a baseline if given"""
+    header = f"{'profile':<8} {'scenario':<12} {'seconds':>9} {'files/s':>10} {'MB/s':>9} " \
+             f"{'syscalls':>10} {'peak MB':>8}"
+    if baseline:
+        header += f" {'vs base':>9}"
+    print(header)
+    for name, profile in results["profiles"].items():
+        for scenario, summary in profile["scenarios"].items():
+            if not summary["success"]:
+                print(f"{name:<8} {scenario:<12} failed: {summary.get('error')}")
+                continue
+            syscalls = summary.get("read_syscalls", 0) + summary.get("write_syscalls", 0)
+            line = (f"{name:<8} {scenario:<12} {summary['seconds']:>9.3f} {summary['files_per_second']:>10.0f} "
+                    f"{summary['mb_per_second']:>9.1f} {syscalls:>10.0f} {summary.get('peak_rss_mb', 0):>8.1f}")
+            if baseline:
+                old = baseline.get("profiles", {}).get(name, {}).get("scenarios", {}).get(scenario, {})
+                if old.get("success") and old["seconds"] > 0:
+                    line += f" {(summary['seconds'] / old['seconds'] - 1) * 100:>+8.1f}%"
+                else:
+                    line += f" {'-':>9}"
+            print(line)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark backup, incremental re-run and restore")
+    parser.add_argument("--profiles", nargs="*", choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the number of files of every profile")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--storage", choices=("mirror", "snapshot", "dedup", "archive"), default="mirror")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tmpdir", default=None, help="Where to generate trees (default: system temp)")
+    parser.add_argument("--keep", action="store_true", help="Do not delete generated trees")
+    parser.add_argument("--pipeline", nargs="?", const="", default=None, metavar="LIMITS",
+                        help='Back up through the async pipeline, optionally with stage limits ("copy=32")')
+    parser.add_argument("--latency", type=float, default=0.0, metavar="MS",
+                        help="Delay added to every destination operation of the pipeline")
+    parser.add_argument("--run-scenario", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(json.loads(args.run_scenario))))
+        return 0
+    if args.latency and args.pipeline is None:
+        parser.error("--latency is injected by the async pipeline and needs --pipeline")
+    if args.pipeline is not None:
+        from async_pipeline import parse_stage_limits
+        try:
+            parse_stage_limits(args.pipeline)
+        except ValueError as e:
+            parser.error(str(e))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run_benchmarks(args)
+    print()
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    failed = any(not summary["success"] for profile in results["profiles"].values()
+                 for summary in profile["scenarios"].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -32,8 +32,8 @@ def demo_backup():
             print(f"   Created {len(test_files)} test files in {temp_source}\n")
 
             # Initialize backup engine
-            def progress_callback(current, total, filename):
-                print(f"   [{current}/{total}] Backing up: {filename}")
+            def progress_callback(current, total, filename, bytes_done, bytes_total):
+                print(f"   [{current}/{total}] Backing up: {filename} ({bytes_done}/{bytes_total} bytes)")
 
             backup_engine = BackupEngine(progress_callback=progress_callback)
 
@@ -0,0 +1,414 @@
+"""
+Fast Copy - Picks the cheapest copy primitive available for each file
+"""
+import os
+import sys
+import stat
+import errno
+import shutil
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request to share extents between two files (Linux btrfs/XFS reflink)
+FICLONE = 0x40049409
+
+# Buffer size of the user-space fallback copy
+BUFFER_SIZE = 4 * 1024 * 1024
+
+# Largest amount copied by one copy_file_range/sendfile call
+KERNEL_CHUNK = 64 * 1024 * 1024
+
+# Largest amount copied between two throttle checks
+THROTTLE_CHUNK = 1024 * 1024
+
+# Suffix of the temporary file a copy is written to before it is renamed
+# into place; such files are incomplete and never restored
+TEMP_SUFFIX = ".backup-tmp"
+
+# Block size compared by delta_copy
+DELTA_BLOCK_SIZE = 64 * 1024
+
+# Files up to this size are copied by copy_small_file
+SMALL_FILE_SIZE = 64 * 1024
+
+# Name prefix of the probe files written by timestamp_tolerance; each probe
+# gets a unique name, so runs probing the same destination do not collide
+MTIME_PROBE = ".backup-mtime-probe"
+
+# Timestamp granularities told apart by timestamp_tolerance (nanoseconds):
+# NTFS (100 ns), filesystems with whole seconds, FAT/exFAT (2 s)
+TIMESTAMP_GRANULARITIES = (1000, 1000000000, 2000000000)
+
+# Keeps os.open from translating line endings on Windows
+O_BINARY = getattr(os, "O_BINARY", 0)
+
+# Errors meaning "this primitive does not work here", not "the copy failed"
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                   errno.ENOTTY, errno.EBADF, errno.EPERM, errno.ENOTSUP}
+
+# Primitives that already failed for a (source device, destination device) pair
+unsupported = set()
+unsupported_lock = threading.Lock()
+
+COPY_METHODS = ("reflink", "copy_file_range", "sendfile", "buffered", "delta")
+
+
+def mark_unsupported(method: str, devices: tuple):
+    """Remember that a primitive does not work for a device pair"""
+    with unsupported_lock:
+        unsupported.add((method, devices))
+
+
+def try_reflink(infd: int, outfd: int) -> bool:
+    """Clone source extents into destination; True on success"""
+    try:
+        fcntl.ioctl(outfd, FICLONE, infd)
+        return True
+    except OSError as e:
+        if e.errno in FALLBACK_ERRNOS:
+            return False
+        raise
+
+
+def try_copy_file_range(infd: int, outfd: int, size: int, throttle=None) -> bool:
+    """Copy inside the kernel with copy_file_range until EOF; True on success"""
+    copied = 0
+    chunk = THROTTLE_CHUNK if throttle is not None else KERNEL_CHUNK
+    while True:
+        if throttle is not None:
+            throttle.consume_bytes(min(chunk, max(size - copied, 1)))
+        try:
+            n = os.copy_file_range(infd, outfd, chunk)
+        except OSError as e:
+            if copied == 0 and e.errno in FALLBACK_ERRNOS:
+                return False
+            raise
+        if n == 0:
+            break
+        copied += n
+    # Some filesystems report EOF right away without copying anything
+    return copied > 0 or size == 0
+
+
+def try_sendfile(infd: int, outfd: int, size: int, throttle=None) -> bool:
+    """Copy inside the kernel with sendfile until EOF; True on success"""
+    copied = 0
+    chunk = THROTTLE_CHUNK if throttle is not None else KERNEL_CHUNK
+    while True:
+        if throttle is not None:
+            throttle.consume_bytes(min(chunk, max(size - copied, 1)))
+        try:
+            n = os.sendfile(outfd, infd, copied, chunk)
+        except OSError as e:
+            if copied == 0 and e.errno in FALLBACK_ERRNOS:
+                return False
+            raise
+        if n == 0:
+            break
+        copied += n
+    return copied > 0 or size == 0
+
+
+def copy_through(fsrc, fdst, throttle=None, hasher=None):
+    """Buffered copy that pays the throttle for every chunk it reads and hashes the data"""
+    chunk = THROTTLE_CHUNK if throttle is not None else BUFFER_SIZE
+    while True:
+        data = fsrc.read(chunk)
+        if not data:
+            break
+        if throttle is not None:
+            throttle.consume_bytes(len(data))
+        if hasher is not None:
+            hasher.update(data)
+        fdst.write(data)
+
+
+def copy_data(fsrc, fdst, throttle=None, hasher=None) -> str:
+    """
+    Copy file content using the best primitive that works
+
+    Order: reflink, copy_file_range, sendfile, buffered read/write. A
+    primitive that fails with an "unsupported" error is remembered for the
+    device pair and not tried again. With a throttle, data is moved in
+    THROTTLE_CHUNK pieces, each one paid for in the throttle's byte bucket
+    (a reflink moves no data and is not throttled). With a hasher the data
+    has to pass through user space, so the buffered copy is used.
+
+    Args:
+        fsrc: Source file opened for binary reading
+        fdst: Destination file opened for binary writing (empty)
+        throttle: Optional Throttle limiting bytes per second
+        hasher: Optional hash object updated with the copied data
+
+    Returns:
+        Name of the primitive used (one of COPY_METHODS)
+    """
+    infd = fsrc.fileno()
+    outfd = fdst.fileno()
+    src_stat = os.fstat(infd)
+    size = src_stat.st_size
+    devices = (src_stat.st_dev, os.fstat(outfd).st_dev)
+    if throttle is not None and not throttle.limits_bytes:
+        throttle = None
+
+    if hasher is not None:
+        copy_through(fsrc, fdst, throttle, hasher)
+        return "buffered"
+
+    if size > 0 and fcntl is not None and sys.platform.startswith("linux"):
+        if ("reflink", devices) not in unsupported:
+            if try_reflink(infd, outfd):
+                return "reflink"
+            mark_unsupported("reflink", devices)
+
+        if hasattr(os, "copy_file_range") and ("copy_file_range", devices) not in unsupported:
+            if try_copy_file_range(infd, outfd, size, throttle):
+                return "copy_file_range"
+            mark_unsupported("copy_file_range", devices)
+
+        if hasattr(os, "sendfile") and ("sendfile", devices) not in unsupported:
+            if try_sendfile(infd, outfd, size, throttle):
+                return "sendfile"
+            mark_unsupported("sendfile", devices)
+
+    if throttle is not None:
+        copy_through(fsrc, fdst, throttle)
+    else:
+        shutil.copyfileobj(fsrc, fdst, BUFFER_SIZE)
+    return "buffered"
+
+
+def copy_file(source_file: str, dest_file: str, throttle=None, hasher=None) -> str:
+    """
+    Copy file content and metadata like shutil.copy2, atomically
+
+    Data goes into a temporary file next to dest_file, which is renamed
+    over dest_file only after content and metadata are complete; a copy
+    interrupted at any point never leaves a truncated dest_file.
+
+    Args:
+        source_file: Path to the source file
+        dest_file: Path to the destination file
+        throttle: Optional Throttle limiting bytes per second
+        hasher: Optional hash object updated with the copied data
+
+    Returns:
+        Name of the primitive used (one of COPY_METHODS)
+    """
+    method = write_temp(source_file, dest_file, throttle, hasher)
+    finish_temp(source_file, dest_file)
+    return method
+
+
+def write_temp(source_file: str, dest_file: str, throttle=None, hasher=None) -> str:
+    """
+    First half of copy_file: copy content into the temporary file of dest_file
+
+    Returns:
+        Name of the primitive used (one of COPY_METHODS)
+    """
+    temp_file = dest_file + TEMP_SUFFIX
+    try:
+        with open(source_file, "rb") as fsrc, open(temp_file, "wb") as fdst:
+            return copy_data(fsrc, fdst, throttle, hasher)
+    except BaseException:
+        remove_temp(dest_file)
+        raise
+
+
+def finish_temp(source_file: str, dest_file: str):
+    """Second half of copy_file: copy metadata to the temporary file and rename it to dest_file"""
+    temp_file = dest_file + TEMP_SUFFIX
+    try:
+        shutil.copystat(source_file, temp_file)
+        os.replace(temp_file, dest_file)
+    except BaseException:
+        remove_temp(dest_file)
+        raise
+
+
+def remove_temp(dest_file: str):
+    """Remove the temporary file of an unfinished copy, if any"""
+    try:
+        os.remove(dest_file + TEMP_SUFFIX)
+    except OSError:
+        pass
+
+
+def copy_small_file(source_file: str, dest_file: str, throttle=None, hasher=None) -> str:
+    """
+    Copy a small file with one read and one write, atomically like copy_file
+
+    The whole content is read into memory, so no copy primitive is probed
+    and no file objects or buffers are set up; mode and times are copied
+    directly unless the source has extended attributes. For files of a few
+    KB this costs a fraction of the syscalls of copy_file.
+
+    Args:
+        source_file: Path to the source file (at most a few times SMALL_FILE_SIZE)
+        dest_file: Path to the destination file
+        throttle: Optional Throttle limiting bytes per second
+        hasher: Optional hash object updated with the copied data
+
+    Returns:
+        Name of the primitive used ("buffered")
+    """
+    infd = os.open(source_file, os.O_RDONLY | O_BINARY)
+    try:
+        src_stat = os.fstat(infd)
+        # A short read of a regular file means end of file; one that grew
+        # since it was stat-ed is read to its end
+        parts = [os.read(infd, src_stat.st_size + 1)]
+        if len(parts[0]) > src_stat.st_size:
+            while parts[-1]:
+                parts.append(os.read(infd, BUFFER_SIZE))
+        has_xattrs = hasattr(os, "listxattr") and bool(os.listxattr(infd))
+    finally:
+        os.close(infd)
+    data = b"".join(parts)
+
+    if throttle is not None and throttle.limits_bytes:
+        throttle.consume_bytes(len(data))
+    if hasher is not None:
+        hasher.update(data)
+
+    temp_file = dest_file + TEMP_SUFFIX
+    try:
+        outfd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o666)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(outfd, view):]
+        finally:
+            os.close(outfd)
+        if has_xattrs:
+            shutil.copystat(source_file, temp_file)
+        else:
+            os.chmod(temp_file, stat.S_IMODE(src_stat.st_mode))
+            os.utime(temp_file, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        os.replace(temp_file, dest_file)
+    except BaseException:
+        remove_temp(dest_file)
+        raise
+    return "buffered"
+
+
+def timestamp_tolerance(directory: str) -> int:
+    """
+    Largest difference between an mtime set on a file in directory and the
+    one the filesystem stores
+
+    Sets a known mtime on a probe file and reads it back. Filesystems with
+    nanosecond timestamps give 0, so mtimes can be compared exactly; FAT
+    and exFAT give 2 s. If the probe cannot be written 0 is returned: an
+    exact comparison can only cause extra copies, never missed ones.
+
+    Returns:
+        Tolerance in nanoseconds
+    """
+    # Odd second with the largest fraction, so every rounding shows
+    mtime_ns = 1600000001 * 1000000000 + 999999999
+    try:
+        fd, probe = tempfile.mkstemp(prefix=MTIME_PROBE + ".", suffix=TEMP_SUFFIX, dir=directory)
+        os.close(fd)
+        try:
+            os.utime(probe, ns=(mtime_ns, mtime_ns))
+            error = abs(os.stat(probe).st_mtime_ns - mtime_ns)
+        finally:
+            os.remove(probe)
+    except OSError:
+        return 0
+    if error == 0:
+        return 0
+    for granularity in TIMESTAMP_GRANULARITIES:
+        if error < granularity:
+            return granularity
+    return TIMESTAMP_GRANULARITIES[-1]
+
+
+class DirectoryCache:
+    """
+    Destination directories known to exist
+
+    A run creates every destination directory once instead of calling
+    os.makedirs for each file. Safe to share between worker threads: adding
+    to a set is atomic, and two threads creating the same directory at once
+    both succeed thanks to exist_ok.
+    """
+
+    def __init__(self):
+        self.created = set()
+
+    def ensure(self, path: str):
+        """Create path (and its parents) unless this cache already did"""
+        if path not in self.created:
+            os.makedirs(path, exist_ok=True)
+            self.created.add(path)
+
+
+def link_file(existing_file: str, dest_file: str):
+    """
+    Make dest_file a hard link to existing_file
+
+    A dest_file left by an interrupted run is replaced unless it already is
+    the same file.
+
+    Raises:
+        OSError: If the filesystem cannot link the two paths (different
+            devices, no hard link support, link count limit reached)
+    """
+    try:
+        os.link(existing_file, dest_file)
+    except FileExistsError:
+        if os.path.samefile(existing_file, dest_file):
+            return
+        os.remove(dest_file)
+        os.link(existing_file, dest_file)
+
+
+def delta_copy(source_file: str, dest_file: str, block_size: int = DELTA_BLOCK_SIZE,
+               throttle=None, hasher=None) -> int:
+    """
+    Update an existing destination copy in place, writing only changed blocks
+
+    Both files are read block by block at the same offsets; blocks that
+    differ are written back, the file is truncated or extended to the source
+    size and metadata is copied at the end. The update is not atomic, but
+    an interrupted one leaves the old mtime in place, so the copy is never
+    taken for an up-to-date one. Suited for large files modified
+    in place (VM images, databases), where only a few blocks change.
+
+    Args:
+        source_file: Path to the source file
+        dest_file: Path to the existing destination copy
+        block_size: Size of compared blocks in bytes
+        throttle: Optional Throttle limiting bytes read per second
+        hasher: Optional hash object updated with the source content
+
+    Returns:
+        Number of bytes actually written to the destination
+    """
+    written = 0
+    offset = 0
+    with open(source_file, "rb") as fsrc, open(dest_file, "r+b") as fdst:
+        while True:
+            block = fsrc.read(block_size)
+            if not block:
+                break
+            if throttle is not None:
+                throttle.consume_bytes(len(block))
+            if hasher is not None:
+                hasher.update(block)
+            if fdst.read(len(block)) != block:
+                fdst.seek(offset)
+                fdst.write(block)
+                written += len(block)
+            offset += len(block)
+        fdst.truncate(offset)
+    shutil.copystat(source_file, dest_file)
+    return written
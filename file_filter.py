@@ -0,0 +1,140 @@
+"""
+File Filter - Precompiled include/exclude rules applied during the scan
+"""
+import re
+import time
+import fnmatch
+from typing import List, Optional
+
+
+def normalize_extensions(extensions: Optional[List[str]]) -> frozenset:
+    """Lowercase extensions and make sure they start with a dot"""
+    return frozenset(
+        (ext if ext.startswith(".") else f".{ext}").lower()
+        for ext in (extensions or []) if ext
+    )
+
+
+def file_suffix(name: str) -> str:
+    """Lowercased extension of a file name, same rules as Path.suffix"""
+    i = name.rfind(".")
+    if i <= 0 or i == len(name) - 1:
+        return ""
+    return name[i:].lower()
+
+
+def compile_patterns(patterns: Optional[List[str]]):
+    """
+    Compile glob patterns into a single case-insensitive regex
+
+    Returns:
+        Compiled regex, or None if there are no patterns
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns), re.IGNORECASE)
+
+
+class FileFilter:
+    def __init__(self, include_extensions: List[str] = None,
+                 exclude_extensions: List[str] = None,
+                 include_patterns: List[str] = None,
+                 exclude_patterns: List[str] = None,
+                 exclude_dirs: List[str] = None,
+                 min_size: Optional[int] = None,
+                 max_size: Optional[int] = None,
+                 max_age_days: Optional[float] = None):
+        """
+        Compile filter rules once per run
+
+        Glob patterns are matched against the file name, or against the path
+        relative to the source directory (with "/" separators) when the
+        pattern itself contains a "/".
+
+        Args:
+            include_extensions: Extensions to include (empty = all)
+            exclude_extensions: Extensions to exclude
+            include_patterns: Glob patterns a file must match (empty = all)
+            exclude_patterns: Glob patterns of files to exclude
+            exclude_dirs: Directory names or glob patterns that are not descended into
+            min_size: Skip files smaller than this many bytes
+            max_size: Skip files larger than this many bytes
+            max_age_days: Skip files not modified in the last N days
+        """
+        self.include_extensions = normalize_extensions(include_extensions)
+        self.exclude_extensions = normalize_extensions(exclude_extensions)
+
+        self.include_name_patterns = compile_patterns([p for p in include_patterns or [] if "/" not in p])
+        self.include_path_patterns = compile_patterns([p for p in include_patterns or [] if "/" in p])
+        self.exclude_name_patterns = compile_patterns([p for p in exclude_patterns or [] if "/" not in p])
+        self.exclude_path_patterns = compile_patterns([p for p in exclude_patterns or [] if "/" in p])
+        self.has_include_patterns = bool(include_patterns)
+
+        # Plain directory names are looked up in a set, the rest go through a regex
+        exclude_dirs = exclude_dirs or []
+        self.exclude_dir_names = frozenset(d.lower() for d in exclude_dirs if not any(c in d for c in "*?["))
+        self.exclude_dir_patterns = compile_patterns([d for d in exclude_dirs if any(c in d for c in "*?[")])
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_mtime_ns = None
+        if max_age_days is not None:
+            self.min_mtime_ns = int((time.time() - max_age_days * 86400) * 1e9)
+
+    def include_dir(self, name: str) -> bool:
+        """Check if a directory should be descended into"""
+        if name.lower() in self.exclude_dir_names:
+            return False
+        if self.exclude_dir_patterns and self.exclude_dir_patterns.match(name):
+            return False
+        return True
+
+    def include_file(self, name: str, rel_path: Optional[str] = None) -> bool:
+        """
+        Check extension and pattern rules for a file
+
+        Args:
+            name: File name
+            rel_path: Path relative to the source directory (needed only for
+                patterns containing "/")
+
+        Returns:
+            True if file should be included, False otherwise
+        """
+        ext = file_suffix(name)
+
+        # If exclude list has this extension, skip it
+        if ext in self.exclude_extensions:
+            return False
+
+        # If include list exists, only include matching extensions
+        if self.include_extensions and ext not in self.include_extensions:
+            return False
+
+        if self.exclude_name_patterns and self.exclude_name_patterns.match(name):
+            return False
+
+        posix_path = None
+        if self.exclude_path_patterns or self.include_path_patterns:
+            posix_path = (rel_path or name).replace("\\", "/")
+            if self.exclude_path_patterns and self.exclude_path_patterns.match(posix_path):
+                return False
+
+        if self.has_include_patterns:
+            if self.include_name_patterns and self.include_name_patterns.match(name):
+                return True
+            if self.include_path_patterns and self.include_path_patterns.match(posix_path):
+                return True
+            return False
+
+        return True
+
+    def include_stat(self, size: int, mtime_ns: int) -> bool:
+        """Check size and age limits for a file"""
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.min_mtime_ns is not None and mtime_ns < self.min_mtime_ns:
+            return False
+        return True
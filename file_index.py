@@ -0,0 +1,150 @@
+"""
+File Index - Persistent state of backed up files for fast change detection
+"""
+import os
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from typing import Iterator, Optional
+
+# Default location of index databases (one per source/destination pair)
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".backup_index")
+
+# States staged by add() are written to the database in batches of this size
+STAGE_BATCH = 5000
+
+
+class FileIndex:
+    def __init__(self, source_dir: str, destination_dir: str, index_dir: str = None):
+        """
+        Initialize index for a source/destination pair
+
+        Args:
+            source_dir: Source directory of the backup
+            destination_dir: Destination directory of the backup
+            index_dir: Directory holding index databases (None = DEFAULT_INDEX_DIR)
+        """
+        self.source_dir = os.path.abspath(source_dir)
+        self.destination_dir = os.path.abspath(destination_dir)
+        self.index_dir = index_dir or DEFAULT_INDEX_DIR
+
+        key = hashlib.sha256(f"{self.source_dir}\0{self.destination_dir}".encode("utf-8")).hexdigest()
+        self.path = os.path.join(self.index_dir, f"{key[:32]}.sqlite")
+        self.conn = None
+        self.staged = []
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        """Open index database, creating it if needed"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        # Used from worker threads during a run, always under self.lock
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, ino INTEGER, hash TEXT"
+            ") WITHOUT ROWID"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        return conn
+
+    def open(self):
+        """
+        Open index for a run without loading it into memory
+
+        The previous state is looked up file by file with get(); the new
+        state is collected with add() in a temporary table and replaces the
+        previous one only on commit(), so memory stays bounded for any
+        number of files.
+        """
+        self.conn = self.connect()
+        # Staged states may outgrow memory, so the temporary table lives on disk
+        self.conn.execute("PRAGMA temp_store = FILE")
+        self.conn.execute(
+            "CREATE TEMP TABLE staged ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, ino INTEGER, hash TEXT"
+            ") WITHOUT ROWID"
+        )
+
+    def get(self, rel_path: str) -> Optional[dict]:
+        """State of a file from the last run (None if it was not backed up)"""
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime_ns, ino, hash FROM files WHERE path = ?",
+                                    (rel_path,)).fetchone()
+        if row is None:
+            return None
+        return {"size": row[0], "mtime_ns": row[1], "ino": row[2], "hash": row[3]}
+
+    def add(self, rel_path: str, state: dict):
+        """Stage the state of a file backed up by this run (thread-safe)"""
+        with self.lock:
+            self.staged.append((rel_path, state["size"], state["mtime_ns"], state.get("ino"), state.get("hash")))
+            if len(self.staged) >= STAGE_BATCH:
+                self.flush()
+
+    def flush(self):
+        """Write staged states to the temporary table (lock must be held)"""
+        if self.staged:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO staged (path, size, mtime_ns, ino, hash) VALUES (?, ?, ?, ?, ?)",
+                    self.staged)
+            self.staged = []
+
+    def paths(self) -> Iterator[str]:
+        """Paths of all files from the last run, read lazily"""
+        with self.lock:
+            rows = self.conn.execute("SELECT path FROM files").fetchmany
+        return self.iter_rows(rows)
+
+    def missing(self) -> Iterator[str]:
+        """Paths from the last run not added by this one, read lazily"""
+        with self.lock:
+            self.flush()
+            rows = self.conn.execute(
+                "SELECT path FROM files WHERE path NOT IN (SELECT path FROM staged)").fetchmany
+        return self.iter_rows(rows)
+
+    @staticmethod
+    def iter_rows(fetchmany) -> Iterator[str]:
+        while True:
+            rows = fetchmany(1000)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
+
+    def commit(self, complete: bool = True):
+        """
+        Atomically replace the stored state with the states added by this run
+        and close the index
+
+        Args:
+            complete: True if the run saw the whole source (files not added
+                are dropped); False after a cancelled run, when added files
+                are merged into the previous state
+        """
+        with self.lock:
+            try:
+                self.flush()
+                with self.conn:
+                    if complete:
+                        self.conn.execute("DELETE FROM files")
+                    self.conn.execute("INSERT OR REPLACE INTO files SELECT path, size, mtime_ns, ino, hash FROM staged")
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        [("source", self.source_dir),
+                         ("destination", self.destination_dir),
+                         ("updated", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))]
+                    )
+            finally:
+                self.conn.close()
+                self.conn = None
+
+    def close(self):
+        """Close the index, discarding states added by this run"""
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            self.staged = []
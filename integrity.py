@@ -0,0 +1,109 @@
+"""
+Integrity - Content hashes computed while copying and backup manifests
+"""
+import io
+import os
+import json
+import hashlib
+from datetime import datetime
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Supported algorithms, fastest last; xxh* need the optional 'xxhash' package
+HASH_ALGORITHMS = ("sha256", "blake2b", "xxh64", "xxh3_128")
+
+DEFAULT_HASH_ALGORITHM = "blake2b"
+
+# Manifest of a mirror backup, stored in the destination root
+MANIFEST_NAME = ".backup-manifest.json"
+
+
+def check_algorithm(algorithm: str):
+    """Raise ValueError if hash algorithm is unknown or not available"""
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unknown hash algorithm: {algorithm}")
+    if algorithm.startswith("xxh") and xxhash is None:
+        raise ValueError(f"{algorithm} requires the 'xxhash' package")
+
+
+def new_hasher(algorithm: str):
+    """Create a hash object with update()/hexdigest() for an algorithm"""
+    if algorithm == "xxh64":
+        return xxhash.xxh64()
+    if algorithm == "xxh3_128":
+        return xxhash.xxh3_128()
+    return hashlib.new(algorithm)
+
+
+def hash_file(file_path: str, algorithm: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hex digest of a file's content"""
+    h = new_hasher(algorithm)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HashingReader(io.RawIOBase):
+    def __init__(self, fileobj, hasher):
+        """
+        Readable stream passing data through a hasher on the way
+
+        Args:
+            fileobj: Underlying file opened for binary reading
+            hasher: Hash object updated with every byte read
+        """
+        super().__init__()
+        self.fileobj = fileobj
+        self.hasher = hasher
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+    def readinto(self, b) -> int:
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def load_manifest(directory: str) -> dict:
+    """
+    Load manifest of a mirror backup
+
+    Returns:
+        Manifest with "algorithm" and "files" (relative path -> {"size", "hash"}),
+        or empty dict if there is none
+    """
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(directory: str, algorithm: str, files: dict):
+    """
+    Atomically write manifest of a mirror backup
+
+    Args:
+        directory: Destination root of the backup
+        algorithm: Hash algorithm used for all entries
+        files: Dictionary mapping relative path to {"size", "hash"}
+    """
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "algorithm": algorithm,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "files": files
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
@@ -0,0 +1,103 @@
+"""
+Journal - Write-ahead log of files completed by a running backup
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from file_index import DEFAULT_INDEX_DIR
+
+# Journal is synced to disk at least this often while a backup runs (seconds)
+SYNC_INTERVAL = 1.0
+
+
+class BackupJournal:
+    def __init__(self, source_dir: str, destination_dir: str, index_dir: str = None):
+        """
+        Initialize journal for a source/destination pair
+
+        Every file finished by a run is appended as one JSON line. The journal
+        is deleted when the run completes, so a journal found at the start of
+        a run means the previous run was cancelled or crashed, and its entries
+        tell which files need not be copied again.
+
+        Args:
+            source_dir: Source directory of the backup
+            destination_dir: Destination directory of the backup
+            index_dir: Directory holding journals (None = DEFAULT_INDEX_DIR)
+        """
+        self.index_dir = index_dir or DEFAULT_INDEX_DIR
+        source_dir = os.path.abspath(source_dir)
+        destination_dir = os.path.abspath(destination_dir)
+        key = hashlib.sha256(f"{source_dir}\0{destination_dir}".encode("utf-8")).hexdigest()
+        self.path = os.path.join(self.index_dir, f"{key[:32]}.journal")
+        self.file = None
+        self.lock = threading.Lock()
+        self.last_sync = 0.0
+
+    def load(self) -> dict:
+        """
+        Read entries left by an interrupted run
+
+        A line cut short by a crash is ignored.
+
+        Returns:
+            Dictionary mapping relative path to file state
+        """
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    entries[record["path"]] = record["state"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return entries
+
+    def open(self):
+        """Open journal for appending (entries of an interrupted run are kept)"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.last_sync = time.monotonic()
+
+    def record(self, rel_path: str, state: dict):
+        """
+        Append a finished file (thread-safe)
+
+        The line is handed to the OS right away, so it survives the process
+        dying; fsync runs at most every SYNC_INTERVAL seconds to survive a
+        power loss without syncing after every file.
+        """
+        line = json.dumps({"path": rel_path, "state": state}, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line)
+            self.file.flush()
+            now = time.monotonic()
+            if now - self.last_sync >= SYNC_INTERVAL:
+                os.fsync(self.file.fileno())
+                self.last_sync = now
+
+    def close(self):
+        """Sync and close journal, keeping it for the next run"""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+
+    def remove(self):
+        """Close and delete journal after a completed run"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
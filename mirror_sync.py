@@ -0,0 +1,121 @@
+"""
+Mirror Sync - Finds destination files deleted from the source by merging two sorted scans
+"""
+import os
+from typing import Iterator, List, Optional, Tuple
+from file_filter import FileFilter
+
+# Folder in the destination root receiving quarantined files, one
+# subfolder per run
+QUARANTINE_DIR = ".backup-quarantine"
+
+
+def walk_sorted(root: str, file_filter: Optional[FileFilter] = None, errors: Optional[List[str]] = None,
+                skip_names: frozenset = frozenset(), skip_suffixes: Tuple[str, ...] = ()
+                ) -> Iterator[Tuple[str, int]]:
+    """
+    Walk a tree depth-first with every directory listing sorted by name
+
+    Files come out ordered by their path components, so two walks can be
+    merged like sorted lists. Only one listing per directory level is held
+    in memory, however large the tree is.
+
+    Args:
+        root: Directory to walk
+        file_filter: Directories it excludes are not descended into and files
+            its name rules exclude are not yielded (None = everything)
+        errors: List receiving a message for every directory that could not be read
+        skip_names: Names skipped in the root directory only
+        skip_suffixes: Files ending with one of these are not yielded
+
+    Yields:
+        Tuples (path relative to root, size)
+    """
+    # Stack of iterators over sorted listings; entries are (name, path, is_dir, size)
+    stack = [(root, "")]
+    listings = []
+    while stack or listings:
+        if stack:
+            dir_path, rel_dir = stack.pop()
+            items = []
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if not rel_dir and entry.name in skip_names:
+                            continue
+                        try:
+                            is_dir = entry.is_dir() and not entry.is_symlink()
+                            size = 0 if is_dir else entry.stat(follow_symlinks=False).st_size
+                        except OSError as e:
+                            if errors is not None:
+                                errors.append(f"Failed to scan {entry.path}: {e}")
+                            continue
+                        items.append((entry.name, entry.path, is_dir, size))
+            except OSError as e:
+                if errors is not None:
+                    errors.append(f"Failed to scan {dir_path}: {e}")
+            items.sort()
+            listings.append((rel_dir, iter(items)))
+            continue
+
+        rel_dir, items = listings[-1]
+        item = next(items, None)
+        if item is None:
+            listings.pop()
+            continue
+        name, path, is_dir, size = item
+        rel_path = os.path.join(rel_dir, name) if rel_dir else name
+        if is_dir:
+            if file_filter is None or file_filter.include_dir(name):
+                stack.append((path, rel_path))
+        elif name.endswith(skip_suffixes):
+            continue
+        elif file_filter is None or file_filter.include_file(name, rel_path):
+            yield rel_path, size
+
+
+def path_key(rel_path: str) -> Tuple[str, ...]:
+    """Sort key matching the order of walk_sorted"""
+    return tuple(rel_path.split(os.sep))
+
+
+def find_extraneous(source_dir: str, destination_dir: str, file_filter: Optional[FileFilter] = None,
+                    errors: Optional[List[str]] = None, skip_names: frozenset = frozenset(),
+                    skip_suffixes: Tuple[str, ...] = ()) -> Iterator[Tuple[str, int]]:
+    """
+    Destination files that no longer exist in the source
+
+    Both trees are walked in the same sorted order and merged, so memory use
+    does not grow with the number of files. Directories excluded by the
+    filter are skipped on both sides and destination files excluded by its
+    name rules are never reported, so excluded files are protected.
+
+    Args:
+        source_dir: Source directory of the mirror
+        destination_dir: Mirror destination
+        file_filter: Filter rules of the backup
+        errors: List receiving destination scan errors
+        skip_names: Destination root entries that belong to the backup itself
+        skip_suffixes: Destination files to ignore (e.g. temporary copies)
+
+    Yields:
+        Tuples (relative path, size) of extraneous destination files
+
+    Raises:
+        OSError: If a source directory cannot be read; nothing after it is reported
+    """
+    source_errors = []
+    source = walk_sorted(source_dir, file_filter, source_errors)
+    destination = walk_sorted(destination_dir, file_filter, errors, skip_names, skip_suffixes)
+    source_item = next(source, None)
+    for rel_path, size in destination:
+        key = path_key(rel_path)
+        while source_item is not None and path_key(source_item[0]) < key:
+            source_item = next(source, None)
+        # Every source directory ordered before this file has been read by
+        # now; if one failed, its files would wrongly look deleted
+        if source_errors:
+            raise OSError(f"Source scan incomplete: {source_errors[0]}")
+        if source_item is not None and source_item[0] == rel_path:
+            continue
+        yield rel_path, size
@@ -0,0 +1,80 @@
+"""
+Progress - Rate-limited progress snapshots published through a queue
+"""
+import time
+import queue
+from typing import Optional, NamedTuple
+
+
+class ProgressSnapshot(NamedTuple):
+    """State of a running operation at one point in time"""
+    phase: str               # "scan", "copy" or "done"
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int
+    throughput: float        # bytes per second since the phase started
+    eta: Optional[float]     # seconds until the phase ends (None = unknown)
+    current_file: str
+
+
+class ProgressReporter:
+    def __init__(self, progress_queue: Optional[queue.Queue] = None, interval: float = 0.25):
+        """
+        Initialize progress reporter
+
+        Snapshots are put on the queue at most once per interval, so the
+        consumer (e.g. a GUI polling with root.after) never has to keep up with
+        per-file updates from the worker threads.
+
+        Args:
+            progress_queue: Queue receiving ProgressSnapshot objects (None = disabled)
+            interval: Minimum number of seconds between two snapshots
+        """
+        self.queue = progress_queue
+        self.interval = interval
+        self.phase = None
+        self.phase_start = 0.0
+        self.last_publish = 0.0
+        self.last_values = (0, 0, 0, 0)
+
+    def start_phase(self, phase: str):
+        """Start timing a new phase"""
+        self.phase = phase
+        self.phase_start = time.monotonic()
+        self.last_publish = 0.0
+
+    def update(self, files_done: int, files_total: int, bytes_done: int, bytes_total: int,
+               current_file: str = "", force: bool = False):
+        """
+        Publish a snapshot if the interval elapsed since the last one
+
+        Args:
+            files_done: Files processed so far
+            files_total: Total files in this phase (0 = not known yet)
+            bytes_done: Bytes processed so far
+            bytes_total: Total bytes in this phase (0 = not known yet)
+            current_file: Name of the file being processed
+            force: Publish even if the interval did not elapse
+        """
+        self.last_values = (files_done, files_total, bytes_done, bytes_total)
+        if self.queue is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_publish < self.interval:
+            return
+        self.last_publish = now
+
+        elapsed = now - self.phase_start
+        throughput = bytes_done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if throughput > 0 and bytes_total:
+            eta = max(bytes_total - bytes_done, 0) / throughput
+
+        self.queue.put(ProgressSnapshot(self.phase, files_done, files_total, bytes_done,
+                                        bytes_total, throughput, eta, current_file))
+
+    def finish(self):
+        """Publish the final snapshot of an operation with the last reported values"""
+        self.phase = "done"
+        self.update(*self.last_values, force=True)
@@ -0,0 +1,102 @@
+"""
+Retention - Which backup versions to keep ("keep 7 daily, 4 weekly, 12 monthly")
+"""
+import re
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Set
+
+# Time stamp embedded in snapshot ids and archive names
+TIMESTAMP_PATTERN = re.compile(r"(\d{8}-\d{6})(?:-(\d{6}))?")
+
+
+class RetentionPolicy(NamedTuple):
+    """Number of versions to keep; 0 disables a rule"""
+    last: int = 0       # most recent versions, regardless of age
+    daily: int = 0      # newest version of each of the last N days with a backup
+    weekly: int = 0     # newest version of each of the last N ISO weeks with a backup
+    monthly: int = 0
+    yearly: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not any(self)
+
+
+# Period a version falls into, per rule
+PERIODS = (
+    ("daily", lambda t: t.date()),
+    ("weekly", lambda t: t.isocalendar()[:2]),
+    ("monthly", lambda t: (t.year, t.month)),
+    ("yearly", lambda t: t.year),
+)
+
+
+def parse_retention(text: Optional[str]) -> RetentionPolicy:
+    """
+    Parse a policy like "daily=7, weekly=4, monthly=12"
+
+    Keys are the RetentionPolicy fields; entries may be separated by commas,
+    semicolons or spaces. An empty text gives an empty policy (keep all).
+
+    Raises:
+        ValueError: If the text is not a valid policy
+    """
+    values = {}
+    for item in re.split(r"[,;\s]+", (text or "").strip()):
+        if not item:
+            continue
+        key, _, count = item.partition("=")
+        key = key.strip().lower()
+        if key not in RetentionPolicy._fields:
+            raise ValueError(f"Unknown retention rule '{key}' (use {', '.join(RetentionPolicy._fields)})")
+        try:
+            values[key] = int(count)
+        except ValueError:
+            raise ValueError(f"Invalid retention count in '{item}' (expected e.g. daily=7)")
+        if values[key] < 0:
+            raise ValueError(f"Invalid retention count in '{item}' (expected e.g. daily=7)")
+    return RetentionPolicy(**values)
+
+
+def parse_timestamp(version: str) -> Optional[datetime]:
+    """Time a snapshot id or archive name was created, or None if it has no time stamp"""
+    match = TIMESTAMP_PATTERN.search(version)
+    if match is None:
+        return None
+    try:
+        created = datetime.strptime(match.group(1), "%Y%m%d-%H%M%S")
+    except ValueError:
+        return None
+    return created.replace(microsecond=int(match.group(2) or 0))
+
+
+def select_to_keep(versions: Dict[str, datetime], policy: RetentionPolicy) -> Set[str]:
+    """
+    Versions kept by a policy
+
+    Every rule walks the versions newest first and keeps the newest one of
+    each period until it has kept as many periods as it allows; a version
+    kept by any rule stays. The newest version is always kept.
+
+    Args:
+        versions: Version name -> creation time
+        policy: Retention policy
+
+    Returns:
+        Names of versions to keep (all of them if the policy is empty)
+    """
+    if policy.empty:
+        return set(versions)
+    ordered = sorted(versions, key=lambda name: versions[name], reverse=True)
+    keep = set(ordered[:max(policy.last, 1)])
+    for field, period in PERIODS:
+        count = getattr(policy, field)
+        seen = set()
+        for name in ordered:
+            if len(seen) >= count:
+                break
+            key = period(versions[name])
+            if key not in seen:
+                seen.add(key)
+                keep.add(name)
+    return keep
@@ -0,0 +1,159 @@
+"""
+Run History - Durations of past backups, used to estimate how long a planned one takes
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+from file_index import DEFAULT_INDEX_DIR
+
+HISTORY_FILE = "run_history.json"
+
+# Runs remembered per source/destination pair
+MAX_RUNS = 20
+
+# One lock per history file, shared by every RunHistory of the process
+HISTORY_LOCKS = {}
+HISTORY_LOCKS_GUARD = threading.Lock()
+
+
+def history_lock(path: str) -> threading.Lock:
+    """Lock serializing updates of a history file within this process"""
+    path = os.path.realpath(path)
+    with HISTORY_LOCKS_GUARD:
+        return HISTORY_LOCKS.setdefault(path, threading.Lock())
+
+
+def fit_rates(runs: List[dict]) -> Optional[Tuple[float, float]]:
+    """
+    Fit seconds = bytes * seconds_per_byte + files * seconds_per_file
+
+    Least squares over the given runs; when the runs cannot separate the two
+    costs (one run, or all with the same bytes-per-file ratio) the whole time
+    is attributed to bytes, or to files if no bytes were copied.
+
+    Args:
+        runs: Recorded runs with "bytes", "files" and "seconds"
+
+    Returns:
+        Tuple (seconds per byte, seconds per file), or None without usable runs
+    """
+    runs = [r for r in runs if r.get("seconds", 0) > 0]
+    if not runs:
+        return None
+    sbb = sum(r["bytes"] * r["bytes"] for r in runs)
+    sff = sum(r["files"] * r["files"] for r in runs)
+    sbf = sum(r["bytes"] * r["files"] for r in runs)
+    sbt = sum(r["bytes"] * r["seconds"] for r in runs)
+    sft = sum(r["files"] * r["seconds"] for r in runs)
+    det = sbb * sff - sbf * sbf
+    if det > 1e-9 * sbb * sff:
+        per_byte = (sbt * sff - sft * sbf) / det
+        per_file = (sft * sbb - sbt * sbf) / det
+        if per_byte >= 0 and per_file >= 0:
+            return per_byte, per_file
+
+    total_seconds = sum(r["seconds"] for r in runs)
+    total_bytes = sum(r["bytes"] for r in runs)
+    if total_bytes > 0:
+        return total_seconds / total_bytes, 0.0
+    total_files = sum(r["files"] for r in runs)
+    if total_files > 0:
+        return 0.0, total_seconds / total_files
+    return None
+
+
+class RunHistory:
+    def __init__(self, index_dir: Optional[str] = None):
+        """
+        Initialize run history stored as JSON in the index directory
+
+        Args:
+            index_dir: Directory holding the history file (None = DEFAULT_INDEX_DIR)
+        """
+        self.index_dir = index_dir or DEFAULT_INDEX_DIR
+        self.path = os.path.join(self.index_dir, HISTORY_FILE)
+        self.lock = history_lock(self.path)
+
+    @staticmethod
+    def key(source_dir: str, destination_dir: str) -> str:
+        """History key of a source/destination pair"""
+        pair = f"{os.path.abspath(source_dir)}\0{os.path.abspath(destination_dir)}"
+        return hashlib.sha256(pair.encode("utf-8")).hexdigest()[:32]
+
+    def load(self) -> dict:
+        """Load all recorded runs (key -> list of runs, oldest first)"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, source_dir: str, destination_dir: str, storage: str,
+               files: int, bytes_copied: int, seconds: float):
+        """
+        Remember a completed run
+
+        The file is re-read and rewritten under the lock of its path, so
+        engines updating it at the same time keep each other's runs; the
+        new content is written to a temporary file of its own and moved into
+        place, so a reader never sees a partial file.
+
+        Args:
+            source_dir: Source directory of the backup
+            destination_dir: Destination directory of the backup
+            storage: Storage type of the run
+            files: Files processed (copied or checked)
+            bytes_copied: Bytes of the files that were copied
+            seconds: Duration of the copy stage
+        """
+        with self.lock:
+            history = self.load()
+            runs = history.setdefault(self.key(source_dir, destination_dir), [])
+            runs.append({
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "storage": storage,
+                "files": files,
+                "bytes": bytes_copied,
+                "seconds": round(seconds, 3)
+            })
+            del runs[:-MAX_RUNS]
+            os.makedirs(self.index_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=HISTORY_FILE + ".", suffix=".tmp", dir=self.index_dir)
+            try:
+                with open(fd, "w", encoding="utf-8") as f:
+                    json.dump(history, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+
+    def rates(self, source_dir: str, destination_dir: str, storage: str) -> Tuple[Optional[Tuple[float, float]], str]:
+        """
+        Copy costs measured for a backup
+
+        Runs of the same pair and storage type are preferred; without them
+        every recorded run with that storage type is used.
+
+        Returns:
+            Tuple (fit_rates result or None, "job", "all" or "none" telling
+            which runs the estimate is based on)
+        """
+        history = self.load()
+        runs = [r for r in history.get(self.key(source_dir, destination_dir), []) if r.get("storage") == storage]
+        rates = fit_rates(runs)
+        if rates is not None:
+            return rates, "job"
+        runs = [r for pair_runs in history.values() for r in pair_runs if r.get("storage") == storage]
+        rates = fit_rates(runs)
+        if rates is not None:
+            return rates, "all"
+        return None, "none"
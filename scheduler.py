@@ -1,99 +1,503 @@
 """
 Scheduler - Handles scheduled backup operations
 """
-import schedule
+import os
+import json
+import random
 import threading
-from typing import List, Optional
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from backup_engine import BackupEngine
+from file_filter import FileFilter
+from file_index import DEFAULT_INDEX_DIR
+from throttle import make_throttle
+from integrity import check_algorithm
+from retention import parse_retention
+from typing import Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+
+# Last handled run of every job, used to catch up on runs missed while the
+# machine was off or asleep
+DEFAULT_STATE_FILE = os.path.join(DEFAULT_INDEX_DIR, "scheduler_state.json")
+
+# How far ahead next_fire looks before deciding an expression never fires
+# (covers Feb 29 falling on a given weekday)
+MAX_SEARCH_DAYS = 366 * 28
+
+WEEKDAY_NAMES = {"sun": 0, "mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6}
+MONTH_NAMES = {"jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+               "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12}
+
+
+def parse_cron_field(text: str, low: int, high: int, names: Optional[Dict[str, int]] = None) -> frozenset:
+    """
+    Parse one cron field ("*", "5", "1-5", "*/15", "mon,wed,fri", ...)
+
+    Args:
+        text: Field text
+        low: Smallest allowed value
+        high: Largest allowed value
+        names: Optional mapping of names (e.g. "mon") to values
+
+    Returns:
+        Set of values the field matches
+    """
+    def value(token: str) -> int:
+        token = token.lower()
+        if names and token in names:
+            return names[token]
+        if not token.isdigit():
+            raise ValueError(f"Invalid cron value: {token}")
+        return int(token)
+
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = value(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid cron step: {step_text}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (value(v) for v in part.split("-", 1))
+        else:
+            start = value(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron value out of range {low}-{high}: {text}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    def __init__(self, expression: str):
+        """
+        Parse a 5-field cron expression: minute hour day-of-month month day-of-week
+
+        Day of week is 0-6 starting on Sunday (7 is also Sunday) or a name
+        (mon, tue, ...). As in cron, when both day of month and day of week
+        are restricted, a day matching either of them fires.
+
+        Args:
+            expression: Cron expression, e.g. "30 2 * * mon-fri"
+
+        Raises:
+            ValueError: If the expression is invalid
+        """
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.expression = expression
+        self.minutes = sorted(parse_cron_field(fields[0], 0, 59))
+        self.hours = sorted(parse_cron_field(fields[1], 0, 23))
+        self.days = parse_cron_field(fields[2], 1, 31)
+        self.months = parse_cron_field(fields[3], 1, 12, MONTH_NAMES)
+        self.weekdays = frozenset(d % 7 for d in parse_cron_field(fields[4], 0, 7, WEEKDAY_NAMES))
+        # As in Vixie cron, a field starting with "*" (also "*/2") counts as unrestricted
+        self.any_day = fields[2].startswith("*")
+        self.any_weekday = fields[4].startswith("*")
+
+    def matches_day(self, day: datetime) -> bool:
+        """Check month, day-of-month and day-of-week fields for a date"""
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        weekday_match = day.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    def next_fire(self, after: datetime) -> datetime:
+        """
+        First fire time strictly after a moment
+
+        Walks day by day and only looks at hours and minutes of matching
+        days, so even rare expressions take at most a few thousand steps.
+
+        Raises:
+            ValueError: If the expression never fires (e.g. "0 0 31 2 *")
+        """
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(MAX_SEARCH_DAYS):
+            if self.matches_day(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        fire = day.replace(hour=hour, minute=minute)
+                        if fire >= start:
+                            return fire
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+
+def cron_from_schedule(schedule_type: str, time_str: str) -> str:
+    """
+    Cron expression for the simple schedule types
+
+    Args:
+        schedule_type: 'daily', 'weekly' (Mondays) or 'monthly' (1st of month)
+        time_str: Time in HH:MM format (24-hour)
+    """
+    try:
+        hour, minute = (int(v) for v in time_str.split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid time (expected HH:MM): {time_str}")
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"Invalid time (expected HH:MM): {time_str}")
+    if schedule_type == "daily":
+        return f"{minute} {hour} * * *"
+    if schedule_type == "weekly":
+        return f"{minute} {hour} * * mon"
+    if schedule_type == "monthly":
+        return f"{minute} {hour} 1 * *"
+    raise ValueError(f"Unknown schedule type: {schedule_type}")
+
+
+def device_of(path: str) -> int:
+    """Device id of path, or of its nearest existing parent"""
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return -1
+            path = parent
 
 
 class BackupScheduler:
-    def __init__(self, backup_engine):
+    def __init__(self, engine_factory: Callable[[], BackupEngine] = BackupEngine,
+                 max_workers: int = 2, max_jobs_per_device: int = 1,
+                 state_file: Optional[str] = DEFAULT_STATE_FILE):
         """
         Initialize backup scheduler
 
+        Jobs are identified by name and run on a bounded worker pool, never on
+        the thread calling run_pending. A job that is still running is not
+        started again, and jobs writing to the same destination device wait
+        for a free slot instead of competing for its I/O.
+
         Args:
-            backup_engine: BackupEngine instance to use for scheduled backups
+            engine_factory: Function returning a new BackupEngine; every run
+                gets its own engine so concurrent jobs do not share state
+            max_workers: Maximum number of jobs running at once
+            max_jobs_per_device: Maximum number of running jobs per destination device
+            state_file: JSON file remembering the last run of every job, used
+                to catch up on missed runs (None = do not remember)
         """
-        self.backup_engine = backup_engine
-        self.scheduled_jobs = []
+        self.engine_factory = engine_factory
+        self.max_jobs_per_device = max_jobs_per_device
+        self.state_file = state_file
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backup-job")
+        self.lock = threading.Lock()
+        self.jobs = {}            # name -> backup arguments
+        self.timers = {}          # name -> {"cron", "jitter", "fire_time", "next_run"}
+        self.retention = {}       # name -> RetentionPolicy applied after every successful run
+        self.running = {}         # name -> BackupEngine of the running job
+        self.waiting = deque()    # (name, fire time) of jobs waiting for a device slot
+        self.device_jobs = {}     # device -> number of running jobs
         self.last_run = None
+        self.last_results = {}    # name -> result of the last run
+        self.state = self.load_state()
+
+    def load_state(self) -> dict:
+        """Load last run times of jobs from the state file"""
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return {name: datetime.fromisoformat(value) for name, value in json.load(f).items()}
+        except Exception as e:
+            print(f"[Scheduler] Cannot read state file {self.state_file}: {e}")
+            return {}
+
+    def save_state(self):
+        """Atomically write last run times of jobs (lock must be held)"""
+        if not self.state_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+            temp_path = self.state_file + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({name: value.isoformat() for name, value in self.state.items()}, f, indent=2)
+            os.replace(temp_path, self.state_file)
+        except OSError as e:
+            print(f"[Scheduler] Cannot write state file {self.state_file}: {e}")
 
     def schedule_backup(self, schedule_type: str, time_str: str,
                        source_dir: str, destination_dir: str,
                        include_extensions: List[str] = None,
-                       exclude_extensions: List[str] = None):
+                       exclude_extensions: List[str] = None,
+                       exclude_dirs: List[str] = None,
+                       incremental: bool = False,
+                       workers: int = 1,
+                       storage: str = "mirror",
+                       compression: str = "gz",
+                       volume_size: Optional[int] = None,
+                       delta_threshold: Optional[int] = None,
+                       name: str = "default",
+                       cron: Optional[str] = None,
+                       jitter: float = 0,
+                       catch_up: bool = True,
+                       max_mb_per_second: Optional[float] = None,
+                       max_files_per_second: Optional[float] = None,
+                       throttle_profile: Optional[str] = None,
+                       hash_algorithm: Optional[str] = None,
+                       retention: Optional[str] = None,
+                       deletions: Optional[str] = None) -> bool:
         """
         Schedule a backup operation
 
+        Scheduling a job under an existing name replaces that job. If a run
+        was due while the scheduler was not running (machine off or asleep),
+        one catch-up run is started right away.
+
         Args:
-            schedule_type: Type of schedule ('daily', 'weekly', 'monthly')
-            time_str: Time in HH:MM format (24-hour)
+            schedule_type: Type of schedule ('daily', 'weekly', 'monthly');
+                ignored when cron is given
+            time_str: Time in HH:MM format (24-hour); ignored when cron is given
             source_dir: Source directory to backup
             destination_dir: Destination directory
             include_extensions: Extensions to include
             exclude_extensions: Extensions to exclude
+            exclude_dirs: Directory names (or glob patterns) to skip entirely
+            incremental: Copy only files changed since the previous run
+            workers: Number of files copied concurrently
+            storage: Backup storage type ('mirror', 'snapshot', 'dedup' or 'archive')
+            compression: Archive compression when storage is 'archive'
+            volume_size: Maximum archive volume size in bytes (None = single file)
+            delta_threshold: Update changed files of at least this size in place,
+                writing only changed blocks (None = disabled)
+            name: Name identifying the job
+            cron: Cron expression ("minute hour day month weekday")
+            jitter: Start every run up to this many seconds late, picked at
+                random, so many machines do not hit the same target at once
+            catch_up: Run once right away if a run was missed
+            max_mb_per_second: Bandwidth limit of the job (None = unlimited)
+            max_files_per_second: Files processed per second (None = unlimited)
+            throttle_profile: Time-of-day limits overriding the two above, e.g.
+                "08:00-18:00=20" for 20 MB/s during the day (see parse_profile)
+            hash_algorithm: Record file hashes for verify() (None = no hashes)
+            retention: Versions to keep, e.g. "daily=7, weekly=4, monthly=12";
+                older snapshots or archives are pruned after every successful
+                run (None = keep all, see parse_retention)
+            deletions: In mirror storage, "delete" or "quarantine" files
+                deleted from the source (None = keep them)
+
+        Returns:
+            True if the job was scheduled, False if the schedule is invalid
         """
-        # Clear existing schedules
-        schedule.clear()
+        try:
+            cron_schedule = CronSchedule(cron or cron_from_schedule(schedule_type, time_str))
+            throttle = make_throttle(max_mb_per_second, max_files_per_second, throttle_profile)
+            if hash_algorithm is not None:
+                check_algorithm(hash_algorithm)
+            policy = parse_retention(retention)
+            now = datetime.now()
+            fire_time = cron_schedule.next_fire(now)
+        except ValueError as e:
+            print(f"[Scheduler] Error scheduling backup '{name}': {e}")
+            return False
 
-        # Create backup job
-        def backup_job():
-            print(f"[Scheduler] Running scheduled backup at {datetime.now()}")
-            result = self.backup_engine.backup(
-                source_dir=source_dir,
-                destination_dir=destination_dir,
-                include_extensions=include_extensions,
-                exclude_extensions=exclude_extensions
-            )
+        self.remove_job(name)
 
-            self.last_run = datetime.now()
+        with self.lock:
+            self.jobs[name] = {
+                "source_dir": source_dir,
+                "destination_dir": destination_dir,
+                "file_filter": FileFilter(include_extensions, exclude_extensions, exclude_dirs=exclude_dirs),
+                "incremental": incremental,
+                "workers": workers,
+                "storage": storage,
+                "compression": compression,
+                "volume_size": volume_size,
+                "delta_threshold": delta_threshold,
+                "throttle": throttle,
+                "hash_algorithm": hash_algorithm,
+                "deletions": deletions
+            }
+            if not policy.empty:
+                self.retention[name] = policy
+            timer = {"cron": cron_schedule, "jitter": jitter, "fire_time": fire_time,
+                     "next_run": self.add_jitter(fire_time, jitter)}
 
-            if result["success"]:
-                print(f"[Scheduler] Backup completed: {result['copied']} files copied")
-            else:
-                print(f"[Scheduler] Backup failed: {result.get('error', 'Unknown error')}")
+            last = self.state.get(name)
+            if last is None:
+                # First time this job is seen: runs missed from now on can be caught up
+                self.state[name] = now
+                self.save_state()
+            elif catch_up and cron_schedule.next_fire(last) <= now:
+                # One run covers every run missed up to now
+                timer["fire_time"] = now
+                timer["next_run"] = self.add_jitter(now, jitter)
+                print(f"[Scheduler] Backup '{name}' missed its run at {cron_schedule.next_fire(last)}, "
+                      f"catching up")
+            self.timers[name] = timer
+
+        print(f"[Scheduler] Scheduled backup '{name}' ({cron_schedule.expression}), "
+              f"next run at {timer['next_run']}")
+        return True
+
+    @staticmethod
+    def add_jitter(fire_time: datetime, jitter: float) -> datetime:
+        """Delay a fire time by a random amount up to jitter seconds"""
+        if jitter <= 0:
+            return fire_time
+        return fire_time + timedelta(seconds=random.uniform(0, jitter))
+
+    def submit(self, name: str, fire_time: Optional[datetime] = None):
+        """
+        Start a job on the worker pool now
+
+        A job that is already running or waiting is not started twice; a job
+        whose destination device has no free slot waits until one is released.
+
+        Args:
+            name: Job name
+            fire_time: Scheduled time this run covers (None = manual run)
+        """
+        with self.lock:
+            if name not in self.jobs:
+                return
+            if name in self.running or any(n == name for n, _ in self.waiting):
+                print(f"[Scheduler] Backup '{name}' is still running, skipping this run")
+                return
+            self.waiting.append((name, fire_time))
+            self.start_waiting()
+
+    def start_waiting(self):
+        """Start waiting jobs whose destination device has a free slot (lock must be held)"""
+        for item in list(self.waiting):
+            name, fire_time = item
+            job = self.jobs.get(name)
+            if job is None:
+                self.waiting.remove(item)
+                continue
+            device = device_of(job["destination_dir"])
+            if self.device_jobs.get(device, 0) >= self.max_jobs_per_device:
+                continue
+            self.waiting.remove(item)
+            self.device_jobs[device] = self.device_jobs.get(device, 0) + 1
+            engine = self.engine_factory()
+            engine.job = name
+            self.running[name] = engine
+            self.pool.submit(self.run_job, name, job, engine, device, fire_time)
 
-        # Schedule based on type
+    def run_job(self, name: str, job: dict, engine: BackupEngine, device: int,
+                fire_time: Optional[datetime] = None):
+        """Run one job on a pool thread and release its device slot afterwards"""
         try:
-            if schedule_type == "daily":
-                schedule.every().day.at(time_str).do(backup_job)
-                print(f"[Scheduler] Scheduled daily backup at {time_str}")
-
-            elif schedule_type == "weekly":
-                # Weekly backup on Monday at specified time
-                schedule.every().monday.at(time_str).do(backup_job)
-                print(f"[Scheduler] Scheduled weekly backup (Mondays) at {time_str}")
-
-            elif schedule_type == "monthly":
-                # Monthly backup on 1st of each month at specified time
-                # Note: schedule library doesn't have native monthly support,
-                # so we use daily check and only run on 1st
-                def monthly_backup_job():
-                    if datetime.now().day == 1:
-                        backup_job()
-
-                schedule.every().day.at(time_str).do(monthly_backup_job)
-                print(f"[Scheduler] Scheduled monthly backup (1st of month) at {time_str}")
+            print(f"[Scheduler] Running scheduled backup '{name}' at {datetime.now()}")
+            result = engine.backup(**job)
 
+            if result["success"]:
+                print(f"[Scheduler] Backup '{name}' completed: {result['copied']} files copied, "
+                      f"{result['unchanged']} unchanged, {result['deleted']} deleted in source")
+                policy = self.retention.get(name)
+                if policy is not None:
+                    self.prune(name, job, engine, policy)
             else:
-                print(f"[Scheduler] Unknown schedule type: {schedule_type}")
-
+                print(f"[Scheduler] Backup '{name}' failed: {result.get('error', 'Unknown error')}")
         except Exception as e:
-            print(f"[Scheduler] Error scheduling backup: {e}")
+            result = {"success": False, "error": str(e)}
+            print(f"[Scheduler] Backup '{name}' failed: {e}")
+        finally:
+            with self.lock:
+                self.last_run = datetime.now()
+                self.last_results[name] = result
+                # Recorded only once the run ended, so a run interrupted by a
+                # shutdown is caught up after restart
+                if fire_time is not None and name in self.jobs:
+                    self.state[name] = fire_time
+                    self.save_state()
+                self.running.pop(name, None)
+                self.device_jobs[device] -= 1
+                self.start_waiting()
+
+    def prune(self, name: str, job: dict, engine: BackupEngine, policy):
+        """Delete versions of a job's backup not kept by its retention policy"""
+        pruned = engine.prune(job["destination_dir"], policy)
+        if not pruned["success"]:
+            print(f"[Scheduler] Pruning '{name}' failed: {pruned['error']}")
+            return
+        print(f"[Scheduler] Pruned '{name}': {len(pruned['removed'])} removed, {len(pruned['kept'])} kept, "
+              f"{pruned['bytes_freed'] / 1048576:.1f} MB freed")
+        for error in pruned["errors"]:
+            print(f"[Scheduler] Pruning '{name}': {error}")
 
     def run_pending(self):
-        """Run pending scheduled jobs"""
-        schedule.run_pending()
+        """Hand jobs that are due to the worker pool (returns immediately)"""
+        now = datetime.now()
+        due = []
+        with self.lock:
+            for name, timer in self.timers.items():
+                if timer["next_run"] <= now:
+                    due.append((name, timer["fire_time"]))
+                    # Runs missed while this call was late are folded into this one
+                    timer["fire_time"] = timer["cron"].next_fire(max(now, timer["fire_time"]))
+                    timer["next_run"] = self.add_jitter(timer["fire_time"], timer["jitter"])
+        for name, fire_time in due:
+            self.submit(name, fire_time)
+
+    def get_next_run(self, name: Optional[str] = None) -> Optional[datetime]:
+        """
+        Get next scheduled run time
+
+        Args:
+            name: Job name (None = earliest run across all jobs)
+        """
+        with self.lock:
+            if name is not None:
+                timer = self.timers.get(name)
+                return timer["next_run"] if timer else None
+            runs = [timer["next_run"] for timer in self.timers.values()]
+        return min(runs) if runs else None
+
+    def idle_seconds(self) -> Optional[float]:
+        """Seconds until the next scheduled job (None = nothing scheduled)"""
+        next_run = self.get_next_run()
+        if next_run is None:
+            return None
+        return (next_run - datetime.now()).total_seconds()
+
+    def job_names(self) -> List[str]:
+        """Names of all scheduled jobs"""
+        with self.lock:
+            return list(self.jobs)
+
+    def is_running(self, name: str) -> bool:
+        """True if the job is running or waiting for its device"""
+        with self.lock:
+            return name in self.running or any(n == name for n, _ in self.waiting)
+
+    def remove_job(self, name: str):
+        """Remove a job from the schedule (a run in progress is not interrupted)"""
+        with self.lock:
+            self.jobs.pop(name, None)
+            self.timers.pop(name, None)
+            self.retention.pop(name, None)
+            for item in [item for item in self.waiting if item[0] == name]:
+                self.waiting.remove(item)
+
+    def cancel_running(self):
+        """Cancel all running jobs and drop the waiting ones"""
+        with self.lock:
+            self.waiting.clear()
+            for engine in self.running.values():
+                engine.cancel()
 
-    def get_next_run(self) -> Optional[datetime]:
-        """Get next scheduled run time"""
-        jobs = schedule.get_jobs()
-        if jobs:
-            return jobs[0].next_run
-        return None
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs and optionally wait for running ones to finish"""
+        self.pool.shutdown(wait=wait)
 
     def clear_all(self):
         """Clear all scheduled jobs"""
-        schedule.clear()
+        with self.lock:
+            self.jobs.clear()
+            self.timers.clear()
+            self.retention.clear()
+            self.waiting.clear()
         print("[Scheduler] All schedules cleared")
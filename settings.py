@@ -0,0 +1,146 @@
+"""
+Settings - Podesavanja zajednicka za GUI i komandnu liniju (bez GUI zavisnosti)
+"""
+import os
+import json
+from typing import Dict, List, Optional
+
+SETTINGS_FILE = "podesavanja.json"
+
+# Naziv posla opisanog poljima na vrhu podesavanja (posao iz GUI-ja)
+PODRAZUMEVANI_POSAO = "default"
+
+# Tip rasporeda iz podesavanja -> schedule_type za BackupScheduler
+TIPOVI_RASPOREDA = {"dnevno": "daily", "nedeljno": "weekly", "mesecno": "monthly"}
+
+# Sta kopija foldera radi sa fajlovima obrisanim u izvoru -> deletions za BackupEngine.backup
+NACINI_BRISANJA = {"zadrzi": None, "obrisi": "delete", "karantin": "quarantine"}
+
+
+def ucitaj_podesavanja(putanja: str = SETTINGS_FILE) -> dict:
+    """Ucitaj poslednja podesavanja iz fajla"""
+    if os.path.exists(putanja):
+        try:
+            with open(putanja, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+
+def sacuvaj_podesavanja(data: dict, putanja: str = SETTINGS_FILE):
+    """Sacuvaj podesavanja u fajl"""
+    try:
+        with open(putanja, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"Greska pri cuvanju podesavanja: {e}")
+
+
+def parsiraj_ekstenzije(tekst: str) -> List[str]:
+    """Pretvori "txt, .pdf" u [".txt", ".pdf"]"""
+    ext = [e.strip() for e in (tekst or "").split(",") if e.strip()]
+    return [e if e.startswith('.') else f'.{e}' for e in ext]
+
+
+def parsiraj_foldere(tekst: str) -> List[str]:
+    return [f.strip() for f in (tekst or "").split(",") if f.strip()]
+
+
+def parsiraj_broj_niti(tekst) -> int:
+    try:
+        return max(1, int(tekst))
+    except (TypeError, ValueError):
+        return 1
+
+
+def parsiraj_velicinu_volumena(tekst) -> Optional[int]:
+    """Velicina volumena u MB -> bajtovi (None = jedan fajl)"""
+    try:
+        mb = float(tekst)
+    except (TypeError, ValueError):
+        return None
+    return int(mb * 1048576) if mb > 0 else None
+
+
+def parsiraj_prag_delte(tekst) -> Optional[int]:
+    """Prag za delta kopiranje u MB -> bajtovi (None = uvek cela kopija)"""
+    return parsiraj_velicinu_volumena(tekst)
+
+
+def parsiraj_minute(tekst) -> float:
+    try:
+        return max(0.0, float(tekst))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parsiraj_ogranicenje(tekst) -> Optional[float]:
+    """Ogranicenje brzine; prazno, nula ili neispravno = bez ogranicenja"""
+    try:
+        vrednost = float(tekst)
+    except (TypeError, ValueError):
+        return None
+    return vrednost if vrednost > 0 else None
+
+
+def parsiraj_kontrolnu_sumu(tekst) -> Optional[str]:
+    """Algoritam kontrolne sume; prazno ili "bez" = bez kontrolnih suma"""
+    tekst = (tekst or "").strip().lower()
+    return None if tekst in ("", "bez") else tekst
+
+
+def posao_iz_podesavanja(p: dict) -> dict:
+    """
+    Pretvori sacuvana podesavanja u argumente za BackupScheduler.schedule_backup
+
+    Args:
+        p: Podesavanja ucitana sa ucitaj_podesavanja
+
+    Returns:
+        Recnik argumenata (schedule_type, time_str, source_dir, ...)
+    """
+    tip = p.get("tip_rasporeda") or "dnevno"
+    return {
+        "schedule_type": TIPOVI_RASPOREDA.get(tip, tip),
+        "time_str": p.get("vreme_rasporeda") or "12:00",
+        "source_dir": p.get("izvorni_folder", ""),
+        "destination_dir": p.get("odredisni_folder", ""),
+        "include_extensions": parsiraj_ekstenzije(p.get("ukljuci_ext")),
+        "exclude_extensions": parsiraj_ekstenzije(p.get("iskljuci_ext")),
+        "exclude_dirs": parsiraj_foldere(p.get("iskljuci_foldere")),
+        "incremental": bool(p.get("inkrementalni")),
+        "workers": parsiraj_broj_niti(p.get("broj_niti")),
+        "storage": p.get("nacin_cuvanja") or "mirror",
+        "compression": p.get("kompresija") or "gz",
+        "volume_size": parsiraj_velicinu_volumena(p.get("velicina_volumena")),
+        "delta_threshold": parsiraj_prag_delte(p.get("prag_delte_mb")),
+        "cron": (p.get("cron_izraz") or "").strip() or None,
+        "jitter": parsiraj_minute(p.get("rasipanje_minuta")) * 60,
+        "max_mb_per_second": parsiraj_ogranicenje(p.get("ogranicenje_mb_s")),
+        "max_files_per_second": parsiraj_ogranicenje(p.get("ogranicenje_fajlova_s")),
+        "throttle_profile": (p.get("profil_ogranicenja") or "").strip() or None,
+        "hash_algorithm": parsiraj_kontrolnu_sumu(p.get("kontrolna_suma")),
+        "retention": (p.get("zadrzavanje") or "").strip() or None,
+        "deletions": NACINI_BRISANJA.get(p.get("brisanje_viska") or "zadrzi"),
+    }
+
+
+def poslovi_iz_podesavanja(p: dict) -> Dict[str, dict]:
+    """
+    Svi imenovani poslovi iz podesavanja
+
+    Posao iz GUI-ja (polja na vrhu fajla) dobija naziv PODRAZUMEVANI_POSAO;
+    dodatni poslovi se navode u listi "poslovi", svaki sa poljem "naziv" i
+    istim poljima kao na vrhu fajla.
+
+    Returns:
+        Recnik naziv -> argumenti za BackupScheduler.schedule_backup
+    """
+    poslovi = {}
+    if p.get("izvorni_folder") and p.get("odredisni_folder"):
+        poslovi[PODRAZUMEVANI_POSAO] = posao_iz_podesavanja(p)
+    for i, posao in enumerate(p.get("poslovi") or [], 1):
+        if posao.get("izvorni_folder") and posao.get("odredisni_folder"):
+            poslovi[posao.get("naziv") or f"posao-{i}"] = posao_iz_podesavanja(posao)
+    return poslovi
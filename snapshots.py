@@ -0,0 +1,125 @@
+"""
+Snapshots - Versioned mirror backups sharing unchanged files through hard links
+"""
+import os
+import json
+import shutil
+from datetime import datetime
+from typing import List, Optional
+
+# Marker file identifying the root of a snapshot set
+SNAPSHOT_SET_MARKER = "snapshot_set.json"
+
+# Suffix of the snapshot directory a run is writing; renamed to the bare id
+# when the run completes, so only complete snapshots are listed
+PARTIAL_SUFFIX = ".partial"
+
+SNAPSHOT_ID_FORMAT = "%Y%m%d-%H%M%S-%f"
+
+
+def is_snapshot_set(path: str) -> bool:
+    """Check if path is the root of a snapshot set"""
+    return os.path.isfile(os.path.join(path, SNAPSHOT_SET_MARKER))
+
+
+def init_snapshot_set(root: str):
+    """
+    Create snapshot set layout if it does not exist
+
+    Layout:
+        <root>/snapshot_set.json              set marker
+        <root>/<id>/...                       one full tree per completed run
+        <root>/<id>.partial/...               tree of a running or interrupted run
+    """
+    os.makedirs(root, exist_ok=True)
+    marker = os.path.join(root, SNAPSHOT_SET_MARKER)
+    if not os.path.exists(marker):
+        with open(marker, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, f)
+
+
+def list_snapshots(root: str) -> List[str]:
+    """Return ids of all complete snapshots, oldest first"""
+    if not os.path.isdir(root):
+        return []
+    snapshots = []
+    for name in os.listdir(root):
+        if name.endswith(PARTIAL_SUFFIX) or not os.path.isdir(os.path.join(root, name)):
+            continue
+        try:
+            datetime.strptime(name, SNAPSHOT_ID_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append(name)
+    return sorted(snapshots)
+
+
+def snapshot_path(root: str, snapshot_id: Optional[str] = None) -> Optional[str]:
+    """
+    Directory of a snapshot
+
+    Args:
+        root: Root of the snapshot set
+        snapshot_id: Snapshot id (None = latest)
+
+    Returns:
+        Path to the snapshot tree, or None if the set has no such snapshot
+    """
+    snapshots = list_snapshots(root)
+    if snapshot_id is None:
+        return os.path.join(root, snapshots[-1]) if snapshots else None
+    return os.path.join(root, snapshot_id) if snapshot_id in snapshots else None
+
+
+def begin_snapshot(root: str) -> str:
+    """
+    Directory the next snapshot is written to
+
+    A partial snapshot left by an interrupted run is reused, so files it
+    already holds do not have to be copied again.
+
+    Returns:
+        Path to the partial snapshot directory
+    """
+    partial = sorted(name for name in os.listdir(root) if name.endswith(PARTIAL_SUFFIX))
+    if partial:
+        for stale in partial[:-1]:
+            shutil.rmtree(os.path.join(root, stale), ignore_errors=True)
+        return os.path.join(root, partial[-1])
+    path = os.path.join(root, datetime.now().strftime(SNAPSHOT_ID_FORMAT) + PARTIAL_SUFFIX)
+    os.makedirs(path)
+    return path
+
+
+def commit_snapshot(partial_path: str) -> str:
+    """
+    Mark a partial snapshot complete
+
+    Returns:
+        Snapshot id
+    """
+    path = partial_path[:-len(PARTIAL_SUFFIX)]
+    os.replace(partial_path, path)
+    return os.path.basename(path)
+
+
+def delete_snapshot(root: str, snapshot_id: str) -> int:
+    """
+    Delete a snapshot tree
+
+    Returns:
+        Number of bytes freed; files still hard-linked from other
+        snapshots free nothing
+    """
+    path = os.path.join(root, snapshot_id)
+    freed = 0
+    for dir_path, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(dir_path, name))
+            except OSError:
+                continue
+            if st.st_nlink <= 1:
+                freed += st.st_size
+    shutil.rmtree(path)
+    return freed
@@ -0,0 +1,416 @@
+"""
+Telemetry - Structured run events, per-phase timings and histograms
+
+Every backup, restore and verification is one run. Its events are appended
+to a JSON-lines run log as they happen, and when it ends its phase timings,
+counters and histograms can be written as a Prometheus text file (e.g. for
+the node_exporter textfile collector).
+"""
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+from file_index import DEFAULT_INDEX_DIR
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+RUN_LOG_FILE = "run_log.jsonl"
+
+# Run log is rotated to RUN_LOG_FILE.1 when it grows past this size
+MAX_LOG_BYTES = 10 * 1048576
+
+# Per-file error events logged per run; the rest are only counted
+ERROR_EVENT_LIMIT = 100
+
+# Error messages kept in a result; the rest are written to an error log file
+ERROR_LIMIT = 1000
+
+# Error log files kept in the errors folder of the index directory
+ERROR_LOGS_KEPT = 20
+
+# Histogram upper bounds: file sizes in bytes (1 KB .. 4 GB) and per-file copy times in seconds
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(12))
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Result counters exported as metrics, when the result has them
+RESULT_COUNTERS = ("copied", "unchanged", "resumed", "restored", "verified", "skipped", "deleted",
+                   "total", "bytes_copied", "bytes_written", "bytes_total")
+
+# Metric name -> (type, help) of the metrics file
+METRIC_FAMILIES = {
+    "backup_run_success": ("gauge", "1 if the last run succeeded"),
+    "backup_run_timestamp_seconds": ("gauge", "Unix time the last run ended"),
+    "backup_run_seconds": ("gauge", "Duration of the last run"),
+    "backup_phase_seconds": ("gauge", "Time the last run spent in each phase"),
+    "backup_files": ("gauge", "Files of the last run by outcome"),
+    "backup_bytes": ("gauge", "Bytes of the last run by kind"),
+    "backup_errors": ("gauge", "Errors reported by the last run"),
+    "backup_file_size_bytes": ("histogram", "Sizes of files handled by the last run"),
+    "backup_file_copy_seconds": ("histogram", "Time spent on one file (copy, restore or hash check) in the last run"),
+}
+
+
+class Histogram:
+    def __init__(self, bounds: Sequence[float]):
+        """
+        Fixed-bucket histogram (not thread-safe; callers hold their own lock)
+
+        Args:
+            bounds: Ascending upper bounds of the buckets; larger values
+                are counted in an extra +Inf bucket
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if empty or in +Inf)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self) -> dict:
+        return {"bounds": list(self.bounds), "counts": self.counts, "sum": self.sum, "count": self.count}
+
+
+class ErrorList(list):
+    def __init__(self, spill_path: Optional[str] = None, metrics: Optional["RunMetrics"] = None,
+                 limit: int = ERROR_LIMIT):
+        """
+        Error messages of a run with bounded memory (thread-safe)
+
+        The first limit messages are kept in the list itself; further ones
+        are only counted and appended to spill_path, so a run failing on
+        millions of files does not hold millions of strings.
+
+        Args:
+            spill_path: File receiving messages beyond the limit (None = drop them)
+            metrics: Run logging every message as an error event (see RunMetrics.error)
+            limit: Messages kept in memory
+        """
+        super().__init__()
+        self.spill_path = spill_path
+        self.metrics = metrics
+        self.limit = limit
+        self.total = 0
+        self.spill_file = None
+        self.lock = threading.Lock()
+
+    def append(self, message: str):
+        if self.metrics is not None:
+            self.metrics.error(message)
+        with self.lock:
+            self.total += 1
+            if len(self) < self.limit:
+                super().append(message)
+                return
+            if self.spill_path is None:
+                return
+            try:
+                if self.spill_file is None:
+                    directory = os.path.dirname(self.spill_path)
+                    os.makedirs(directory, exist_ok=True)
+                    # Oldest error logs are removed, the folder never grows without bound
+                    logs = sorted(os.listdir(directory), key=lambda name: os.path.getmtime(os.path.join(directory, name)))
+                    for name in logs[:max(0, len(logs) - ERROR_LOGS_KEPT + 1)]:
+                        os.remove(os.path.join(directory, name))
+                    self.spill_file = open(self.spill_path, "a", encoding="utf-8")
+                self.spill_file.write(message + "\n")
+            except OSError:
+                self.spill_path = None
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def close(self):
+        """Close the spill file (messages appended later open it again)"""
+        with self.lock:
+            if self.spill_file is not None:
+                self.spill_file.close()
+                self.spill_file = None
+
+    def report(self, result: dict):
+        """Add "errors_total" and, if messages were spilled, "error_log" to a result"""
+        self.close()
+        result["errors_total"] = self.total
+        if self.total > len(self) and self.spill_path is not None:
+            result["error_log"] = self.spill_path
+
+
+class RunMetrics:
+    def __init__(self, operation: str, telemetry: Optional["Telemetry"] = None,
+                 labels: Optional[Dict[str, str]] = None):
+        """
+        Events, phase timings and histograms of one run
+
+        Args:
+            operation: "backup", "restore" or "verify"
+            telemetry: Where events and metrics go (None = only collected in memory)
+            labels: Extra labels of the run, e.g. {"job": "nightly"}
+        """
+        self.operation = operation
+        self.telemetry = telemetry
+        self.labels = dict(labels or {})
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.monotonic()
+        self.phases = {}
+        self.file_sizes = Histogram(SIZE_BUCKETS)
+        self.copy_seconds = Histogram(LATENCY_BUCKETS)
+        self.error_events = 0
+        self.lock = threading.Lock()
+
+    def event(self, name: str, **fields):
+        """Append an event of this run to the run log"""
+        if self.telemetry is not None:
+            self.telemetry.write_event(dict({
+                "time": datetime.now().isoformat(timespec="milliseconds"),
+                "run": self.run_id,
+                "operation": self.operation,
+                "event": name,
+            }, **self.labels, **fields))
+
+    def error(self, message: str):
+        """Log a per-file error, at most ERROR_EVENT_LIMIT per run"""
+        with self.lock:
+            self.error_events += 1
+            if self.error_events > ERROR_EVENT_LIMIT:
+                return
+        self.event("error", message=message)
+
+    def add_phase(self, phase: str, seconds: float, **fields):
+        """Add time spent in a phase (phases entered more than once accumulate)"""
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.event("phase", phase=phase, seconds=round(seconds, 6), **fields)
+
+    @contextmanager
+    def phase(self, phase: str, **fields):
+        """Time the enclosed block as a phase"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.monotonic() - start, **fields)
+
+    def summary(self, result: dict) -> dict:
+        """Run end record: outcome, counters, phase timings and histograms"""
+        record = {
+            "success": bool(result.get("success")),
+            "error": result.get("error"),
+            "seconds": round(time.monotonic() - self.started, 6),
+            "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            "counters": {key: result[key] for key in RESULT_COUNTERS
+                         if isinstance(result.get(key), int)},
+            "errors": result.get("errors_total", len(result.get("errors") or [])),
+            "file_sizes": self.file_sizes.to_dict(),
+            "copy_seconds": self.copy_seconds.to_dict(),
+        }
+        if self.copy_seconds.count:
+            record["copy_seconds_p50"] = self.copy_seconds.quantile(0.5)
+            record["copy_seconds_p99"] = self.copy_seconds.quantile(0.99)
+        return record
+
+    def finish(self, result: dict) -> dict:
+        """
+        End the run: log its summary and update the metrics file
+
+        Returns:
+            Phase timings in seconds, for the result of the operation
+        """
+        record = self.summary(result)
+        self.event("run_end", **record)
+        if self.telemetry is not None:
+            self.telemetry.write_metrics(self, record)
+        return record["phases"]
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else repr(float(bound))
+
+
+def histogram_samples(histogram: dict, labels: Dict[str, str]) -> List[str]:
+    """Prometheus samples of a Histogram.to_dict() (cumulative buckets), without the metric name"""
+    samples = []
+    cumulative = 0
+    for bound, count in zip(histogram["bounds"], histogram["counts"]):
+        cumulative += count
+        samples.append(f"_bucket{format_labels(dict(labels, le=format_bound(bound)))} {cumulative}")
+    samples.append(f"_bucket{format_labels(dict(labels, le='+Inf'))} {histogram['count']}")
+    samples.append(f"_sum{format_labels(labels)} {histogram['sum']}")
+    samples.append(f"_count{format_labels(labels)} {histogram['count']}")
+    return samples
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Hold an exclusive lock on a lock file, across processes and threads
+
+    The lock file is created if needed and left in place.
+    """
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def replace_file(path: str, content: str):
+    """Write content to a temporary file of its own and move it over path"""
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def format_metrics(last_runs: dict) -> str:
+    """Prometheus text of the last runs kept in the metrics JSON file"""
+    families = {name: [] for name in METRIC_FAMILIES}
+    for run in last_runs.values():
+        labels = run["labels"]
+        summary = run["summary"]
+        families["backup_run_success"].append(f"{format_labels(labels)} {int(summary['success'])}")
+        families["backup_run_timestamp_seconds"].append(f"{format_labels(labels)} {run['ended']}")
+        families["backup_run_seconds"].append(f"{format_labels(labels)} {summary['seconds']}")
+        for phase, seconds in summary["phases"].items():
+            families["backup_phase_seconds"].append(f"{format_labels(dict(labels, phase=phase))} {seconds}")
+        for counter, value in summary["counters"].items():
+            if counter.startswith("bytes_"):
+                families["backup_bytes"].append(f"{format_labels(dict(labels, kind=counter[6:]))} {value}")
+            else:
+                families["backup_files"].append(f"{format_labels(dict(labels, outcome=counter))} {value}")
+        families["backup_errors"].append(f"{format_labels(labels)} {summary['errors']}")
+        families["backup_file_size_bytes"].extend(histogram_samples(summary["file_sizes"], labels))
+        families["backup_file_copy_seconds"].extend(histogram_samples(summary["copy_seconds"], labels))
+
+    lines = []
+    for name, (kind, help_text) in METRIC_FAMILIES.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(name + sample for sample in families[name])
+    return "\n".join(lines) + "\n"
+
+
+class Telemetry:
+    def __init__(self, log_path: Optional[str] = None, metrics_path: Optional[str] = None):
+        """
+        Destinations of run events and metrics, shared by any number of engines
+
+        Args:
+            log_path: JSON-lines file receiving events of every run (None = no log)
+            metrics_path: Prometheus text file rewritten after every run with
+                the last run of each operation and job (None = no metrics file);
+                the runs it lists are kept in metrics_path + ".json", updated
+                under the lock file metrics_path + ".lock", so runs of other
+                processes are not lost
+        """
+        self.log_path = log_path
+        self.metrics_path = metrics_path
+        self.lock = threading.Lock()
+
+    def start(self, operation: str, labels: Optional[Dict[str, str]] = None, **fields) -> RunMetrics:
+        """Begin a run and log its start event with the given fields"""
+        metrics = RunMetrics(operation, self, labels)
+        metrics.event("run_start", **fields)
+        return metrics
+
+    def write_event(self, record: dict):
+        """Append one JSON line to the run log; logging never fails a run"""
+        if self.log_path is None:
+            return
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            try:
+                directory = os.path.dirname(self.log_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                try:
+                    if os.path.getsize(self.log_path) > MAX_LOG_BYTES:
+                        os.replace(self.log_path, self.log_path + ".1")
+                except OSError:
+                    pass
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"Error writing run log: {e}")
+
+    def load_last_runs(self) -> dict:
+        """Last run of each operation and job written to the metrics file"""
+        try:
+            with open(self.metrics_path + ".json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_metrics(self, metrics: RunMetrics, record: dict):
+        """Atomically rewrite the metrics file including the run that just ended"""
+        if self.metrics_path is None:
+            return
+        try:
+            # The file lock keeps out other processes and other Telemetry
+            # objects writing the same file
+            with self.lock, file_lock(self.metrics_path + ".lock"):
+                last_runs = self.load_last_runs()
+                key = json.dumps([metrics.operation, sorted(metrics.labels.items())])
+                last_runs[key] = {"labels": dict(metrics.labels, operation=metrics.operation),
+                                  "ended": int(time.time()), "summary": record}
+                replace_file(self.metrics_path + ".json", json.dumps(last_runs))
+                replace_file(self.metrics_path, format_metrics(last_runs))
+        except OSError as e:
+            print(f"Error writing metrics file: {e}")
+
+
+def default_telemetry(index_dir: Optional[str] = None, metrics_path: Optional[str] = None) -> Telemetry:
+    """Telemetry logging to RUN_LOG_FILE in the index directory (None = DEFAULT_INDEX_DIR)"""
+    return Telemetry(os.path.join(index_dir or DEFAULT_INDEX_DIR, RUN_LOG_FILE), metrics_path)
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from archive import ArchiveWriter, SizedReader, restore_archive, verify_archive
+
+
+def test_sized_reader_pads_missing_data(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"abc")
+    with open(path, "rb") as f:
+        reader = SizedReader(f, 8)
+        assert reader.read(5) == b"abc\0\0"
+        assert reader.read() == b"\0\0\0"
+        assert reader.read() == b""
+    assert reader.missing == 5 and reader.error is None
+
+
+@pytest.mark.parametrize("compression", ["none", "gz"])
+def test_file_shrinking_while_archived_keeps_later_entries(tmp_path, compression):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.log").write_bytes(b"x" * 300000)
+    (source / "b.txt").write_bytes(b"after")
+    archives = tmp_path / "archives"
+    archives.mkdir()
+
+    writer = ArchiveWriter(str(archives), compression, hash_algorithm="sha256")
+    gettarinfo = writer.tar.gettarinfo
+
+    def shrink_after_stat(*args, **kwargs):
+        tarinfo = gettarinfo(*args, **kwargs)
+        if tarinfo.name == "a.log":
+            os.truncate(source / "a.log", 1000)
+        return tarinfo
+
+    writer.tar.gettarinfo = shrink_after_stat
+    with pytest.raises(OSError, match="padded with zeros"):
+        writer.add(str(source / "a.log"), "a.log")
+    writer.add(str(source / "b.txt"), "b.txt")
+    info = writer.close()
+    assert info["damaged"] == ["a.log"] and info["files"] == 1
+
+    assert verify_archive(str(archives))["verified"] == 1
+    target = tmp_path / "restored"
+    result = restore_archive(str(archives), str(target))
+    assert result["restored"] == 1 and result["skipped"] == 1
+    assert (target / "b.txt").read_bytes() == b"after"
+    assert not (target / "a.log").exists()
+
+
+def test_write_error_fails_the_archive(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_bytes(b"data")
+    writer = ArchiveWriter(str(tmp_path), "none")
+
+    def broken(data):
+        raise OSError("No space left on device")
+
+    writer.tar.fileobj.write = broken
+    with pytest.raises(OSError):
+        writer.add(str(source), "a.txt")
+    with pytest.raises(OSError, match="incomplete"):
+        writer.add(str(source), "b.txt")
+    with pytest.raises(OSError, match="incomplete"):
+        writer.close()
+    writer.abort()
+
+
+def test_restore_rewrites_file_changed_within_two_seconds(tmp_path):
+    source = tmp_path / "a.txt"
+    source.write_bytes(b"archived")
+    writer = ArchiveWriter(str(tmp_path), "gz")
+    writer.add(str(source), "a.txt")
+    writer.close()
+
+    target = tmp_path / "restored"
+    assert restore_archive(str(tmp_path), str(target))["restored"] == 1
+    assert restore_archive(str(tmp_path), str(target), skip_identical=True)["unchanged"] == 1
+    restored = target / "a.txt"
+    mtime_ns = os.stat(restored).st_mtime_ns + 1000000000
+    restored.write_bytes(b"changed!")
+    os.utime(restored, ns=(mtime_ns, mtime_ns))
+    assert restore_archive(str(tmp_path), str(target), skip_identical=True)["restored"] == 1
+    assert restored.read_bytes() == b"archived"
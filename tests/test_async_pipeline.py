@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from async_pipeline import AsyncPipeline, StageLimits, parse_stage_limits
+from backup_engine import BackupEngine
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = AsyncPipeline(StageLimits(scan=2, mkdir=2, copy=4, metadata=4))
+    pipeline.start()
+    yield pipeline
+    pipeline.close()
+
+
+def test_parse_stage_limits():
+    assert parse_stage_limits("copy=32; metadata=64") == StageLimits(copy=32, metadata=64)
+    with pytest.raises(ValueError):
+        parse_stage_limits("disk=4")
+
+
+def test_writes_run_in_order_off_the_loop_thread(pipeline):
+    calls = []
+
+    def write(i):
+        calls.append((i, threading.current_thread()))
+
+    async def process(i):
+        await pipeline.write(write, i)
+
+    pipeline.run(range(50), process)
+    assert [i for i, _ in calls] == list(range(50))
+    assert {thread for _, thread in calls} == {calls[0][1]}
+    assert calls[0][1] is not pipeline.thread
+
+
+def test_backup_records_every_file(tmp_path, pipeline):
+    source = tmp_path / "source"
+    for i in range(40):
+        (source / str(i % 4)).mkdir(parents=True, exist_ok=True)
+        (source / str(i % 4) / f"{i}.txt").write_text(str(i))
+    engine = BackupEngine(index_dir=str(tmp_path / "index"))
+    destination = tmp_path / "destination"
+    result = engine.backup(str(source), str(destination), pipeline=pipeline)
+    assert result["success"] and result["copied"] == 40
+    result = engine.backup(str(source), str(destination), incremental=True, pipeline=pipeline)
+    assert result["unchanged"] == 40
+
+
+def loop_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "pipeline-loop"]
+
+
+def test_backup_leaves_a_started_pipeline_running(tmp_path, pipeline):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    loop = pipeline.loop
+    assert not pipeline.start()
+    engine = BackupEngine(index_dir=str(tmp_path / "index"))
+    assert engine.backup(str(source), str(tmp_path / "destination"), pipeline=pipeline)["success"]
+    assert pipeline.loop is loop and loop.is_running()
+    assert loop_threads() == [pipeline.thread]
+
+
+def test_backup_closes_the_pipeline_it_started(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    pipeline = AsyncPipeline()
+    engine = BackupEngine(index_dir=str(tmp_path / "index"))
+    assert engine.backup(str(source), str(tmp_path / "destination"), pipeline=pipeline)["success"]
+    assert pipeline.loop is None and loop_threads() == []
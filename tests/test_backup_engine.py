@@ -0,0 +1,57 @@
+import os
+
+import file_index
+from backup_engine import BackupEngine
+from fast_copy import DELTA_BLOCK_SIZE
+
+
+def test_cancel_reports_index_error(tmp_path, monkeypatch):
+    source = tmp_path / "source"
+    source.mkdir()
+    for i in range(5):
+        (source / f"{i}.txt").write_text(str(i))
+
+    def fail(self, complete=True):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(file_index.FileIndex, "commit", fail)
+    engine = BackupEngine(lambda *args: engine.cancel(), index_dir=str(tmp_path / "index"))
+    result = engine.backup(str(source), str(tmp_path / "destination"), incremental=True)
+    assert not result["success"] and result["error"] == "Backup cancelled by user"
+    assert list(result["errors"]) == ["Failed to update file index: disk full"]
+
+
+def test_progress_callbacks_with_and_without_bytes(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    for i in range(3):
+        (source / f"{i}.txt").write_text("x" * 10)
+
+    calls = []
+    engine = BackupEngine(lambda current, total, filename: calls.append((current, total)),
+                          index_dir=str(tmp_path / "index"))
+    assert engine.backup(str(source), str(tmp_path / "a"))["success"]
+    assert sorted(calls) == [(1, 3), (2, 3), (3, 3)]
+
+    calls = []
+    engine = BackupEngine(lambda current, total, filename, bytes_done, bytes_total: calls.append(bytes_done),
+                          index_dir=str(tmp_path / "index"))
+    assert engine.backup(str(source), str(tmp_path / "b"))["success"]
+    assert sorted(calls) == [10, 20, 30]
+
+
+def test_delta_threshold_rewrites_only_changed_blocks(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    data = bytearray(os.urandom(1024 * 1024))
+    (source / "disk.img").write_bytes(bytes(data))
+    destination = tmp_path / "destination"
+    engine = BackupEngine(index_dir=str(tmp_path / "index"))
+    assert engine.backup(str(source), str(destination), incremental=True)["copied"] == 1
+
+    data[500000:500010] = b"0123456789"
+    (source / "disk.img").write_bytes(bytes(data))
+    result = engine.backup(str(source), str(destination), incremental=True, delta_threshold=1)
+    assert result["copied"] == 1 and result["copy_methods"] == {"delta": 1}
+    assert result["bytes_written"] == DELTA_BLOCK_SIZE
+    assert (destination / "disk.img").read_bytes() == bytes(data)
@@ -0,0 +1,108 @@
+import os
+import threading
+
+import pytest
+
+import backup_engine
+from backup_engine import BackupEngine
+from fast_copy import timestamp_tolerance
+import snapshots
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return BackupEngine(index_dir=str(tmp_path / "index"))
+
+
+def rewrite(path, content, mtime_shift_ns):
+    """Replace content with the same size, mtime a moment later"""
+    mtime_ns = os.stat(path).st_mtime_ns + mtime_shift_ns
+    with open(path, "w") as f:
+        f.write(content)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_local_filesystem_has_exact_timestamps(tmp_path):
+    assert timestamp_tolerance(str(tmp_path)) == 0
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_concurrent_probes_agree(tmp_path):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(timestamp_tolerance(str(tmp_path))))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [0] * 8
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_plan_does_not_probe_destination(tmp_path, engine, monkeypatch):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    destination = tmp_path / "mirror"
+    destination.mkdir()
+    monkeypatch.setattr(backup_engine, "timestamp_tolerance", lambda directory: pytest.fail("probed"))
+    assert engine.plan(str(source), str(destination))["success"]
+
+
+def test_quick_rewrite_reaches_next_snapshot(tmp_path, engine):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("first")
+    destination = str(tmp_path / "snapshots")
+    assert engine.backup(str(source), destination, storage="snapshot")["success"]
+
+    rewrite(str(source / "a.txt"), "again", 500000000)
+    result = engine.backup(str(source), destination, storage="snapshot")
+    assert result["success"] and result["copied"] == 1
+    with open(os.path.join(snapshots.snapshot_path(destination), "a.txt")) as f:
+        assert f.read() == "again"
+
+
+def test_restore_rewrites_file_changed_within_two_seconds(tmp_path, engine):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("backup")
+    backup = str(tmp_path / "backup")
+    assert engine.backup(str(source), backup)["success"]
+
+    target = tmp_path / "restored"
+    assert engine.restore(backup, str(target))["restored"] == 1
+    rewrite(str(target / "a.txt"), "edited", 1000000000)
+    result = engine.restore(backup, str(target))
+    assert result["restored"] == 1
+    assert (target / "a.txt").read_text() == "backup"
+
+
+def test_coarse_destination_tolerates_rounding(tmp_path, engine, monkeypatch):
+    # As on FAT/exFAT, where stored mtimes are rounded to 2 s
+    monkeypatch.setattr(backup_engine, "timestamp_tolerance", lambda directory: 2000000000)
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "a.txt").write_text("same")
+    destination = tmp_path / "mirror"
+    assert engine.backup(str(source), str(destination))["success"]
+    rewrite(str(destination / "a.txt"), "same", 1000000000)
+    result = engine.backup(str(source), str(destination), incremental=True)
+    assert result["unchanged"] == 1 and result["copied"] == 0
+
+
+def test_incremental_recopies_damaged_destination(tmp_path, engine):
+    source = tmp_path / "source"
+    source.mkdir()
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (source / name).write_text(name * 10)
+    destination = tmp_path / "mirror"
+    assert engine.backup(str(source), str(destination), incremental=True)["copied"] == 3
+
+    (destination / "a.txt").unlink()
+    with open(destination / "b.txt", "r+") as f:
+        f.truncate(5)
+    result = engine.backup(str(source), str(destination), incremental=True)
+    assert result["copied"] == 2 and result["unchanged"] == 1
+    assert (destination / "a.txt").read_text() == "a.txt" * 10
+    assert (destination / "b.txt").read_text() == "b.txt" * 10
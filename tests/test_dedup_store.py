@@ -0,0 +1,87 @@
+import os
+import sys
+import random
+import hashlib
+import subprocess
+
+import pytest
+
+import dedup_store
+from dedup_store import DedupStore, chunk_boundaries
+
+# Small chunks keep the pure Python chunker fast enough for tests
+MIN, AVG, MAX = 2 * 1024, 8 * 1024, 32 * 1024
+
+
+def chunks_of(data: bytes):
+    chunks = []
+    while data:
+        cut = chunk_boundaries(data, MIN, AVG, MAX)
+        chunks.append(data[:cut])
+        data = data[cut:]
+    return chunks
+
+
+def digests(chunks):
+    return [hashlib.sha256(chunk).hexdigest() for chunk in chunks]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def chunker(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(dedup_store, "load_numpy", lambda: None)
+    elif dedup_store.load_numpy() is None:
+        pytest.skip("numpy is not installed")
+    return request.param
+
+
+def random_data(size, seed=1):
+    return random.Random(seed).randbytes(size)
+
+
+def test_chunks_cover_data_within_limits(chunker):
+    data = random_data(400 * 1024)
+    chunks = chunks_of(data)
+    assert b"".join(chunks) == data
+    assert all(MIN < len(chunk) <= MAX for chunk in chunks[:-1])
+
+
+def test_boundaries_stable_after_insert(chunker):
+    data = random_data(400 * 1024)
+    shifted = data[:100000] + b"inserted bytes" + data[100000:]
+    before = digests(chunks_of(data))
+    after = digests(chunks_of(shifted))
+    # Only the chunk holding the insertion (and at most its successor) changes
+    assert len(set(before) - set(after)) <= 2
+    assert before[-5:] == after[-5:]
+
+
+def test_numpy_and_python_find_same_boundaries(monkeypatch):
+    if dedup_store.load_numpy() is None:
+        pytest.skip("numpy is not installed")
+    data = random_data(300 * 1024, seed=7)
+    fast = chunks_of(data)
+    monkeypatch.setattr(dedup_store, "load_numpy", lambda: None)
+    assert chunks_of(data) == fast
+
+
+def test_numpy_is_imported_on_first_use():
+    code = ("import sys, backup_engine, dedup_store; assert 'numpy' not in sys.modules; "
+            "dedup_store.chunk_boundaries(bytes(2048), 16, 64, 1024); "
+            "assert (dedup_store.numpy is None) == (dedup_store.load_numpy() is None)")
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+
+def test_store_round_trip(tmp_path):
+    source = tmp_path / "file.bin"
+    source.write_bytes(random_data(3 * 1024 * 1024))
+    store = DedupStore(str(tmp_path / "store"))
+    store.init()
+    chunks, stored = store.add_file(str(source))
+    assert stored > 0
+    # The same content again is fully deduplicated
+    assert store.add_file(str(source))[1] == 0
+    target = tmp_path / "restored.bin"
+    store.restore_file({"chunks": chunks, "size": source.stat().st_size,
+                        "mtime_ns": source.stat().st_mtime_ns}, str(target))
+    assert target.read_bytes() == source.read_bytes()
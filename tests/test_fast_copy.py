@@ -0,0 +1,96 @@
+import hashlib
+import os
+
+import pytest
+
+from fast_copy import delta_copy
+
+BLOCK = 16
+
+
+@pytest.fixture
+def files(tmp_path):
+    def make(source_data, dest_data):
+        source = tmp_path / "source.bin"
+        dest = tmp_path / "dest.bin"
+        source.write_bytes(source_data)
+        dest.write_bytes(dest_data)
+        mtime_ns = 1700000000123456789
+        os.utime(source, ns=(mtime_ns, mtime_ns))
+        return str(source), str(dest)
+    return make
+
+
+def check_copy(source, dest):
+    with open(source, "rb") as f:
+        source_data = f.read()
+    with open(dest, "rb") as f:
+        assert f.read() == source_data
+    assert os.stat(dest).st_mtime_ns == os.stat(source).st_mtime_ns
+
+
+def test_identical_file_writes_nothing(files):
+    data = bytes(range(100))
+    source, dest = files(data, data)
+    assert delta_copy(source, dest, BLOCK) == 0
+    check_copy(source, dest)
+
+
+def test_change_in_the_middle_rewrites_one_block(files):
+    data = bytes(range(100))
+    changed = data[:40] + b"X" + data[41:]
+    source, dest = files(changed, data)
+    assert delta_copy(source, dest, BLOCK) == BLOCK
+    check_copy(source, dest)
+
+
+def test_grown_file_writes_new_blocks(files):
+    data = bytes(range(100))
+    source, dest = files(data + b"appended" * 5, data)
+    # The partial last block of the old copy and everything after it
+    assert delta_copy(source, dest, BLOCK) == 140 - 96
+    check_copy(source, dest)
+
+
+def test_shrunk_file_is_truncated(files):
+    data = bytes(range(100))
+    source, dest = files(data[:50], data)
+    # Every remaining block matches; only the truncation changes the copy
+    assert delta_copy(source, dest, BLOCK) == 0
+    check_copy(source, dest)
+
+
+def test_emptied_file(files):
+    source, dest = files(b"", bytes(100))
+    assert delta_copy(source, dest, BLOCK) == 0
+    check_copy(source, dest)
+
+
+def test_hasher_sees_the_whole_source(files):
+    data = os.urandom(1000)
+    source, dest = files(data, data[:500] + bytes(500))
+    hasher = hashlib.sha256()
+    delta_copy(source, dest, BLOCK, hasher=hasher)
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+    check_copy(source, dest)
+
+
+def test_interrupted_update_keeps_old_mtime(files):
+    data = bytes(range(100))
+    source, dest = files(b"Y" * 100, data)
+
+    class FailingHasher:
+        """Stops the update while the third block is read"""
+        blocks = 0
+
+        def update(self, block):
+            self.blocks += 1
+            if self.blocks == 3:
+                raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        delta_copy(source, dest, BLOCK, hasher=FailingHasher())
+    with open(dest, "rb") as f:
+        assert f.read() == b"Y" * 2 * BLOCK + data[2 * BLOCK:]
+    # Not taken for an up-to-date copy by the next run
+    assert os.stat(dest).st_mtime_ns != os.stat(source).st_mtime_ns
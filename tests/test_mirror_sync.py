@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+import mirror_sync
+from file_filter import FileFilter
+from mirror_sync import find_extraneous
+
+
+def make_tree(root, paths):
+    for path in paths:
+        full = os.path.join(str(root), *path.split("/"))
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "w") as f:
+            f.write(path)
+
+
+def extraneous(source, destination, *args, **kwargs):
+    return sorted(rel_path.replace(os.sep, "/") for rel_path, _ in
+                  find_extraneous(str(source), str(destination), *args, **kwargs))
+
+
+def test_reports_only_files_missing_from_source(tmp_path):
+    make_tree(tmp_path / "src", ["a.txt", "d/b.txt", "d/e/c.txt"])
+    make_tree(tmp_path / "dst", ["a.txt", "old.txt", "d/b.txt", "d/gone.txt", "d/e/c.txt", "x/y.txt"])
+    assert extraneous(tmp_path / "src", tmp_path / "dst") == ["d/gone.txt", "old.txt", "x/y.txt"]
+
+
+def test_names_sorting_around_the_separator(tmp_path):
+    # "a-b" < "a/b" < "a0" as strings, but a directory sorts by its own name
+    make_tree(tmp_path / "src", ["a/b", "a-b", "a0", "a/c/d"])
+    make_tree(tmp_path / "dst", ["a/b", "a-b", "a0", "a/c/d", "a/c/e", "a.b"])
+    assert extraneous(tmp_path / "src", tmp_path / "dst") == ["a.b", "a/c/e"]
+
+
+def test_sizes_are_reported(tmp_path):
+    (tmp_path / "src").mkdir()
+    make_tree(tmp_path / "dst", ["gone.txt"])
+    assert list(find_extraneous(str(tmp_path / "src"), str(tmp_path / "dst"))) == [("gone.txt", 8)]
+
+
+def test_excluded_files_are_protected(tmp_path):
+    (tmp_path / "src").mkdir()
+    make_tree(tmp_path / "dst", ["keep.log", "cache/x.txt", "gone.txt"])
+    file_filter = FileFilter(exclude_extensions=[".log"], exclude_dirs=["cache"])
+    assert extraneous(tmp_path / "src", tmp_path / "dst", file_filter) == ["gone.txt"]
+
+
+def test_backup_files_are_skipped(tmp_path):
+    (tmp_path / "src").mkdir()
+    make_tree(tmp_path / "dst", [".backup-quarantine/old.txt", "a.txt.backup-tmp", "d/.backup-quarantine"])
+    result = extraneous(tmp_path / "src", tmp_path / "dst",
+                        skip_names=frozenset([mirror_sync.QUARANTINE_DIR]), skip_suffixes=(".backup-tmp",))
+    # Skipped names only apply to the destination root
+    assert result == ["d/.backup-quarantine"]
+
+
+def test_unreadable_source_directory_stops_the_merge(tmp_path, monkeypatch):
+    make_tree(tmp_path / "src", ["a/x.txt", "b/y.txt"])
+    make_tree(tmp_path / "dst", ["a/x.txt", "b/y.txt", "c.txt"])
+    unreadable = os.path.join(str(tmp_path / "src"), "b")
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if path == unreadable:
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    monkeypatch.setattr(mirror_sync.os, "scandir", failing_scandir)
+    reported = []
+    with pytest.raises(OSError, match="Source scan incomplete"):
+        for rel_path, _ in find_extraneous(str(tmp_path / "src"), str(tmp_path / "dst")):
+            reported.append(rel_path)
+    # b/y.txt exists in the source and must never be reported
+    assert reported == []
+
+
+def test_destination_errors_are_collected(tmp_path, monkeypatch):
+    make_tree(tmp_path / "src", ["a.txt"])
+    make_tree(tmp_path / "dst", ["a.txt", "d/x.txt"])
+    unreadable = os.path.join(str(tmp_path / "dst"), "d")
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if path == unreadable:
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    monkeypatch.setattr(mirror_sync.os, "scandir", failing_scandir)
+    errors = []
+    assert extraneous(tmp_path / "src", tmp_path / "dst", errors=errors) == []
+    assert len(errors) == 1 and "Permission denied" in errors[0]
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from retention import RetentionPolicy, parse_retention, parse_timestamp, select_to_keep
+
+
+def daily_versions(start, days, hours=(12,)):
+    """Versions named like snapshot ids, several per day"""
+    versions = {}
+    for day in range(days):
+        for hour in hours:
+            created = start + timedelta(days=day, hours=hour)
+            versions[created.strftime("%Y%m%d-%H%M%S")] = created
+    return versions
+
+
+def names(*times):
+    return {t.strftime("%Y%m%d-%H%M%S") for t in times}
+
+
+def test_parse_retention():
+    assert parse_retention("daily=7, weekly=4; monthly=12") == RetentionPolicy(daily=7, weekly=4, monthly=12)
+    assert parse_retention("last=3 yearly=2") == RetentionPolicy(last=3, yearly=2)
+    assert parse_retention("").empty and parse_retention(None).empty
+
+
+@pytest.mark.parametrize("text", ["hourly=3", "daily", "daily=x", "daily=-1"])
+def test_parse_retention_rejects(text):
+    with pytest.raises(ValueError):
+        parse_retention(text)
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("20240102-030405") == datetime(2024, 1, 2, 3, 4, 5)
+    assert parse_timestamp("backup-20240102-030405-000123.tar.gz") == datetime(2024, 1, 2, 3, 4, 5, 123)
+    assert parse_timestamp("20241340-000000") is None
+    assert parse_timestamp("latest") is None
+
+
+def test_empty_policy_keeps_everything():
+    versions = daily_versions(datetime(2024, 1, 1), 5)
+    assert select_to_keep(versions, RetentionPolicy()) == set(versions)
+
+
+def test_last_keeps_newest_and_newest_is_always_kept():
+    versions = daily_versions(datetime(2024, 1, 1), 5)
+    assert select_to_keep(versions, RetentionPolicy(last=2)) == names(datetime(2024, 1, 5, 12), datetime(2024, 1, 4, 12))
+    assert select_to_keep(versions, RetentionPolicy(monthly=1)) == names(datetime(2024, 1, 5, 12))
+
+
+def test_daily_keeps_newest_of_each_day():
+    versions = daily_versions(datetime(2024, 1, 1), 4, hours=(1, 13, 22))
+    kept = select_to_keep(versions, RetentionPolicy(daily=2))
+    assert kept == names(datetime(2024, 1, 4, 22), datetime(2024, 1, 3, 22))
+
+
+def test_days_without_backups_do_not_count():
+    versions = daily_versions(datetime(2024, 1, 1), 1)
+    versions.update(daily_versions(datetime(2024, 1, 10), 1))
+    kept = select_to_keep(versions, RetentionPolicy(daily=2))
+    assert kept == set(versions)
+
+
+def test_weekly_uses_iso_weeks():
+    # 2024-01-07 is a Sunday, 2024-01-08 a Monday
+    versions = daily_versions(datetime(2024, 1, 5), 5)
+    kept = select_to_keep(versions, RetentionPolicy(weekly=2))
+    assert kept == names(datetime(2024, 1, 9, 12), datetime(2024, 1, 7, 12))
+
+
+def test_rules_combine():
+    versions = daily_versions(datetime(2023, 11, 1), 90)
+    kept = select_to_keep(versions, RetentionPolicy(daily=3, monthly=3))
+    assert kept == names(datetime(2024, 1, 29, 12), datetime(2024, 1, 28, 12), datetime(2024, 1, 27, 12),
+                         datetime(2023, 12, 31, 12), datetime(2023, 11, 30, 12))
@@ -0,0 +1,33 @@
+import os
+import threading
+
+from run_history import RunHistory, fit_rates
+
+
+def test_fit_rates_separates_bytes_and_files():
+    runs = [{"bytes": 1000, "files": 10, "seconds": 2.0},
+            {"bytes": 3000, "files": 10, "seconds": 4.0}]
+    per_byte, per_file = fit_rates(runs)
+    assert abs(per_byte - 0.001) < 1e-9 and abs(per_file - 0.1) < 1e-9
+
+
+def test_concurrent_engines_keep_every_run(tmp_path):
+    index_dir = str(tmp_path)
+    errors = []
+
+    def record(i):
+        try:
+            # Each scheduler engine has its own RunHistory
+            RunHistory(index_dir).record(f"/source/{i}", "/destination", "mirror", i, i * 100, 1.0)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=record, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(RunHistory(index_dir).load()) == 16
+    assert os.listdir(index_dir) == ["run_history.json"]
@@ -0,0 +1,118 @@
+from datetime import datetime
+
+import pytest
+
+import scheduler
+from scheduler import BackupScheduler, CronSchedule, cron_from_schedule, parse_cron_field
+
+
+def test_parse_cron_field():
+    assert parse_cron_field("*/15", 0, 59) == {0, 15, 30, 45}
+    assert parse_cron_field("1-5,10", 0, 59) == {1, 2, 3, 4, 5, 10}
+    assert parse_cron_field("50/5", 0, 59) == {50, 55}
+    assert parse_cron_field("mon-wed", 0, 7, scheduler.WEEKDAY_NAMES) == {1, 2, 3}
+
+
+@pytest.mark.parametrize("text", ["60", "5-1", "*/0", "x", "1-"])
+def test_parse_cron_field_rejects(text):
+    with pytest.raises(ValueError):
+        parse_cron_field(text, 0, 59)
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "0 24 * * *", "0 0 0 * *", "0 0 * 13 *", "0 0 * * 8"])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_next_fire_is_strictly_after():
+    cron = CronSchedule("30 2 * * *")
+    assert cron.next_fire(datetime(2024, 5, 1, 2, 29, 59)) == datetime(2024, 5, 1, 2, 30)
+    assert cron.next_fire(datetime(2024, 5, 1, 2, 30)) == datetime(2024, 5, 2, 2, 30)
+
+
+def test_sunday_is_zero_and_seven():
+    # 2024-05-05 is a Sunday
+    assert CronSchedule("0 9 * * 0").next_fire(datetime(2024, 5, 1)) == datetime(2024, 5, 5, 9, 0)
+    assert CronSchedule("0 9 * * 7").next_fire(datetime(2024, 5, 1)) == datetime(2024, 5, 5, 9, 0)
+    assert CronSchedule("0 9 * * sun").next_fire(datetime(2024, 5, 1)) == datetime(2024, 5, 5, 9, 0)
+
+
+def test_day_of_month_or_day_of_week():
+    # Both restricted: the 13th or any Friday; 2024-09-06 is a Friday
+    cron = CronSchedule("0 0 13 * fri")
+    assert cron.next_fire(datetime(2024, 9, 1)) == datetime(2024, 9, 6)
+    assert cron.next_fire(datetime(2024, 9, 10)) == datetime(2024, 9, 13)
+    assert cron.next_fire(datetime(2024, 9, 13)) == datetime(2024, 9, 20)
+    # Only one restricted: both must match
+    assert CronSchedule("0 0 13 * *").next_fire(datetime(2024, 9, 1)) == datetime(2024, 9, 13)
+    assert CronSchedule("0 0 * * fri").next_fire(datetime(2024, 9, 7)) == datetime(2024, 9, 13)
+    assert CronSchedule("0 0 13 * fri").matches_day(datetime(2024, 12, 13))
+
+
+def test_stepped_star_is_unrestricted_like_cron():
+    # "*/2" counts as "*": odd days of the month that are also Mondays
+    cron = CronSchedule("0 3 */2 * 1")
+    assert cron.next_fire(datetime(2024, 9, 1)) == datetime(2024, 9, 9, 3, 0)
+    assert not cron.matches_day(datetime(2024, 9, 3))
+    assert not cron.matches_day(datetime(2024, 9, 2))
+
+
+def test_rare_and_impossible_dates():
+    assert CronSchedule("0 12 29 2 *").next_fire(datetime(2025, 1, 1)) == datetime(2028, 2, 29, 12, 0)
+    with pytest.raises(ValueError):
+        CronSchedule("0 0 31 2 *").next_fire(datetime(2024, 1, 1))
+
+
+def test_cron_from_schedule():
+    assert cron_from_schedule("daily", "02:30") == "30 2 * * *"
+    assert cron_from_schedule("weekly", "23:05") == "5 23 * * mon"
+    assert cron_from_schedule("monthly", "00:00") == "0 0 1 * *"
+    with pytest.raises(ValueError):
+        cron_from_schedule("daily", "24:00")
+
+
+class Clock(datetime):
+    """datetime whose now() is the local wall clock of the test"""
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture
+def fire_times(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, "datetime", Clock)
+    fired = []
+    monkeypatch.setattr(BackupScheduler, "submit", lambda self, name, fire_time=None: fired.append(fire_time))
+    return fired
+
+
+def run_clock(times, fire_times, tmp_path):
+    """Schedule a daily 02:30 job at the first time and poll at every other one"""
+    Clock.current = times[0]
+    backup_scheduler = BackupScheduler(state_file=None)
+    try:
+        assert backup_scheduler.schedule_backup("daily", "02:30", str(tmp_path), str(tmp_path))
+        for current in times[1:]:
+            Clock.current = current
+            backup_scheduler.run_pending()
+    finally:
+        backup_scheduler.shutdown()
+    return fire_times
+
+
+def test_spring_forward_runs_skipped_time_once(tmp_path, fire_times):
+    # Local clocks jump from 01:59 to 03:00, so 02:30 never appears
+    times = [datetime(2024, 3, 30, 12, 0), datetime(2024, 3, 31, 1, 59),
+             datetime(2024, 3, 31, 3, 0), datetime(2024, 3, 31, 3, 1), datetime(2024, 3, 31, 12, 0)]
+    assert run_clock(times, fire_times, tmp_path) == [datetime(2024, 3, 31, 2, 30)]
+
+
+def test_fall_back_runs_repeated_time_once(tmp_path, fire_times):
+    # Local clocks run 02:00-02:59 twice
+    times = [datetime(2024, 10, 26, 12, 0), datetime(2024, 10, 27, 2, 29), datetime(2024, 10, 27, 2, 30),
+             datetime(2024, 10, 27, 2, 59), datetime(2024, 10, 27, 2, 0, fold=1),
+             datetime(2024, 10, 27, 2, 30, fold=1), datetime(2024, 10, 27, 3, 0)]
+    assert run_clock(times, fire_times, tmp_path) == [datetime(2024, 10, 27, 2, 30)]
@@ -0,0 +1,29 @@
+import backup_cli
+from settings import posao_iz_podesavanja, poslovi_iz_podesavanja
+
+PODESAVANJA = {"izvorni_folder": "/podaci", "odredisni_folder": "/backup", "inkrementalni": True,
+               "prag_delte_mb": "64", "zadrzavanje": ""}
+
+
+def test_job_from_settings():
+    posao = posao_iz_podesavanja(PODESAVANJA)
+    assert posao["delta_threshold"] == 64 * 1048576
+    assert posao["incremental"] and posao["storage"] == "mirror" and posao["time_str"] == "12:00"
+    assert posao_iz_podesavanja({})["delta_threshold"] is None
+
+
+def test_named_jobs_need_both_folders():
+    podesavanja = dict(PODESAVANJA, poslovi=[{"naziv": "noćni", "izvorni_folder": "/a", "odredisni_folder": "/b"},
+                                             {"izvorni_folder": "/samo-izvor"}])
+    assert sorted(poslovi_iz_podesavanja(podesavanja)) == ["default", "noćni"]
+
+
+def test_run_job_passes_delta_threshold():
+    class Engine:
+        def backup(self, **kwargs):
+            self.kwargs = kwargs
+            return {"success": True}
+
+    engine = Engine()
+    backup_cli.run_job(engine, posao_iz_podesavanja(PODESAVANJA))
+    assert engine.kwargs["delta_threshold"] == 64 * 1048576
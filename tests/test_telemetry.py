@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+from telemetry import ErrorList, Telemetry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WRITER = """
+import sys
+from telemetry import Telemetry
+telemetry = Telemetry(None, sys.argv[1])
+for i in range(10):
+    telemetry.start("backup", {"job": f"{sys.argv[2]}-{i}"}).finish({"success": True, "copied": i})
+"""
+
+
+def test_metrics_file_lists_last_run_per_job(tmp_path):
+    path = str(tmp_path / "backup.prom")
+    telemetry = Telemetry(None, path)
+    for copied in (1, 2):
+        telemetry.start("backup", {"job": "nightly"}).finish({"success": True, "copied": copied})
+    with open(path) as f:
+        text = f.read()
+    assert 'backup_files{job="nightly",operation="backup",outcome="copied"} 2' in text
+    assert sorted(os.listdir(str(tmp_path))) == ["backup.prom", "backup.prom.json", "backup.prom.lock"]
+
+
+def test_processes_keep_each_others_runs(tmp_path):
+    path = str(tmp_path / "backup.prom")
+    writers = [subprocess.Popen([sys.executable, "-c", WRITER, path, str(n)], cwd=ROOT) for n in range(4)]
+    assert [writer.wait() for writer in writers] == [0] * 4
+    with open(path + ".json") as f:
+        assert len(json.load(f)) == 40
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")]
+
+
+def test_error_list_spills_beyond_limit(tmp_path):
+    errors = ErrorList(str(tmp_path / "errors.log"), limit=2)
+    for i in range(5):
+        errors.append(f"error {i}")
+    result = {}
+    errors.report(result)
+    assert list(errors) == ["error 0", "error 1"] and result["errors_total"] == 5
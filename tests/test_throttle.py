@@ -0,0 +1,61 @@
+import os
+import time
+import hashlib
+
+from fast_copy import copy_file
+from throttle import Throttle, parse_profile
+
+
+def make_files(directory, count, size):
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"f{i}.bin")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def test_buffered_copy_matches_byte_limit(tmp_path):
+    # Hashing forces the buffered path (the only one on Windows)
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    size = 400 * 1024
+    paths = make_files(str(src), 10, size)
+    throttle = Throttle(mb_per_second=2)
+
+    start = time.monotonic()
+    for path in paths:
+        copy_file(path, os.path.join(str(dst), os.path.basename(path)), throttle, hashlib.sha256())
+    elapsed = time.monotonic() - start
+
+    # Effective throughput is the configured one, not a fraction of it
+    rate = len(paths) * size / elapsed / 1048576
+    assert 1.7 < rate < 2.3
+
+
+def test_unlimited_throttle_does_not_wait(tmp_path):
+    paths = make_files(str(tmp_path), 5, 64 * 1024)
+    throttle = Throttle()
+    start = time.monotonic()
+    for path in paths:
+        copy_file(path, path + ".copy", throttle, hashlib.sha256())
+    assert time.monotonic() - start < 1.0
+
+
+def test_file_limit():
+    throttle = Throttle(files_per_second=20)
+    start = time.monotonic()
+    for _ in range(30):
+        throttle.consume_file()
+    # The bucket starts empty
+    assert 1.3 < time.monotonic() - start < 1.8
+
+
+def test_parse_profile():
+    windows = parse_profile("08:00-18:00=20; 18:00-22:00=/200")
+    assert len(windows) == 2
+    assert windows[0].mb_per_second == 20 and windows[0].files_per_second is None
+    assert windows[1].mb_per_second is None and windows[1].files_per_second == 200
@@ -0,0 +1,199 @@
+"""
+Throttle - Token bucket rate limits for bytes and files, with a time-of-day profile
+"""
+import time
+import threading
+from datetime import datetime
+from datetime import time as day_time
+from typing import List, NamedTuple, Optional, Tuple
+
+# How often the time-of-day profile is re-evaluated (seconds)
+PROFILE_CHECK_INTERVAL = 1.0
+
+
+class ThrottleWindow(NamedTuple):
+    """Limits applied between start and end (the window may wrap past midnight)"""
+    start: day_time
+    end: day_time
+    mb_per_second: Optional[float]      # None = no byte limit in this window
+    files_per_second: Optional[float]   # None = no file limit in this window
+
+    def contains(self, moment: day_time) -> bool:
+        if self.start <= self.end:
+            return self.start <= moment < self.end
+        return moment >= self.start or moment < self.end
+
+
+def parse_profile(text: str) -> List[ThrottleWindow]:
+    """
+    Parse a time-of-day profile like "08:00-18:00=20; 18:00-23:00=50/200"
+
+    Every entry is "HH:MM-HH:MM=MB_PER_SECOND[/FILES_PER_SECOND]"; an empty
+    value means no limit (e.g. "08:00-18:00=/100" limits only files).
+
+    Raises:
+        ValueError: If the text is not a valid profile
+    """
+    windows = []
+    for item in (text or "").replace(",", ";").split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            span, limits = item.split("=", 1)
+            start, end = (datetime.strptime(t.strip(), "%H:%M").time() for t in span.split("-", 1))
+            mb_text, _, files_text = limits.partition("/")
+            windows.append(ThrottleWindow(
+                start, end,
+                float(mb_text) if mb_text.strip() else None,
+                float(files_text) if files_text.strip() else None
+            ))
+        except ValueError:
+            raise ValueError(f"Invalid throttle profile entry (expected HH:MM-HH:MM=MB[/FILES]): {item}")
+    return windows
+
+
+class TokenBucket:
+    def __init__(self, rate: Optional[float] = None):
+        """
+        Token bucket refilled at rate tokens per second, holding at most one
+        second worth of tokens
+
+        Consuming more tokens than available puts the bucket into debt; the
+        caller waits until the debt is paid back, so a large request is
+        allowed through at once and the following ones are delayed.
+
+        Args:
+            rate: Tokens per second (None = unlimited)
+        """
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = rate or 0.0
+        self.last = time.monotonic()
+
+    def set_rate(self, rate: Optional[float]):
+        """Change the rate, keeping tokens already earned"""
+        with self.lock:
+            self.refill(time.monotonic())
+            self.rate = rate
+            if rate:
+                self.tokens = min(self.tokens, rate)
+
+    def refill(self, now: float):
+        """Add tokens earned since the last call (lock must be held)"""
+        if self.rate:
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take tokens from the bucket
+
+        Returns:
+            Seconds the caller has to wait before using them (0 = right away)
+        """
+        with self.lock:
+            if not self.rate:
+                return 0.0
+            self.refill(time.monotonic())
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class Throttle:
+    def __init__(self, mb_per_second: Optional[float] = None,
+                 files_per_second: Optional[float] = None,
+                 profile: Optional[List[ThrottleWindow]] = None):
+        """
+        Rate limits shared by all copy workers of a backup run
+
+        Args:
+            mb_per_second: Byte limit outside profile windows (None = unlimited)
+            files_per_second: File limit outside profile windows (None = unlimited)
+            profile: Windows with their own limits, e.g. 20 MB/s during office
+                hours and full speed at night (see parse_profile)
+        """
+        self.mb_per_second = mb_per_second
+        self.files_per_second = files_per_second
+        self.profile = list(profile or [])
+        self.bytes = TokenBucket()
+        self.files = TokenBucket()
+        self.stop = threading.Event()
+        self.last_check = 0.0
+        self.check_lock = threading.Lock()
+        self.refresh(force=True)
+
+    @property
+    def limits_bytes(self) -> bool:
+        """True if a byte limit may apply at some time of day"""
+        return bool(self.mb_per_second or any(w.mb_per_second for w in self.profile))
+
+    def current_limits(self, now: Optional[datetime] = None) -> Tuple[Optional[float], Optional[float]]:
+        """
+        Limits in effect at a moment
+
+        Returns:
+            Tuple (MB per second, files per second); None means unlimited
+        """
+        moment = (now or datetime.now()).time()
+        for window in self.profile:
+            if window.contains(moment):
+                return window.mb_per_second, window.files_per_second
+        return self.mb_per_second, self.files_per_second
+
+    def refresh(self, force: bool = False):
+        """Apply the profile window for the current time to the buckets"""
+        now = time.monotonic()
+        with self.check_lock:
+            if not force and now - self.last_check < PROFILE_CHECK_INTERVAL:
+                return
+            self.last_check = now
+        mb_per_second, files_per_second = self.current_limits()
+        byte_rate = mb_per_second * 1048576 if mb_per_second else None
+        if byte_rate != self.bytes.rate:
+            self.bytes.set_rate(byte_rate)
+        if (files_per_second or None) != self.files.rate:
+            self.files.set_rate(files_per_second or None)
+
+    def wait(self, seconds: float):
+        """Sleep until time is up or the throttle is cancelled"""
+        self.stop.wait(seconds)
+
+    def consume_bytes(self, amount: int):
+        """Block until amount bytes may be transferred"""
+        self.refresh()
+        delay = self.bytes.reserve(amount)
+        if delay > 0:
+            self.wait(delay)
+
+    def consume_file(self):
+        """Block until one more file may be processed"""
+        self.refresh()
+        delay = self.files.reserve(1)
+        if delay > 0:
+            self.wait(delay)
+
+    def cancel(self):
+        """Wake up all waiting workers (called when the backup is cancelled)"""
+        self.stop.set()
+
+    def reset(self):
+        """Prepare for a new run"""
+        self.stop.clear()
+        self.refresh(force=True)
+
+
+def make_throttle(mb_per_second: Optional[float] = None, files_per_second: Optional[float] = None,
+                  profile_text: Optional[str] = None) -> Optional[Throttle]:
+    """
+    Build a throttle from user settings
+
+    Returns:
+        Throttle, or None if no limit is set
+
+    Raises:
+        ValueError: If profile_text is not a valid profile
+    """
+    if not (mb_per_second or files_per_second or profile_text):
+        return None
+    return Throttle(mb_per_second, files_per_second, parse_profile(profile_text))